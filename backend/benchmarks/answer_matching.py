@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for answer checking (the submit_answer hot path).
+
+Compares the original check_answer (lowercase + SequenceMatcher on every
+call) with services.answer_matching using precomputed answer forms, and
+verifies both give the same verdict on every pair.
+
+Run from the backend directory:
+    python benchmarks/answer_matching.py [pairs]
+"""
+import os
+import random
+import string
+import sys
+import timeit
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from challenges.services.answer_matching import answers_match, compact, normalize  # noqa: E402
+
+
+def legacy_check_answer(correct_answer, user_answer):
+    """check_answer as it was, minus the debug prints"""
+    correct = correct_answer.lower().strip()
+    user = user_answer.lower().strip()
+    if correct == user:
+        return True
+    if correct.replace(" ", "") == user.replace(" ", ""):
+        return True
+    return SequenceMatcher(None, correct, user).ratio() >= 0.80
+
+
+WORDS = (
+    "love shape body baby tonight heart fire dancing forever lights city dreams "
+    "never gonna give you up wondering after all these years hello it's me"
+).split()
+
+
+def typo(text, rng):
+    if not text:
+        return text
+    i = rng.randrange(len(text))
+    op = rng.choice('dis')
+    if op == 'd':
+        return text[:i] + text[i + 1:]
+    if op == 'i':
+        return text[:i] + rng.choice(string.ascii_lowercase) + text[i:]
+    return text[:i] + rng.choice(string.ascii_lowercase) + text[i + 1:]
+
+
+def make_pairs(count, seed=1234):
+    """Mix of exact, re-cased, spaced, typo'd and unrelated submissions"""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        answer = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        kind = rng.random()
+        if kind < 0.3:
+            submitted = answer
+        elif kind < 0.4:
+            submitted = f"  {answer.upper()} "
+        elif kind < 0.5:
+            submitted = answer.replace(' ', '')
+        elif kind < 0.75:
+            submitted = typo(typo(answer, rng), rng)
+        else:
+            submitted = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        pairs.append((answer, submitted))
+    return pairs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    pairs = make_pairs(count)
+    prepared = [(normalize(a), compact(normalize(a)), s) for a, s in pairs]
+
+    mismatches = [
+        (a, s) for (a, s), (n, c, _) in zip(pairs, prepared)
+        if legacy_check_answer(a, s) != answers_match(n, s, correct_compact=c)
+    ]
+
+    def run_legacy():
+        for a, s in pairs:
+            legacy_check_answer(a, s)
+
+    def run_new():
+        for n, c, s in prepared:
+            answers_match(n, s, correct_compact=c)
+
+    legacy = min(timeit.repeat(run_legacy, number=1, repeat=5))
+    new = min(timeit.repeat(run_new, number=1, repeat=5))
+
+    print(f"=== Answer matching benchmark ({count} checks) ===\n")
+    print(f"legacy check_answer   {legacy / count * 1e6:8.2f} us/check")
+    print(f"answers_match         {new / count * 1e6:8.2f} us/check")
+    print(f"speedup               {legacy / new:8.2f}x")
+    print(f"verdict mismatches    {len(mismatches)}")
+    if mismatches:
+        for a, s in mismatches[:10]:
+            print(f"  {a!r} vs {s!r}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark for lyrics cleaning and tokenization.
+
+Compares the original LyricsTextMixin helpers (four cleaning passes, then
+splitting the whole text again for every line list and every snippet) with
+services.lyrics_text, where one scan builds a LyricsDocument that later
+calls slice. Each synthetic song is cleaned once, as on a Genius fetch, then
+serves a number of requests: its line list plus a batch of snippets, as in
+fetch and create_batch_from_lyrics.
+
+Also checks that both give the same lines and words for artifact-free
+lyrics, and that no Genius artifact survives cleaning.
+
+Run from the backend directory:
+    python benchmarks/lyrics_text.py [songs] [requests_per_song]
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from challenges.services.lyrics_text import LyricsDocument, lyrics_document  # noqa: E402
+
+
+def legacy_clean_lyrics(lyrics):
+    """LyricsTextMixin._clean_lyrics as it was"""
+    lyrics = re.sub(r'\d+Embed$', '', lyrics)
+    lyrics = re.sub(r'Embed$', '', lyrics)
+    lyrics = lyrics.replace('You might also like', '')
+    lyrics = re.sub(r'\n\s*\n', '\n\n', lyrics)
+    return lyrics.strip()
+
+
+def legacy_split_into_lines(lyrics):
+    return [line.strip() for line in lyrics.split('\n') if line.strip()]
+
+
+def legacy_snippet(lyrics, line_index, words_to_blank=1):
+    """create_challenge_snippet as it was, down to the words it blanks"""
+    lines = legacy_split_into_lines(lyrics)
+    if line_index >= len(lines):
+        return None
+    words = lines[line_index].split()
+    start = len(words) // 3
+    return ' '.join(words[start:start + words_to_blank])
+
+
+def new_snippet(lyrics, line_index, words_to_blank=1):
+    document = lyrics_document(lyrics)
+    if document.line(line_index) is None:
+        return None
+    words = document.words(line_index)
+    start = len(words) // 3
+    return ' '.join(words[start:start + words_to_blank])
+
+
+WORDS = (
+    "love shape body baby tonight heart fire dancing forever lights city dreams "
+    "never gonna give you up wondering after all these years hello it's me "
+    "I'm in with the of we push and pull like a magnet do oh-oh"
+).split()
+
+SECTIONS = ('[Verse 1]', '[Pre-Chorus]', '[Chorus]', '[Verse 2]', '[Bridge]', '[Outro]')
+
+
+def make_song(rng, lines=60):
+    """
+    Returns: (raw lyrics as scraped from Genius, the same lyrics without artifacts)
+    """
+    body = []
+    for i in range(lines):
+        if i % 10 == 0:
+            if body:
+                body.append(rng.choice(['', '  ', '\n']))
+            body.append(rng.choice(SECTIONS))
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))
+        body.append(rng.choice(['', ' ', '\t']) + line + rng.choice(['', ' ']))
+    clean = '\n'.join(body)
+
+    raw = list(body)
+    raw[0] = f"{rng.randint(1, 999)} ContributorsTranslationsEspañolSong {rng.randint(1, 99)} Lyrics" + raw[0]
+    for _ in range(2):
+        i = rng.randrange(1, len(raw))
+        raw[i] += rng.choice(['You might also like', 'See Artist LiveGet tickets as low as $65You might also like'])
+    return '\n'.join(raw) + f"{rng.randint(1, 99)}Embed", clean
+
+
+def main():
+    songs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = random.Random(1234)
+    corpus = [make_song(rng) for _ in range(songs)]
+    size = sum(len(raw) for raw, _ in corpus)
+    batches = [[rng.randrange(0, 50) for _ in range(10)] for _ in range(songs)]
+
+    mismatches = [
+        clean for _, clean in corpus
+        if LyricsDocument(clean).lines() != legacy_split_into_lines(legacy_clean_lyrics(clean))
+        or [LyricsDocument(clean).words(i) for i in range(len(LyricsDocument(clean)))]
+        != [line.split() for line in legacy_split_into_lines(legacy_clean_lyrics(clean))]
+    ]
+    artifacts = re.compile(r'Contributors|You might also like|Get tickets|Embed')
+    leftovers = sum(1 for raw, _ in corpus if artifacts.search(lyrics_document(raw).text))
+
+    def parse_legacy():
+        for raw, _ in corpus:
+            for line in legacy_split_into_lines(legacy_clean_lyrics(raw)):
+                line.split()
+
+    def parse_new():
+        for raw, _ in corpus:
+            LyricsDocument(raw)
+
+    def serve_legacy():
+        for (raw, _), batch in zip(corpus, batches):
+            lyrics = legacy_clean_lyrics(raw)
+            for _ in range(requests):
+                legacy_split_into_lines(lyrics)
+                for line_index in batch:
+                    legacy_snippet(lyrics, line_index)
+
+    def serve_new():
+        for (raw, _), batch in zip(corpus, batches):
+            lyrics = lyrics_document(raw).text
+            for _ in range(requests):
+                lyrics_document(lyrics).lines()
+                for line_index in batch:
+                    new_snippet(lyrics, line_index)
+
+    timings = {}
+    for name, fn in (('parse_legacy', parse_legacy), ('parse_new', parse_new),
+                     ('serve_legacy', serve_legacy), ('serve_new', serve_new)):
+        timings[name] = min(timeit.repeat(fn, number=1, repeat=3))
+
+    mb = size / 1e6
+    print(f"=== Lyrics text benchmark ({songs} songs, {mb:.1f} MB, {requests} requests/song) ===\n")
+    print(f"clean + split, legacy     {mb / timings['parse_legacy']:8.2f} MB/s")
+    print(f"LyricsDocument            {mb / timings['parse_new']:8.2f} MB/s")
+    print(f"serve songs, legacy       {songs / timings['serve_legacy']:8.0f} songs/s")
+    print(f"serve songs, documents    {songs / timings['serve_new']:8.0f} songs/s")
+    print(f"speedup                   {timings['serve_legacy'] / timings['serve_new']:8.2f}x")
+    print(f"line/word mismatches      {len(mismatches)}")
+    print(f"artifacts left            {leftovers}")
+    if mismatches or leftovers:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
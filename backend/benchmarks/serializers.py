@@ -0,0 +1,109 @@
+"""
+Benchmark for the challenge list read path.
+
+Serializes the same challenges through ChallengeSerializer + JSONRenderer
+(the old way) and through challenge_rows() + FastJSONRenderer, checks that
+both produce identical bytes, and reports the time of each stage. Runs
+against a throwaway test database, nothing is written to db.sqlite3.
+
+Run from the backend directory:
+    python benchmarks/serializers.py [challenges]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('GENIUS_API_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from challenges.models import Challenge, LyricLine, Song  # noqa: E402
+from challenges.renderers import FastJSONRenderer, orjson  # noqa: E402
+from challenges.serializers import CHALLENGE_VALUES, ChallengeSerializer, challenge_rows  # noqa: E402
+from challenges.services.song_store import split_lines_with_offsets  # noqa: E402
+
+
+def populate(count):
+    creators = [User.objects.create_user(f'bench{i}') for i in range(50)]
+    songs = Song.objects.bulk_create([
+        Song(title=f'Song number {i} – “quoted” ñ', artist=f'Artist {i % 300}', lookup_key=f'bench:{i}')
+        for i in range(count)
+    ], batch_size=1000)
+    lines = LyricLine.objects.bulk_create([
+        LyricLine(song=song, index=0, text=text, word_offsets=offsets)
+        for i, song in enumerate(songs)
+        for text, offsets in split_lines_with_offsets(f"I'm in love with the shape of you {i}")
+    ], batch_size=1000)
+    Challenge.objects.bulk_create([
+        Challenge(
+            creator=creators[i % len(creators)],
+            genre='Pop',
+            line=line,
+            blank_start=5,
+            correct_answer='shape',
+        )
+        for i, line in enumerate(lines)
+    ], batch_size=1000)
+
+
+def timed(fn):
+    return min(timeit.repeat(fn, number=1, repeat=5))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        populate(count)
+        queryset = Challenge.objects.select_related('creator', 'line__song').order_by('-created_at', '-id')
+
+        # Load rows once so the stages below measure serialization only
+        instances = list(queryset)
+        rows = list(queryset.values(*CHALLENGE_VALUES))
+
+        old_data = ChallengeSerializer(instances, many=True).data
+        new_data = challenge_rows(rows)
+        old_bytes = JSONRenderer().render(old_data)
+        new_bytes = FastJSONRenderer().render(new_data)
+
+        serialize_old = timed(lambda: ChallengeSerializer(instances, many=True).data)
+        serialize_new = timed(lambda: challenge_rows(rows))
+        render_old = timed(lambda: JSONRenderer().render(old_data))
+        render_new = timed(lambda: FastJSONRenderer().render(new_data))
+        query_old = timed(lambda: list(queryset.all()))
+        query_new = timed(lambda: list(queryset.values(*CHALLENGE_VALUES)))
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    old_total = query_old + serialize_old + render_old
+    new_total = query_new + serialize_new + render_new
+
+    print(f"=== Challenge list serialization ({count} challenges) ===")
+    print(f"orjson: {'installed' if orjson else 'not installed (stdlib json fallback)'}\n")
+    print(f"{'stage':<12}{'old (ms)':>12}{'new (ms)':>12}{'speedup':>10}")
+    for name, old, new in (
+        ('query', query_old, query_new),
+        ('serialize', serialize_old, serialize_new),
+        ('render', render_old, render_new),
+        ('total', old_total, new_total),
+    ):
+        print(f"{name:<12}{old * 1000:>12.1f}{new * 1000:>12.1f}{old / new:>9.1f}x")
+
+    identical = old_bytes == new_bytes
+    print(f"\nidentical JSON ({len(old_bytes)} bytes): {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
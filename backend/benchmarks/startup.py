@@ -0,0 +1,91 @@
+"""
+Startup-time benchmark for cold workers.
+
+Measures, each in a fresh interpreter:
+  1. `manage.py check` wall time (settings, app registry, URLconf, views)
+  2. first request latency: django.setup() + URL loading + one request that
+     goes through the lyrics views without touching Genius
+  3. cost of building the lyrics services on the first lyrics request
+
+Run from the backend directory:
+    python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = r"""
+import os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+from django.conf import settings
+settings.ALLOWED_HOSTS = ['*']
+from django.test import Client
+response = Client().get('/api/lyrics/search/')
+assert response.status_code == 400, response.status_code
+print(time.perf_counter() - start)
+"""
+
+BUILD_SERVICES = r"""
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+import challenges.views
+from challenges.services.lyrics_service import get_lyrics_service
+from challenges.services.async_lyrics_service import get_async_lyrics_service
+start = time.perf_counter()
+get_lyrics_service()
+get_async_lyrics_service()
+print(time.perf_counter() - start)
+"""
+
+
+def run(args, env=None):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + args,
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, result.stdout.strip()
+
+
+def report(name, samples):
+    samples = [s * 1000 for s in samples]
+    print(
+        f"{name:<28} median {statistics.median(samples):8.1f} ms   "
+        f"min {min(samples):8.1f} ms   max {max(samples):8.1f} ms"
+    )
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # No GENIUS_API_KEY: startup must not need it
+    env = {k: v for k, v in os.environ.items() if k != 'GENIUS_API_KEY'}
+    check = [run(['manage.py', 'check'], env)[0] for _ in range(runs)]
+    first_request = [float(run(['-c', FIRST_REQUEST], env)[1]) for _ in range(runs)]
+
+    env_with_key = dict(env, GENIUS_API_KEY=os.environ.get('GENIUS_API_KEY', 'benchmark'))
+    build = [float(run(['-c', BUILD_SERVICES], env_with_key)[1]) for _ in range(runs)]
+
+    print(f"=== Startup benchmark ({runs} runs) ===\n")
+    report('manage.py check', check)
+    report('setup + first request', first_request)
+    report('lazy lyrics service build', build)
+
+
+if __name__ == '__main__':
+    main()
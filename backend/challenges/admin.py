@@ -1,19 +1,21 @@
 from django.contrib import admin
-from .models import Challenge, ChallengeAttempt
+from .models import Challenge, ChallengeAttempt, ChallengeJob, LyricLine, ScoreBucket, Song
 
 @admin.register(Challenge)
 class ChallengeAdmin(admin.ModelAdmin):
     list_display = ['song_title', 'artist', 'creator', 'genre', 'created_at']
     list_filter = ['genre', 'created_at', 'creator']
-    search_fields = ['song_title', 'artist', 'correct_answer']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['creator', 'line__song']
+    search_fields = ['line__song__title', 'line__song__artist', 'correct_answer']
+    readonly_fields = ['song_title', 'artist', 'blanked_lyric', 'created_at', 'updated_at']
+    raw_id_fields = ['line']
     
     fieldsets = (
         ('Song Information', {
             'fields': ('song_title', 'artist', 'genre')
         }),
         ('Challenge Details', {
-            'fields': ('original_lyric', 'blanked_lyric', 'correct_answer')
+            'fields': ('line', 'blank_start', 'blank_words', 'blanked_lyric', 'correct_answer')
         }),
         ('Metadata', {
             'fields': ('creator', 'created_at', 'updated_at')
@@ -22,7 +24,35 @@ class ChallengeAdmin(admin.ModelAdmin):
 
 @admin.register(ChallengeAttempt)
 class ChallengeAttemptAdmin(admin.ModelAdmin):
-    list_display = ['user', 'challenge', 'is_correct', 'hints_used', 'created_at']
+    list_display = ['user', 'challenge', 'is_correct', 'hints_used', 'score', 'created_at']
     list_filter = ['is_correct', 'created_at']
-    search_fields = ['user__username', 'challenge__song_title']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    search_fields = ['user__username', 'challenge__line__song__title']
+    readonly_fields = ['created_at']
+
+@admin.register(ChallengeJob)
+class ChallengeJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'creator', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['creator__username']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+    raw_id_fields = ['creator', 'challenge']
+
+class LyricLineInline(admin.TabularInline):
+    model = LyricLine
+    fields = ['index', 'text']
+    readonly_fields = ['index', 'text']
+    extra = 0
+    can_delete = False
+
+@admin.register(Song)
+class SongAdmin(admin.ModelAdmin):
+    list_display = ['title', 'artist', 'genius_id', 'created_at']
+    search_fields = ['title', 'artist', 'genius_id']
+    readonly_fields = ['lookup_key', 'created_at', 'updated_at']
+    inlines = [LyricLineInline]
+
+@admin.register(ScoreBucket)
+class ScoreBucketAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period', 'period_start', 'score', 'completed']
+    list_filter = ['period', 'period_start']
+    search_fields = ['user__username']
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ChallengesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'challenges'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from .services.metrics import instrument_connection
+
+        if settings.METRICS_ENABLED:
+            # Count queries and their time per view for /api/metrics
+            connection_created.connect(instrument_connection, dispatch_uid='challenges.metrics')
@@ -0,0 +1,45 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Strong ETag from the values a response is built from (ids, updated_at,
+    lyrics text, ...), so it can be checked before serializing anything
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return quote_etag(digest)
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Check If-None-Match / If-Modified-Since (and If-Match) for GET and HEAD
+    Returns: A 304 (or 412) response when the client's copy is current,
+    else None
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+
+
+def cache_headers(response, etag, last_modified=None, max_age=0, public=True):
+    """
+    Set ETag, Last-Modified and Cache-Control on a 200 or 304 response.
+    max_age 0 still lets browsers and proxies keep a copy, they just
+    revalidate it (usually getting a 304) before every use.
+    Returns: The response
+    """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    if public:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
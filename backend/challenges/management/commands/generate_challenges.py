@@ -0,0 +1,133 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from challenges.models import Challenge, LyricLine, Song
+from challenges.services.challenge_generator import CorpusStats, generate_candidates
+
+SONG_CHUNK = 500
+INSERT_BATCH = 1000
+
+_worker_corpus = None
+
+
+def _init_worker(doc_freq, total_docs):
+    """Give each worker process its own copy of the corpus statistics once"""
+    global _worker_corpus
+    _worker_corpus = CorpusStats(doc_freq, total_docs)
+
+
+def _generate_for_song(task):
+    song_id, lines, top_n = task
+    texts = [text for _, text in lines]
+    candidates = generate_candidates(texts, corpus=_worker_corpus, top_n=top_n)
+    for candidate in candidates:
+        candidate['line_id'] = lines[candidate['line_index']][0]
+    return song_id, candidates
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate fill-in-the-blank challenges for stored songs, scoring every "
+        "line and word span in a process pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--creator', help='Username the generated challenges are created by')
+        parser.add_argument('--top-n', type=int, default=3, help='Challenges per song (default 3)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--limit', type=int, help='Only process this many songs')
+        parser.add_argument('--genre', default='', help='Genre to tag challenges with')
+        parser.add_argument(
+            '--include-used', action='store_true',
+            help='Also consider lines that already have a challenge'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Print candidates, save nothing')
+
+    def handle(self, *args, **options):
+        creator = None
+        if not options['dry_run']:
+            if not options['creator']:
+                raise CommandError('--creator is required unless --dry-run is given')
+            try:
+                creator = User.objects.get(username=options['creator'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['creator']}' does not exist")
+
+        self.stdout.write('Building corpus statistics...')
+        corpus = CorpusStats.from_database()
+        self.stdout.write(f'  {corpus.total_docs} lines, {len(corpus.doc_freq)} distinct words')
+
+        song_ids = list(
+            Song.objects.filter(lines__isnull=False).distinct()
+            .order_by('id').values_list('id', flat=True)
+        )
+        if options['limit']:
+            song_ids = song_ids[:options['limit']]
+        songs = Song.objects.in_bulk(song_ids)
+
+        created = 0
+        pending = []
+        with ProcessPoolExecutor(
+            max_workers=max(1, options['workers']),
+            initializer=_init_worker,
+            initargs=(corpus.doc_freq, corpus.total_docs),
+        ) as pool:
+            for offset in range(0, len(song_ids), SONG_CHUNK):
+                tasks = self._tasks(song_ids[offset:offset + SONG_CHUNK], options)
+                for song_id, candidates in pool.map(_generate_for_song, tasks, chunksize=16):
+                    song = songs[song_id]
+                    for candidate in candidates:
+                        if options['dry_run']:
+                            self.stdout.write(
+                                f"{song} [{candidate['line_index']}] "
+                                f"{candidate['blanked_line']} -> {candidate['answer']} "
+                                f"({candidate['score']})"
+                            )
+                            continue
+                        challenge = Challenge(
+                            creator=creator,
+                            genre=options['genre'],
+                            line_id=candidate['line_id'],
+                            blank_start=candidate['start'],
+                            blank_words=candidate['words_to_blank'],
+                            correct_answer=candidate['answer'],
+                        )
+                        challenge.prepare_answer()
+                        pending.append(challenge)
+                    if len(pending) >= INSERT_BATCH:
+                        created += self._flush(pending)
+
+        created += self._flush(pending)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(song_ids)} songs, created {created} challenges'
+        ))
+
+    def _tasks(self, song_ids, options):
+        """One (song_id, [(line_id, text), ...], top_n) task per song"""
+        lines = LyricLine.objects.filter(song_id__in=song_ids)
+        used = set()
+        if not options['include_used']:
+            used = set(
+                Challenge.objects.filter(line__song_id__in=song_ids)
+                .values_list('line_id', flat=True)
+            )
+
+        by_song = {song_id: [] for song_id in song_ids}
+        for line_id, song_id, text in lines.order_by('song_id', 'index').values_list('id', 'song_id', 'text'):
+            # Used lines are blanked out rather than dropped so indices stay aligned
+            by_song[song_id].append((line_id, '' if line_id in used else text))
+
+        return [(song_id, song_lines, options['top_n']) for song_id, song_lines in by_song.items()]
+
+    def _flush(self, pending):
+        if not pending:
+            return 0
+        with transaction.atomic():
+            Challenge.objects.bulk_create(pending)
+        count = len(pending)
+        pending.clear()
+        return count
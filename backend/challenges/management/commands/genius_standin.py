@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.services.genius_standin import GeniusStandIn
+from challenges.services.lyrics_store import LyricsStore, LyricsStoreError
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the local lyrics store through the Genius API endpoints the "
+        "lyrics services use. Run the app with GENIUS_BASE_URL pointing here "
+        "to load-test or develop without the real API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--store', help='Store file (default: LYRICS_STORE_PATH)')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+        parser.add_argument(
+            '--error-rate', type=float, default=0.0,
+            help='Fraction of requests answered with a 503 (0-1)'
+        )
+        parser.add_argument('--verbose-requests', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        path = options['store'] or settings.LYRICS_STORE_PATH
+        try:
+            store = LyricsStore(path)
+        except LyricsStoreError as e:
+            raise CommandError(f"{e} (build one with `manage.py import_lyrics`)")
+
+        standin = GeniusStandIn(
+            store,
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            verbose=options['verbose_requests'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Serving {len(store)} songs from {path} at {standin.url}'
+        ))
+        self.stdout.write(f'Point the app at it with GENIUS_BASE_URL={standin.url}')
+        try:
+            standin.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            standin.shutdown()
+            store.close()
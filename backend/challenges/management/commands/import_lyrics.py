@@ -0,0 +1,122 @@
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.services.lyrics_store import (
+    LyricsStore, LyricsStoreError, LyricsStoreWriter, strip_section_headers,
+)
+
+PROGRESS_EVERY = 10000
+
+
+def open_dump(path):
+    """Text stream of an NDJSON dump: a file, a .gz file or '-' for stdin"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def song_from_record(record):
+    """
+    Store fields from one dump record. Accepts our own field names as well
+    as Genius API song objects (primary_artist, album, ...).
+    Returns: Song dictionary, or None when id, title or lyrics are missing
+    """
+    artist = record.get('artist')
+    if artist is None and isinstance(record.get('primary_artist'), dict):
+        artist = record['primary_artist'].get('name')
+    album = record.get('album')
+    if isinstance(album, dict):
+        album = album.get('name')
+
+    song = {
+        'id': record.get('id'),
+        'title': record.get('title'),
+        'artist': artist or '',
+        'album': album or 'Unknown',
+        'release_date': record.get('release_date') or record.get('release_date_for_display') or 'Unknown',
+        'thumbnail': record.get('thumbnail') or record.get('song_art_image_thumbnail_url') or '',
+        'url': record.get('url') or '',
+        'lyrics': record.get('lyrics') or '',
+    }
+    if not isinstance(song['id'], int) or not song['title'] or not song['lyrics']:
+        return None
+    song['lyrics'] = strip_section_headers(song['lyrics'])
+    return song
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream NDJSON lyric dumps (one song object per line) into the local "
+        "lyrics store used by LYRICS_PROVIDER=local and genius_standin"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dumps', nargs='+', help="NDJSON files (.gz allowed), '-' for stdin")
+        parser.add_argument('--store', help='Store file (default: LYRICS_STORE_PATH)')
+        parser.add_argument(
+            '--append', action='store_true',
+            help='Keep the songs already in the store (re-imported ids are replaced)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['store'] or settings.LYRICS_STORE_PATH
+        started = time.monotonic()
+        imported = skipped = 0
+
+        existing = None
+        if options['append'] and os.path.exists(path):
+            try:
+                existing = LyricsStore(path)
+            except LyricsStoreError as e:
+                raise CommandError(str(e))
+
+        try:
+            with LyricsStoreWriter(path) as writer:
+                if existing is not None:
+                    writer.copy_from(existing)
+                    existing.close()
+                    existing = None
+                    self.stdout.write(f'Kept {len(writer)} songs from {path}')
+
+                for dump in options['dumps']:
+                    try:
+                        stream = open_dump(dump)
+                    except OSError as e:
+                        raise CommandError(f"Cannot read {dump}: {e}")
+                    with stream:
+                        for line_number, line in enumerate(stream, 1):
+                            if not line.strip():
+                                continue
+                            try:
+                                song = song_from_record(json.loads(line))
+                            except (ValueError, AttributeError):
+                                song = None
+                            if song is None:
+                                skipped += 1
+                                if skipped <= 10:
+                                    self.stderr.write(f'{dump}:{line_number}: skipped (not a song with lyrics)')
+                                continue
+
+                            writer.add(song)
+                            imported += 1
+                            if imported % PROGRESS_EVERY == 0:
+                                self.stdout.write(f'  {imported} songs...')
+                total = len(writer)
+        finally:
+            if existing is not None:
+                existing.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} songs ({skipped} skipped) in {elapsed:.1f}s; '
+            f'{total} songs in {path} ({os.path.getsize(path) / 1e6:.1f} MB)'
+        ))
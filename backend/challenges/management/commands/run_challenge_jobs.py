@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from challenges.services.challenge_jobs import ChallengeJobQueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued challenge creation jobs (create_from_lyrics in job mode). "
+        "Use it as a dedicated worker, e.g. with CHALLENGE_JOB_WORKERS=0 on "
+        "the web servers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(settings.CHALLENGE_JOB_WORKERS, 1))
+        parser.add_argument('--once', action='store_true', help='Run the queued jobs, then exit')
+
+    def handle(self, *args, **options):
+        queue = ChallengeJobQueue(
+            workers=options['workers'],
+            poll_interval=settings.CHALLENGE_JOB_POLL_INTERVAL,
+            max_attempts=settings.CHALLENGE_JOB_MAX_ATTEMPTS,
+            retention=settings.CHALLENGE_JOB_RETENTION,
+        )
+
+        if options['once']:
+            queue.maintain()
+            count = queue.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs'))
+            return
+
+        self.stdout.write(f"Running challenge jobs with {options['workers']} workers (Ctrl-C to stop)")
+        queue.start()
+        try:
+            queue.join()
+        except KeyboardInterrupt:
+            queue.stop()
+            queue.join()
+        stats = queue.stats()
+        self.stdout.write(f"Created {stats['done']} challenges, {stats['failed']} jobs failed")
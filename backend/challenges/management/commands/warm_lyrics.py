@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from challenges.services.lyrics_service import get_lyrics_service
+from challenges.services.warmup import LyricsWarmer, WarmupScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch trending songs (top results of recent searches, songs with the "
+        "most challenges) into the lyrics cache, renewing entries close to "
+        "expiry. Run it from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.WARMUP_LIMIT, help='Songs to plan')
+        parser.add_argument(
+            '--window', type=float, default=settings.WARMUP_WINDOW,
+            help='Seconds of searches that count as recent'
+        )
+        parser.add_argument('--workers', type=int, default=settings.WARMUP_WORKERS)
+        parser.add_argument(
+            '--rate', type=float, default=settings.WARMUP_RATE,
+            help='Genius fetches per minute at most'
+        )
+        parser.add_argument(
+            '--refresh-margin', type=float, default=settings.WARMUP_REFRESH_MARGIN,
+            help='Fetch again when a cache entry has fewer seconds than this left'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Print the plan without fetching')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running, one run every --interval seconds'
+        )
+        parser.add_argument('--interval', type=float, default=settings.WARMUP_INTERVAL)
+
+    def handle(self, *args, **options):
+        warmer = LyricsWarmer(
+            get_lyrics_service(),
+            workers=options['workers'],
+            rate=options['rate'],
+            refresh_margin=options['refresh_margin'],
+            limit=options['limit'],
+            window=options['window'],
+        )
+
+        if options['dry_run']:
+            songs = warmer.plan()
+            for title, artist in songs:
+                self.stdout.write(f'{title} - {artist}' if artist else title)
+            self.stdout.write(f'{len(songs)} songs planned')
+            return
+
+        if options['loop']:
+            scheduler = WarmupScheduler(warmer, interval=options['interval'], jitter=0)
+            self.stdout.write(f"Warming lyrics every {options['interval']:.0f}s (Ctrl-C to stop)")
+            try:
+                scheduler.start().join()
+            except KeyboardInterrupt:
+                scheduler.stop()
+            return
+
+        result = warmer.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Warmed {fetched} songs in {seconds:.1f}s ({fresh} still fresh, '
+            '{not_found} not found, {failed} failed, {skipped} skipped)'.format(**result)
+        ))
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .services.metrics import SampledLog, finish_request, get_metrics, start_request
+
+request_log = SampledLog(logging.getLogger('challenges.requests'), settings.LOG_SAMPLE_RATE)
+
+
+def _view_name(request):
+    # Route names keep the label set small: unknown paths share one label
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unmatched>'
+
+
+def _record(request, response, started, stats):
+    duration = time.perf_counter() - started
+    view = _view_name(request)
+    get_metrics().record(view, request.method, response.status_code, duration, stats)
+
+    if request_log.sampled():
+        request_log.emit(
+            'request',
+            view=view,
+            method=request.method,
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 2),
+            queries=stats.queries,
+            db_ms=round(stats.db_time * 1000, 2),
+            upstream_calls=stats.upstream_calls,
+            upstream_errors=stats.upstream_errors,
+        )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Record latency, database queries and Genius calls per view for
+    /api/metrics (see services.metrics), and log a sample of requests
+    """
+    if not settings.METRICS_ENABLED:
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            stats, token = start_request()
+            try:
+                response = await get_response(request)
+            finally:
+                finish_request(token)
+            _record(request, response, started, stats)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            stats, token = start_request()
+            try:
+                response = get_response(request)
+            finally:
+                finish_request(token)
+            _record(request, response, started, stats)
+            return response
+
+    return middleware
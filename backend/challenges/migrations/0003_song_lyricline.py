@@ -0,0 +1,54 @@
+# Generated by Django 5.0 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0002_lyricscacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LyricLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('word_offsets', models.JSONField(default=list)),
+            ],
+            options={
+                'ordering': ['song', 'index'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Song',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genius_id', models.BigIntegerField(blank=True, null=True, unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('artist', models.CharField(max_length=200)),
+                ('url', models.URLField(blank=True, max_length=500)),
+                ('lyrics', models.TextField(blank=True)),
+                ('lookup_key', models.CharField(db_index=True, max_length=512)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='line',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='challenges', to='challenges.lyricline'),
+        ),
+        migrations.AddField(
+            model_name='lyricline',
+            name='song',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='challenges.song'),
+        ),
+        migrations.AddConstraint(
+            model_name='lyricline',
+            constraint=models.UniqueConstraint(fields=('song', 'index'), name='unique_song_line_index'),
+        ),
+    ]
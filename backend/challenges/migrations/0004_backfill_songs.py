@@ -0,0 +1,95 @@
+import re
+
+from django.db import migrations
+
+WORD_RE = re.compile(r'\S+')
+
+
+def lookup_key(title, artist):
+    # Frozen copy of services.cache.search_key at the time of this migration
+    import unicodedata
+
+    def part(value):
+        value = unicodedata.normalize('NFKC', value or '').casefold()
+        return ' '.join(value.split())
+
+    return f"search:{part(title)}|{part(artist)}"
+
+
+# Challenges updated per bulk_update query
+UPDATE_CHUNK = 1000
+
+
+def backfill_songs(apps, schema_editor):
+    """
+    Existing challenges only know their own line, not the full lyrics or the
+    Genius id. Group them by (song_title, artist) into id-less Songs whose
+    lines are the distinct lyric lines those challenges used, in creation order.
+
+    The challenges are read in one pass first; songs and their lines are then
+    inserted per song and the links written with bulk_update, so reads and
+    writes on the challenges table do not interleave.
+    """
+    Challenge = apps.get_model('challenges', 'Challenge')
+    Song = apps.get_model('challenges', 'Song')
+    LyricLine = apps.get_model('challenges', 'LyricLine')
+
+    # (song_title, artist) -> {line text: index}, in first-use order
+    songs = {}
+    # (challenge pk, song key, line text)
+    links = []
+    challenges = (
+        Challenge.objects
+        .filter(line__isnull=True)
+        .order_by('created_at', 'id')
+        .values_list('id', 'song_title', 'artist', 'original_lyric')
+    )
+    for pk, title, artist, lyric in challenges.iterator(chunk_size=1000):
+        song_key = (title, artist)
+        text = lyric.strip()
+        lines = songs.setdefault(song_key, {})
+        lines.setdefault(text, len(lines))
+        links.append((pk, song_key, text))
+
+    line_ids = {}
+    for (title, artist), lines in songs.items():
+        song = Song.objects.create(
+            title=title,
+            artist=artist,
+            lookup_key=lookup_key(title, artist),
+            lyrics='\n'.join(lines),
+        )
+        LyricLine.objects.bulk_create([
+            LyricLine(
+                song=song,
+                index=index,
+                text=text,
+                word_offsets=[[m.start(), m.end()] for m in WORD_RE.finditer(text)],
+            )
+            for text, index in lines.items()
+        ])
+        # Not every backend returns the ids of bulk-inserted rows
+        for index, line_id in LyricLine.objects.filter(song=song).values_list('index', 'id'):
+            line_ids[(title, artist, index)] = line_id
+
+    for offset in range(0, len(links), UPDATE_CHUNK):
+        Challenge.objects.bulk_update([
+            Challenge(pk=pk, line_id=line_ids[song_key + (songs[song_key][text],)])
+            for pk, song_key, text in links[offset:offset + UPDATE_CHUNK]
+        ], ['line'])
+
+
+def unlink_backfilled_songs(apps, schema_editor):
+    Song = apps.get_model('challenges', 'Song')
+    Song.objects.filter(genius_id__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0003_song_lyricline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_songs, unlink_backfilled_songs),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+def fill_answer_forms(apps, schema_editor):
+    # Same as services.answer_matching.normalize / compact
+    Challenge = apps.get_model('challenges', 'Challenge')
+    batch = []
+    for challenge in Challenge.objects.only('id', 'correct_answer').iterator(chunk_size=1000):
+        challenge.answer_normalized = challenge.correct_answer.lower().strip()
+        challenge.answer_compact = challenge.answer_normalized.replace(' ', '')
+        batch.append(challenge)
+        if len(batch) >= 1000:
+            Challenge.objects.bulk_update(batch, ['answer_normalized', 'answer_compact'])
+            batch = []
+    if batch:
+        Challenge.objects.bulk_update(batch, ['answer_normalized', 'answer_compact'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0004_backfill_songs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='answer_compact',
+            field=models.CharField(blank=True, editable=False, max_length=400),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='answer_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=400),
+        ),
+        migrations.RunPython(fill_answer_forms, migrations.RunPython.noop),
+    ]
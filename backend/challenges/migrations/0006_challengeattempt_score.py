@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0005_challenge_answer_forms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengeattempt',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-18 20:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0007_scorebucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['-created_at', '-id'], name='challenge_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['creator', '-created_at', '-id'], name='challenge_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['genre', '-created_at'], name='challenge_genre_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challengeattempt',
+            index=models.Index(fields=['user', 'challenge'], name='attempt_user_challenge_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challengeattempt',
+            index=models.Index(fields=['challenge', 'is_correct'], name='attempt_challenge_correct_idx'),
+        ),
+    ]
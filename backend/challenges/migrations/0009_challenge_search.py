@@ -0,0 +1,87 @@
+from django.db import migrations
+
+# External-content FTS5 index over Challenge, kept in sync by triggers.
+# Only created on SQLite builds with FTS5; elsewhere the search service falls
+# back to LIKE queries.
+#
+# SQLite cannot alter most columns in place, so Django rebuilds the table
+# instead (DatabaseSchemaEditor._remake_table), which silently drops these
+# triggers. Any later migration that alters challenges_challenge must drop
+# the index first and create it again afterwards (0011 and 0012 do), or
+# search stops seeing new and changed challenges.
+
+FTS_TABLE = 'challenges_challenge_fts'
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        song_title, artist, original_lyric, genre,
+        content='challenges_challenge', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_insert AFTER INSERT ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        VALUES (new.id, new.song_title, new.artist, new.original_lyric, new.genre);
+    END
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_delete AFTER DELETE ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        VALUES ('delete', old.id, old.song_title, old.artist, old.original_lyric, old.genre);
+    END
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_update
+    AFTER UPDATE OF song_title, artist, original_lyric, genre ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        VALUES ('delete', old.id, old.song_title, old.artist, old.original_lyric, old.genre);
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        VALUES (new.id, new.song_title, new.artist, new.original_lyric, new.genre);
+    END
+    """,
+    # Index the challenges that already exist
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS challenges_challenge_fts_insert",
+    "DROP TRIGGER IF EXISTS challenges_challenge_fts_delete",
+    "DROP TRIGGER IF EXISTS challenges_challenge_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not has_fts5(cursor):
+            return
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0008_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
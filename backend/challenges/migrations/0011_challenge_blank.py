@@ -0,0 +1,192 @@
+import importlib
+import re
+
+from django.db import migrations, models
+
+WORD_RE = re.compile(r'\S+')
+BLANK_RE = re.compile(r'_{2,}')
+
+# Challenges updated per bulk_update query
+UPDATE_CHUNK = 1000
+
+# The search index of 0009 reads the text columns this migration replaces;
+# 0012 builds a new one once they are gone
+search_0009 = importlib.import_module('challenges.migrations.0009_challenge_search')
+
+
+def lookup_key(title, artist):
+    # Frozen copy of services.cache.search_key at the time of this migration
+    import unicodedata
+
+    def part(value):
+        value = unicodedata.normalize('NFKC', value or '').casefold()
+        return ' '.join(value.split())
+
+    return f"search:{part(title)}|{part(artist)}"
+
+
+def locate_blank(words, blanked_lyric, answer):
+    """
+    Where blanked_lyric (or failing that, the answer) sits in a line's words.
+    A challenge now blanks one run of words, so blanks with words between
+    them ("my ____ I ____ her") become one run covering those words too.
+    Returns: (blank start, blank word count), or None
+    """
+    blanked = blanked_lyric.split()
+    blanks = [i for i, word in enumerate(blanked) if BLANK_RE.fullmatch(word)]
+    if blanks:
+        start, end = blanks[0], blanks[-1] + 1
+        after = len(blanked) - end
+        count = len(words) - start - after
+        if count > 0 and blanked[:start] == words[:start] and blanked[end:] == words[len(words) - after:]:
+            return start, count
+
+    answer_words = answer.split()
+    for start in range(len(words) - len(answer_words) + 1):
+        if answer_words and words[start:start + len(answer_words)] == answer_words:
+            return start, len(answer_words)
+    return None
+
+
+def unblank(blanked_lyric, answer):
+    # Frozen copy of services.challenge_generator.unblank
+    words = blanked_lyric.split()
+    answer_words = answer.split()
+    start = next((i for i, word in enumerate(words) if BLANK_RE.fullmatch(word)), None)
+    if start is None or not answer_words:
+        return None
+    end = start
+    while end < len(words) and BLANK_RE.fullmatch(words[end]):
+        end += 1
+    return ' '.join(words[:start] + answer_words + words[end:]), start, len(answer_words)
+
+
+def link_challenges(apps, schema_editor):
+    """
+    Give every challenge a line and the position of its blank in it.
+
+    Challenges already linked (by 0004 or since) keep their line when their
+    blanked lyric matches it. The others (typed in by hand, or made from
+    lyrics without a Genius id) get a line under the id-less Song of their
+    title and artist, as services.song_store.loose_line does: their original
+    lyric, or their blanked lyric with the answer put back when they have
+    none. Everything is read first and written in bulk afterwards.
+    """
+    Challenge = apps.get_model('challenges', 'Challenge')
+    Song = apps.get_model('challenges', 'Song')
+    LyricLine = apps.get_model('challenges', 'LyricLine')
+
+    # (challenge pk, line id or (title, artist, text), blank start, blank words)
+    links = []
+    rows = (
+        Challenge.objects
+        .order_by('id')
+        .values_list(
+            'id', 'song_title', 'artist', 'original_lyric', 'blanked_lyric', 'correct_answer',
+            'line_id', 'line__text',
+        )
+    )
+    for pk, title, artist, original, blanked, answer, line_id, line_text in rows.iterator(chunk_size=1000):
+        if line_id is not None:
+            blank = locate_blank(line_text.split(), blanked, answer)
+            if blank is not None:
+                links.append((pk, line_id) + blank)
+                continue
+
+        text = ' '.join(original.split())
+        blank = locate_blank(text.split(), blanked, answer) if text else None
+        if blank is None:
+            restored = unblank(blanked, answer)
+            if restored is not None:
+                text, *blank = restored
+            else:
+                # No blank to find: the challenge shows its whole line
+                text, blank = text or ' '.join(blanked.split()), (0, 0)
+        links.append((pk, (title, artist, text)) + tuple(blank))
+
+    # lookup key -> (Song, {line text: line id}, [new LyricLine, ...])
+    songs = {}
+    for _, line, _, _ in links:
+        if isinstance(line, int):
+            continue
+        title, artist, text = line
+        key = lookup_key(title, artist)
+        if key not in songs:
+            song = Song.objects.filter(lookup_key=key, genius_id__isnull=True).order_by('id').first()
+            if song is None:
+                song = Song.objects.create(title=title, artist=artist, lookup_key=key)
+            texts = dict(LyricLine.objects.filter(song=song).values_list('text', 'id'))
+            songs[key] = (song, texts, [])
+        song, texts, new = songs[key]
+        if text not in texts and text not in {line.text for line in new}:
+            new.append(LyricLine(
+                song=song, text=text,
+                word_offsets=[[m.start(), m.end()] for m in WORD_RE.finditer(text)],
+            ))
+
+    for song, texts, new in songs.values():
+        if not new:
+            continue
+        last = LyricLine.objects.filter(song=song).aggregate(last=models.Max('index'))['last']
+        for index, line in enumerate(new, start=0 if last is None else last + 1):
+            line.index = index
+        LyricLine.objects.bulk_create(new)
+        # Not every backend returns the ids of bulk-inserted rows
+        texts.update(LyricLine.objects.filter(song=song).values_list('text', 'id'))
+        song.lyrics = '\n'.join(filter(None, [song.lyrics] + [line.text for line in new]))
+        song.save(update_fields=['lyrics'])
+
+    def line_id(line):
+        if isinstance(line, int):
+            return line
+        title, artist, text = line
+        return songs[lookup_key(title, artist)][1][text]
+
+    for offset in range(0, len(links), UPDATE_CHUNK):
+        Challenge.objects.bulk_update([
+            Challenge(pk=pk, line_id=line_id(line), blank_start=start, blank_words=count)
+            for pk, line, start, count in links[offset:offset + UPDATE_CHUNK]
+        ], ['line', 'blank_start', 'blank_words'])
+
+
+def restore_text(apps, schema_editor):
+    """Copy the text columns back from each challenge's line and song"""
+    Challenge = apps.get_model('challenges', 'Challenge')
+
+    challenges = Challenge.objects.filter(line__isnull=False).select_related('line__song').order_by('id')
+    batch = []
+    for challenge in challenges.iterator(chunk_size=UPDATE_CHUNK):
+        line = challenge.line
+        words = [line.text[start:end] for start, end in line.word_offsets]
+        blank = range(challenge.blank_start, challenge.blank_start + challenge.blank_words)
+        challenge.song_title = line.song.title
+        challenge.artist = line.song.artist
+        challenge.original_lyric = line.text
+        challenge.blanked_lyric = ' '.join('____' if i in blank else word for i, word in enumerate(words))
+        batch.append(challenge)
+        if len(batch) >= UPDATE_CHUNK:
+            Challenge.objects.bulk_update(batch, ['song_title', 'artist', 'original_lyric', 'blanked_lyric'])
+            batch = []
+    Challenge.objects.bulk_update(batch, ['song_title', 'artist', 'original_lyric', 'blanked_lyric'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0010_challengejob'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_0009.drop_fts, search_0009.create_fts),
+        migrations.AddField(
+            model_name='challenge',
+            name='blank_start',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='blank_words',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(link_challenges, restore_text),
+    ]
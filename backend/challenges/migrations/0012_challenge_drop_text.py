@@ -0,0 +1,188 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# FTS5 index over challenges, as in 0009, now reading song title, artist and
+# lyric from the challenge's line and song through a view. Triggers on all
+# three tables keep it in sync.
+#
+# SQLite cannot alter most columns in place, so Django rebuilds the table
+# instead (DatabaseSchemaEditor._remake_table), which silently drops its
+# triggers. A later migration that alters challenges_challenge,
+# challenges_lyricline or challenges_song must drop this index first and
+# create it again afterwards (see how 0011 and this migration do it), or
+# search stops seeing new and changed challenges.
+
+FTS_TABLE = 'challenges_challenge_fts'
+SEARCH_VIEW = 'challenges_challenge_search'
+
+TRIGGERS = (
+    'challenges_challenge_fts_insert',
+    'challenges_challenge_fts_delete',
+    'challenges_challenge_fts_update',
+    'challenges_song_fts_update',
+    'challenges_lyricline_fts_update',
+)
+
+# Column names match 0009 so services.search keeps its bm25 weights
+CREATE_SQL = [
+    f"""
+    CREATE VIEW {SEARCH_VIEW} AS
+    SELECT c.id AS id, s.title AS song_title, s.artist AS artist, l.text AS original_lyric, c.genre AS genre
+    FROM challenges_challenge c
+    JOIN challenges_lyricline l ON l.id = c.line_id
+    JOIN challenges_song s ON s.id = l.song_id
+    """,
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        song_title, artist, original_lyric, genre,
+        content='{SEARCH_VIEW}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_insert AFTER INSERT ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        SELECT new.id, s.title, s.artist, l.text, new.genre
+        FROM challenges_lyricline l JOIN challenges_song s ON s.id = l.song_id
+        WHERE l.id = new.line_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_delete AFTER DELETE ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        SELECT 'delete', old.id, s.title, s.artist, l.text, old.genre
+        FROM challenges_lyricline l JOIN challenges_song s ON s.id = l.song_id
+        WHERE l.id = old.line_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER challenges_challenge_fts_update
+    AFTER UPDATE OF line_id, genre ON challenges_challenge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        SELECT 'delete', old.id, s.title, s.artist, l.text, old.genre
+        FROM challenges_lyricline l JOIN challenges_song s ON s.id = l.song_id
+        WHERE l.id = old.line_id;
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        SELECT new.id, s.title, s.artist, l.text, new.genre
+        FROM challenges_lyricline l JOIN challenges_song s ON s.id = l.song_id
+        WHERE l.id = new.line_id;
+    END
+    """,
+    # store_song saves title and artist with every lyrics change, so only
+    # reindex when they actually differ
+    f"""
+    CREATE TRIGGER challenges_song_fts_update
+    AFTER UPDATE OF title, artist ON challenges_song
+    WHEN old.title IS NOT new.title OR old.artist IS NOT new.artist BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        SELECT 'delete', c.id, old.title, old.artist, l.text, c.genre
+        FROM challenges_lyricline l JOIN challenges_challenge c ON c.line_id = l.id
+        WHERE l.song_id = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        SELECT c.id, new.title, new.artist, l.text, c.genre
+        FROM challenges_lyricline l JOIN challenges_challenge c ON c.line_id = l.id
+        WHERE l.song_id = new.id;
+    END
+    """,
+    # Lines move to another song when they drop out of its lyrics (sync_lines)
+    f"""
+    CREATE TRIGGER challenges_lyricline_fts_update
+    AFTER UPDATE OF song_id, text ON challenges_lyricline
+    WHEN old.song_id IS NOT new.song_id OR old.text IS NOT new.text BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, song_title, artist, original_lyric, genre)
+        SELECT 'delete', c.id, s.title, s.artist, old.text, c.genre
+        FROM challenges_challenge c JOIN challenges_song s ON s.id = old.song_id
+        WHERE c.line_id = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, song_title, artist, original_lyric, genre)
+        SELECT c.id, s.title, s.artist, new.text, c.genre
+        FROM challenges_challenge c JOIN challenges_song s ON s.id = new.song_id
+        WHERE c.line_id = new.id;
+    END
+    """,
+    # Index the challenges that already exist
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [f"DROP TRIGGER IF EXISTS {trigger}" for trigger in TRIGGERS] + [
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    f"DROP VIEW IF EXISTS {SEARCH_VIEW}",
+]
+
+
+def has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not has_fts5(cursor):
+            return
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0011_challenge_blank'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='challenge',
+            name='line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='challenges', to='challenges.lyricline'),
+        ),
+        # Defaults in state only, so that migrating back can add the columns
+        # again before 0011 fills them in
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='challenge',
+                name='song_title',
+                field=models.CharField(default='', max_length=200),
+            ),
+            migrations.AlterField(
+                model_name='challenge',
+                name='artist',
+                field=models.CharField(default='', max_length=200),
+            ),
+            migrations.AlterField(
+                model_name='challenge',
+                name='original_lyric',
+                field=models.TextField(default=''),
+            ),
+            migrations.AlterField(
+                model_name='challenge',
+                name='blanked_lyric',
+                field=models.TextField(default=''),
+            ),
+        ]),
+        migrations.RemoveField(
+            model_name='challenge',
+            name='song_title',
+        ),
+        migrations.RemoveField(
+            model_name='challenge',
+            name='artist',
+        ),
+        migrations.RemoveField(
+            model_name='challenge',
+            name='original_lyric',
+        ),
+        migrations.RemoveField(
+            model_name='challenge',
+            name='blanked_lyric',
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
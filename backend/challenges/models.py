@@ -1,24 +1,161 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
+class Song(models.Model):
+    """
+    A song whose lyrics have been fetched, cleaned and split into lines once.
+    Songs without a genius_id only hold lines challenges use that are not
+    part of stored Genius lyrics (see services.song_store.loose_song).
+    """
+    genius_id = models.BigIntegerField(unique=True, null=True, blank=True)
+    title = models.CharField(max_length=200)
+    artist = models.CharField(max_length=200)
+    url = models.URLField(max_length=500, blank=True)
+    lyrics = models.TextField(blank=True)
+    # Normalized "title|artist" (see services.cache.search_key) for lookups by name
+    lookup_key = models.CharField(max_length=512, db_index=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.title} by {self.artist}"
+
+class LyricLine(models.Model):
+    """
+    One non-empty line of a song's cleaned lyrics, with the (start, end)
+    character offsets of each whitespace-separated word in text
+    """
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='lines')
+    index = models.PositiveIntegerField()
+    text = models.TextField()
+    word_offsets = models.JSONField(default=list)
+    
+    class Meta:
+        ordering = ['song', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['song', 'index'], name='unique_song_line_index'),
+        ]
+    
+    def words(self):
+        return [self.text[start:end] for start, end in self.word_offsets]
+    
+    def __str__(self):
+        return f"{self.song_id}:{self.index} {self.text}"
+
 class Challenge(models.Model):
+    """
+    A fill-in-the-blank challenge: words blank_start to
+    blank_start + blank_words - 1 of a stored lyric line. Song title, artist
+    and both forms of the lyric are read from the line and its song.
+    """
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_challenges')
-    song_title = models.CharField(max_length=200)
-    artist = models.CharField(max_length=200)
     genre = models.CharField(max_length=50, blank=True)
+    line = models.ForeignKey(LyricLine, on_delete=models.PROTECT, related_name='challenges')
+    blank_start = models.PositiveSmallIntegerField(default=0)
+    blank_words = models.PositiveSmallIntegerField(default=1)
     
-    original_lyric = models.TextField()
-    blanked_lyric = models.TextField()
     correct_answer = models.CharField(max_length=200)
+    # Precomputed forms of correct_answer used by answer matching
+    answer_normalized = models.CharField(max_length=400, blank=True, editable=False)
+    answer_compact = models.CharField(max_length=400, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Challenge list pages: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='challenge_created_idx'),
+            # my_challenges
+            models.Index(fields=['creator', '-created_at', '-id'], name='challenge_creator_created_idx'),
+            # Genre filters (admin, genre rounds)
+            models.Index(fields=['genre', '-created_at'], name='challenge_genre_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.song_title} by {self.artist}"
+    
+    @property
+    def song_title(self):
+        return self.line.song.title
+    
+    @property
+    def artist(self):
+        return self.line.song.artist
+    
+    @property
+    def original_lyric(self):
+        return self.line.text
+    
+    @property
+    def blanked_lyric(self):
+        from .services.challenge_generator import blank_line
+        
+        return blank_line(self.line.words(), self.blank_start, self.blank_start + self.blank_words)
+    
+    def prepare_answer(self):
+        """
+        Refresh the precomputed answer forms. save() calls this; call it
+        yourself before bulk_create, which bypasses save()
+        """
+        from .services.answer_matching import compact, normalize
+        
+        self.answer_normalized = normalize(self.correct_answer)
+        self.answer_compact = compact(self.answer_normalized)
+    
+    def save(self, *args, **kwargs):
+        self.prepare_answer()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'correct_answer' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'answer_normalized', 'answer_compact'}
+        super().save(*args, **kwargs)
+
+class ChallengeJob(models.Model):
+    """
+    A challenge creation request queued for the background workers (see
+    services/challenge_jobs.py). params holds the create_from_lyrics body;
+    challenge is set once the job is done.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='challenge_jobs')
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    params = models.JSONField()
+    challenge = models.ForeignKey(
+        Challenge, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    error = models.CharField(max_length=500, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Claiming the oldest queued job, requeueing stuck running ones
+            models.Index(fields=['status', 'created_at'], name='challenge_job_status_idx'),
+            # Pending jobs per creator
+            models.Index(fields=['creator', 'status'], name='challenge_job_creator_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.id} {self.status}"
 
 class ChallengeAttempt(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -26,7 +163,55 @@ class ChallengeAttempt(models.Model):
     answer_submitted = models.CharField(max_length=200)
     is_correct = models.BooleanField()
     hints_used = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # A player's attempts at a challenge (first-solve check on flush)
+            models.Index(fields=['user', 'challenge'], name='attempt_user_challenge_idx'),
+            # Solve counts per challenge
+            models.Index(fields=['challenge', 'is_correct'], name='attempt_challenge_correct_idx'),
+        ]
+
+class ScoreBucket(models.Model):
+    """
+    A player's points per day and per week, so windowed leaderboards read a
+    handful of rows instead of scanning ChallengeAttempt
+    """
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='score_buckets')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    score = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='unique_score_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-score'], name='score_bucket_window_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} {self.period} {self.period_start}: {self.score}"
+
+class LyricsCacheEntry(models.Model):
+    """
+    Persistent tier of the lyrics cache (see services/cache.py).
+    One row per cache key; a song is stored under its search key and its Genius id.
+    """
+    key = models.CharField(max_length=512, unique=True)
+    song_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    payload = models.JSONField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
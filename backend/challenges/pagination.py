@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ChallengeCursorPagination(CursorPagination):
+    """
+    Newest challenges first, paginated by an opaque cursor on
+    (created_at, id) instead of page numbers, so a page costs the same
+    however deep into the catalog it is and rows created meanwhile are
+    never skipped or repeated
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
@@ -1,8 +1,22 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Challenge, ChallengeAttempt
+from .services.challenge_generator import blank_line, unblank
+from .services.song_store import loose_line
+
+TEXT_FIELDS = ('song_title', 'artist', 'blanked_lyric', 'correct_answer')
 
 class ChallengeSerializer(serializers.ModelSerializer):
+    """
+    Challenges typed in by hand: the line (blanked_lyric with the answer put
+    back) is stored under the loose song of song_title and artist
+    """
     creator_name = serializers.CharField(source='creator.username', read_only=True)
+    song_title = serializers.CharField(max_length=200)
+    artist = serializers.CharField(max_length=200)
+    blanked_lyric = serializers.CharField()
     
     class Meta:
         model = Challenge
@@ -12,6 +26,33 @@ class ChallengeSerializer(serializers.ModelSerializer):
             'creator', 'creator_name', 'created_at'
         ]
         read_only_fields = ['id', 'creator', 'created_at']
+    
+    def validate(self, attrs):
+        if not any(field in attrs for field in TEXT_FIELDS):
+            return attrs
+        # A partial update keeps the fields it does not send
+        text = {
+            field: attrs.pop(field) if field in attrs else getattr(self.instance, field)
+            for field in TEXT_FIELDS
+        }
+        line = unblank(text['blanked_lyric'], text['correct_answer'])
+        if line is None:
+            raise serializers.ValidationError({'blanked_lyric': 'Must contain a blank (____) for the answer'})
+        attrs['correct_answer'] = text['correct_answer']
+        attrs['line_text'] = (text['song_title'], text['artist'], line)
+        return attrs
+    
+    def _store_line(self, validated_data):
+        if 'line_text' in validated_data:
+            title, artist, (text, start, count) = validated_data.pop('line_text')
+            validated_data.update(line=loose_line(title, artist, text), blank_start=start, blank_words=count)
+        return validated_data
+    
+    def create(self, validated_data):
+        return super().create(self._store_line(validated_data))
+    
+    def update(self, instance, validated_data):
+        return super().update(instance, self._store_line(validated_data))
 
 class ChallengeDetailSerializer(serializers.ModelSerializer):
     creator_name = serializers.CharField(source='creator.username', read_only=True)
@@ -28,5 +69,90 @@ class ChallengeDetailSerializer(serializers.ModelSerializer):
 class ChallengeAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChallengeAttempt
-        fields = ['id', 'challenge', 'answer_submitted', 'is_correct', 'hints_used', 'created_at']
-        read_only_fields = ['id', 'user', 'is_correct', 'created_at']
\ No newline at end of file
+        fields = ['id', 'challenge', 'answer_submitted', 'is_correct', 'hints_used', 'score', 'created_at']
+        read_only_fields = ['id', 'user', 'is_correct', 'score', 'created_at']
+
+# ===== FAST READ PATH =====
+# Building response dictionaries straight from .values() rows skips the
+# per-field machinery of ModelSerializer. Keys, key order and formatting
+# match ChallengeSerializer / ChallengeDetailSerializer exactly.
+
+CHALLENGE_VALUES = (
+    'id', 'line__song__title', 'line__song__artist', 'genre', 'line__text', 'line__word_offsets',
+    'blank_start', 'blank_words', 'correct_answer', 'creator_id', 'creator__username', 'created_at',
+)
+# original_lyric is line__text, which the list needs anyway to blank it
+CHALLENGE_DETAIL_VALUES = CHALLENGE_VALUES
+
+_created_at = serializers.DateTimeField()
+
+
+def _datetime_formatter():
+    """
+    DateTimeField.to_representation, with the settings and time zone looked
+    up once per response instead of once per value
+    """
+    output_format = api_settings.DATETIME_FORMAT
+    if not settings.USE_TZ or output_format is None or output_format.lower() != ISO_8601:
+        return _created_at.to_representation
+
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not value:
+            return None
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return format_datetime
+
+
+def _blanked_lyric(row):
+    """Challenge.blanked_lyric from a values() row"""
+    text, start = row['line__text'], row['blank_start']
+    words = [text[word_start:word_end] for word_start, word_end in row['line__word_offsets']]
+    return blank_line(words, start, start + row['blank_words'])
+
+
+def challenge_rows(rows, detail=False):
+    """
+    Args:
+        rows: Dictionaries from .values(*CHALLENGE_VALUES), or
+              .values(*CHALLENGE_DETAIL_VALUES) when detail is True
+        detail: Match ChallengeDetailSerializer instead of ChallengeSerializer
+
+    Returns: List of response dictionaries
+    """
+    format_datetime = _datetime_formatter()
+    if detail:
+        return [
+            {
+                'id': row['id'],
+                'song_title': row['line__song__title'],
+                'artist': row['line__song__artist'],
+                'genre': row['genre'],
+                'original_lyric': row['line__text'],
+                'blanked_lyric': _blanked_lyric(row),
+                'correct_answer': row['correct_answer'],
+                'creator': row['creator_id'],
+                'creator_name': row['creator__username'],
+                'created_at': format_datetime(row['created_at']),
+            }
+            for row in rows
+        ]
+    return [
+        {
+            'id': row['id'],
+            'song_title': row['line__song__title'],
+            'artist': row['line__song__artist'],
+            'genre': row['genre'],
+            'blanked_lyric': _blanked_lyric(row),
+            'correct_answer': row['correct_answer'],
+            'creator': row['creator_id'],
+            'creator_name': row['creator__username'],
+            'created_at': format_datetime(row['created_at']),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,114 @@
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Minimum SequenceMatcher ratio for a fuzzy match (unchanged from check_answer)
+MATCH_THRESHOLD = 0.80
+
+CONTRACTIONS = {
+    "can't": 'can not',
+    "won't": 'will not',
+    "n't": ' not',
+    "'re": ' are',
+    "'ll": ' will',
+    "'ve": ' have',
+    "'m": ' am',
+    "'d": ' would',
+    "in'": 'ing',
+}
+CONTRACTIONS_RE = re.compile(
+    '|'.join(re.escape(c) for c in sorted(CONTRACTIONS, key=len, reverse=True))
+)
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+
+def normalize(answer):
+    """
+    The normalized form check_answer has always compared: lowercased, trimmed
+    """
+    return answer.lower().strip()
+
+
+def compact(normalized):
+    """Normalized form with every space removed"""
+    return normalized.replace(' ', '')
+
+
+def fold(answer):
+    """
+    Lenient form for ANSWER_MATCH_LENIENT: NFKC + casefold, curly quotes
+    straightened, contractions expanded, punctuation dropped, whitespace
+    collapsed. "Don’t stop" and "do not stop!" fold to the same string.
+    """
+    text = unicodedata.normalize('NFKC', answer).casefold()
+    text = text.replace('’', "'").replace('‘', "'")
+    text = CONTRACTIONS_RE.sub(lambda m: CONTRACTIONS[m.group(0)], text)
+    text = PUNCTUATION_RE.sub('', text)
+    return ' '.join(text.split())
+
+
+@lru_cache(maxsize=4096)
+def _char_counts(text):
+    return Counter(text)
+
+
+def _ratio_upper_bound(correct, user):
+    """
+    Cheap upper bound on SequenceMatcher(None, correct, user).ratio(): the
+    ratio can't exceed 2 * (characters the strings have in common) / total
+    length, which is what quick_ratio() computes
+    """
+    total = len(correct) + len(user)
+    if not total:
+        return 1.0
+    # Length-only bound (real_quick_ratio) first, it needs no counting
+    if 2.0 * min(len(correct), len(user)) / total < MATCH_THRESHOLD:
+        return 0.0
+
+    counts = _char_counts(correct)
+    available = dict(counts)
+    matches = 0
+    for char in user:
+        left = available.get(char, 0)
+        if left > 0:
+            available[char] = left - 1
+            matches += 1
+    return 2.0 * matches / total
+
+
+def answers_match(correct, user_answer, correct_compact=None, lenient=False):
+    """
+    Decide whether a submission matches an answer.
+
+    Args:
+        correct: normalize(correct_answer), e.g. Challenge.answer_normalized
+        user_answer: The raw submitted answer
+        correct_compact: compact(correct), precomputed when available
+        lenient: Also accept answers that are equal after fold()
+
+    Returns: Same result as the original check_answer for lenient=False.
+    Exact and space-insensitive matches return immediately; fuzzy matching
+    bails out as soon as an upper bound shows the ratio can't reach
+    MATCH_THRESHOLD, and only then runs SequenceMatcher.
+    """
+    user = normalize(user_answer)
+
+    # Exact match
+    if correct == user:
+        return True
+
+    # Match ignoring spaces
+    if correct_compact is None:
+        correct_compact = compact(correct)
+    if correct_compact == compact(user):
+        return True
+
+    if lenient and fold(correct) == fold(user):
+        return True
+
+    # Fuzzy match, skipped when it provably can't reach the threshold
+    if _ratio_upper_bound(correct, user) < MATCH_THRESHOLD:
+        return False
+    return SequenceMatcher(None, correct, user).ratio() >= MATCH_THRESHOLD
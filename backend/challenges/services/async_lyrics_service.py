@@ -0,0 +1,396 @@
+import asyncio
+import atexit
+import functools
+import logging
+import re
+import threading
+
+from decouple import config
+from django.conf import settings
+
+from .cache import normalize_key_part, search_key, song_key
+from .catalog import get_song_catalog
+from .lyrics_service import LyricsTextMixin, get_lyrics_cache, get_upstream_client
+from .metrics import register_stats
+from .providers import WEB_ROOT, genius_roots, get_lyrics_provider, song_from_hit
+from .singleflight import AsyncSingleFlight, ServiceLoop
+from .throttling import UpstreamThrottled
+from .upstream import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# httpx, bs4 and lyricsgenius are imported where they are used so that
+# importing the views does not pay for them (see get_async_lyrics_service)
+
+
+@functools.lru_cache(maxsize=None)
+def _excluded_terms_re():
+    """Same exclusions LyricsService passes to lyricsgenius.Genius"""
+    from lyricsgenius import Genius
+
+    terms = Genius.default_terms + ["(Remix)", "(Live)"]
+    return re.compile('|'.join(re.escape(term) for term in terms), flags=re.IGNORECASE)
+
+
+def parse_lyrics_html(html):
+    """
+    Extract lyrics from a Genius song page, mirroring lyricsgenius.Genius.lyrics
+    with remove_section_headers=True
+    Returns: Lyrics string, or None if the page has no lyrics section
+    """
+    from bs4 import BeautifulSoup, NavigableString
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    for header in soup.find_all('div', class_=re.compile('LyricsHeader')):
+        header.decompose()
+
+    containers = soup.find_all('div', attrs={'data-lyrics-container': 'true'})
+    if not containers:
+        return None
+
+    lyrics = ''
+    for container in containers:
+        if not container.contents:
+            lyrics += '\n'
+            continue
+        for element in container.contents:
+            if element.name == 'br':
+                lyrics += '\n'
+            elif isinstance(element, NavigableString):
+                lyrics += str(element)
+            elif element.get('data-exclude-from-selection') != 'true':
+                lyrics += element.get_text(separator='\n')
+
+    # Remove [Verse], [Bridge], etc.
+    lyrics = re.sub(r'(\[.*?\])*', '', lyrics)
+    lyrics = re.sub('\n{2}', '\n', lyrics)
+    return lyrics.strip('\n')
+
+
+class AsyncLyricsService(LyricsTextMixin):
+    """
+    asyncio version of LyricsService for async views.
+
+    Talks to Genius over one pooled httpx.AsyncClient and returns the same
+    shapes as LyricsService.search_songs / get_lyrics / get_lyrics_by_search.
+    Shares the LyricsCache of the sync service when one is passed in, so
+    either path warms the cache for the other.
+
+    Cache lookups run on the caller's loop. Everything past a cache miss
+    (coalescing, upstream calls, storing the result) runs on the service's
+    own ServiceLoop, which holds the client and the in-flight calls: under
+    WSGI, where each async view gets a new loop, requests still share one
+    connection pool and identical concurrent lookups still collapse into one.
+    close() shuts the client down and is registered to run at exit.
+
+    With a local (non-remote) provider, songs are read from it instead and
+    Genius is never called.
+    """
+
+    def __init__(self, cache=None, api_key=None, upstream=None, catalog=None, provider=None):
+        import httpx
+
+        self.provider = provider
+        self.api_key = api_key or (config('GENIUS_API_KEY') if provider is None else '')
+        self.api_root, self.public_api_root, self.web_root = genius_roots()
+        self.cache = cache
+        self.catalog = catalog
+        self.upstream = upstream if upstream is not None else get_upstream_client()
+        self.inflight = AsyncSingleFlight()
+        self.timeout = getattr(settings, 'GENIUS_TIMEOUT', 5.0)
+        self.limits = httpx.Limits(
+            max_connections=getattr(settings, 'GENIUS_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'GENIUS_MAX_KEEPALIVE', 20),
+        )
+        self.loop = ServiceLoop('lyrics-http')
+        self._http = None
+
+    def _client(self):
+        """
+        The pooled client, created on first use. Only used on self.loop, so
+        it is never shared between event loops.
+        """
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=True,
+                headers={'application': 'LyrIQ'},
+            )
+        return self._http
+
+    async def _close_client(self):
+        client, self._http = self._http, None
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        """Close the pooled client and stop the service loop"""
+        self.loop.stop(cleanup=self._close_client)
+
+    async def _api_get(self, path, params=None, public=False):
+        """
+        GET a Genius API path through the upstream client (breaker, deadline,
+        retries). One request per upstream call, so each costs one budget
+        token, as each request of the sync path does (see charge_request)
+        Returns: The 'response' section of the JSON body
+        """
+        return await self.upstream.acall(self._api_get_once, path, params, public)
+
+    async def _api_get_once(self, path, params=None, public=False):
+        url = (self.public_api_root if public else self.api_root) + path
+        headers = {} if public else {'Authorization': f'Bearer {self.api_key}'}
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+
+        response = await self._client().get(url, params=params, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('response', data)
+
+    async def _scrape_lyrics(self, url):
+        if self.web_root != WEB_ROOT and url.startswith(WEB_ROOT):
+            # Song pages of a stand-in server still carry genius.com URLs
+            url = self.web_root + url[len(WEB_ROOT):]
+        response = await self.upstream.acall(self._get_page, url)
+        # Parsing a full song page is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(parse_lyrics_html, response.text)
+
+    async def _get_page(self, url):
+        response = await self._client().get(url)
+        response.raise_for_status()
+        return response
+
+    async def _local(self, fn, *args):
+        # Local stores read a memory-mapped file; keep page faults off the loop
+        return await asyncio.to_thread(fn, *args)
+
+    # ----- cache helpers -----
+
+    async def _cache_get(self, key):
+        if self.cache is None:
+            return None
+        return await self.cache.aget(key)
+
+    async def _cache_set(self, keys, payload):
+        if self.cache is not None:
+            await self.cache.aset(keys, payload)
+
+    async def _stale_or_none(self, key, error):
+        """
+        Upstream failed or the breaker is open: fall back to an expired cache
+        entry rather than failing the request
+        Raises: UpstreamThrottled when out of upstream budget with nothing stale
+        """
+        stale = await self.cache.aget(key, allow_stale=True) if self.cache is not None else None
+        if isinstance(error, (CircuitOpenError, UpstreamThrottled)):
+            logger.info("%s, %s for %s", error, 'serving stale' if stale else 'no stale entry', key)
+        else:
+            logger.warning("Error fetching lyrics for %s: %s", key, error)
+        if stale is None and isinstance(error, UpstreamThrottled):
+            raise error
+        return dict(stale) if stale is not None else None
+
+    # ----- public API -----
+
+    async def search_songs(self, query, max_results=10):
+        """
+        Search for songs by title or artist
+        Returns: List of song dictionaries with basic info
+        """
+        key = f"search_songs:{normalize_key_part(query)}"
+        try:
+            if self.provider is not None:
+                songs = await self.loop.run(
+                    self.inflight.do(key, self._local, self.provider.search_songs, query)
+                )
+            else:
+                response = await self.loop.run(self.inflight.do(key, self._api_get, 'search', {'q': query}))
+                songs = [song_from_hit(hit['result']) for hit in response['hits']]
+            songs = songs[:max_results]
+
+            if self.catalog is not None:
+                self.catalog.add(songs, query=query)
+            return songs
+        except UpstreamThrottled:
+            raise
+        except Exception as e:
+            logger.warning("Error searching songs: %s", e)
+            return []
+
+    async def get_lyrics(self, song_id):
+        """
+        Get full lyrics for a specific song by ID
+        Returns: Dictionary with song info and lyrics
+        """
+        key = song_key(song_id)
+        cached = await self._cache_get(key)
+        if cached is not None:
+            return dict(cached)
+
+        try:
+            result = await self.loop.run(self.inflight.do(key, self._fetch_lyrics, song_id))
+            return dict(result) if result else None
+        except Exception as e:
+            return await self._stale_or_none(key, e)
+
+    async def _fetch_lyrics(self, song_id):
+        if self.provider is not None:
+            result = await self._local(self.provider.song, song_id)
+        else:
+            result = None
+            song = await self._api_get(f"songs/{song_id}", {'text_format': 'plain'})
+            if song and 'song' in song:
+                song_data = song['song']
+                result = {
+                    'id': song_data['id'],
+                    'title': song_data['title'],
+                    'artist': song_data['primary_artist']['name'],
+                    'lyrics': song_data.get('lyrics', ''),
+                    'url': song_data['url']
+                }
+
+        if result:
+            result['lyrics'] = self._clean_lyrics(result['lyrics'] or '')
+            if result['lyrics']:
+                await self._cache_set(song_key(result['id']), result)
+        return result
+
+    async def cached_lyrics_by_search(self, title, artist=None):
+        """
+        Look a song up in the lyrics cache only, without going upstream
+        Returns: Dictionary with song info and lyrics, or None on a miss
+        """
+        cached = await self._cache_get(search_key(title, artist))
+        return dict(cached) if cached is not None else None
+
+    async def get_lyrics_by_search(self, title, artist=None):
+        """
+        Search and get lyrics in one go
+        Returns: Dictionary with song info and lyrics
+        Raises: UpstreamThrottled (see _stale_or_none)
+        """
+        key = search_key(title, artist)
+        cached = await self._cache_get(key)
+        if cached is not None:
+            return dict(cached)
+
+        try:
+            result = await self.loop.run(
+                self.inflight.do(key, self._fetch_lyrics_by_search, key, title, artist)
+            )
+            return dict(result) if result else None
+        except Exception as e:
+            return await self._stale_or_none(key, e)
+
+    async def _fetch_lyrics_by_search(self, key, title, artist=None):
+        """
+        Same lookup lyricsgenius.Genius.search_song performs: multi search,
+        pick the matching song hit, load full song info, scrape the lyrics page
+        """
+        if self.provider is not None:
+            result = await self._local(self.provider.search_song, title, artist)
+            if not result or not result['lyrics']:
+                return None
+            result['lyrics'] = self._clean_lyrics(result['lyrics'])
+            await self._cache_set([key, song_key(result['id'])], result)
+            return result
+
+        search_term = f"{title} {artist}".strip() if artist else title.strip()
+        response = await self._api_get('search/multi', {'q': search_term}, public=True)
+
+        song_info = self._pick_song_hit(response, title)
+        if song_info is None or not self._result_is_lyrics(song_info):
+            return None
+
+        full_info = await self._api_get(f"songs/{song_info['id']}", {'text_format': 'plain'})
+        song_info.update(full_info['song'])
+
+        lyrics = None
+        if song_info['lyrics_state'] == 'complete' and not song_info.get('instrumental'):
+            lyrics = await self._scrape_lyrics(song_info['url'])
+        if not lyrics:
+            return None
+
+        result = {
+            'id': song_info['id'],
+            'title': song_info['title'],
+            'artist': song_info['primary_artist']['name'],
+            'lyrics': self._clean_lyrics(lyrics),
+            'url': song_info.get('url') or ''
+        }
+        await self._cache_set([key, song_key(result['id'])], result)
+        return result
+
+    def _pick_song_hit(self, response, title):
+        """
+        Choose the song hit whose title matches, else the first hit with lyrics
+        """
+        sections = response['sections']
+        top_hits = sections[0]['hits'] if sections else []
+        hits = [hit for hit in top_hits if hit['index'] == 'song']
+        hits.extend(
+            hit
+            for section in sorted(sections, key=lambda sect: sect['type'] == 'song')
+            for hit in section['hits']
+            if hit['index'] == 'song'
+        )
+
+        from lyricsgenius.utils import clean_str
+
+        wanted = clean_str(title)
+        for hit in hits:
+            if clean_str(hit['result']['title']) == wanted:
+                return hit['result']
+
+        for hit in hits:
+            if self._result_is_lyrics(hit['result']):
+                return hit['result']
+
+        return hits[0]['result'] if hits else None
+
+    def _result_is_lyrics(self, song):
+        if song['lyrics_state'] != 'complete' or song.get('instrumental'):
+            return False
+        return not _excluded_terms_re().search(song['title'])
+
+    def stats(self):
+        """
+        Cache, request-coalescing and upstream counters for monitoring
+        Returns: Dictionary with 'cache', 'coalescing' and 'upstream' sections
+        """
+        return {
+            'cache': self.cache.stats() if self.cache is not None else {},
+            'coalescing': self.inflight.stats(),
+            'upstream': self.upstream.stats(),
+        }
+
+
+# Singleton instance, built on first use and sharing the sync service's cache
+_async_lyrics_service = None
+_async_lyrics_service_lock = threading.Lock()
+
+
+def get_async_lyrics_service():
+    """
+    Return the shared AsyncLyricsService, creating it on first call
+    """
+    global _async_lyrics_service
+    if _async_lyrics_service is None:
+        with _async_lyrics_service_lock:
+            if _async_lyrics_service is None:
+                # Genius keeps its own async client; other providers are read directly
+                provider = None
+                if getattr(settings, 'LYRICS_PROVIDER', 'genius') != 'genius':
+                    provider = get_lyrics_provider()
+                _async_lyrics_service = AsyncLyricsService(
+                    cache=get_lyrics_cache(),
+                    upstream=get_upstream_client(),
+                    catalog=get_song_catalog(),
+                    provider=provider,
+                )
+                register_stats('async_coalescing', _async_lyrics_service.inflight.stats)
+                atexit.register(_async_lyrics_service.close)
+    return _async_lyrics_service
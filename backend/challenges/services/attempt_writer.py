@@ -0,0 +1,319 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leaderboard import get_leaderboards, period_start
+from .metrics import register_stats
+
+logger = logging.getLogger(__name__)
+
+
+def is_transient(exc):
+    """
+    Returns: True for errors that a later retry can get past (SQLite
+    "database is locked" / "database table is locked", busy timeouts)
+    """
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class AttemptWriter:
+    """
+    Write-behind buffer for answer submissions.
+
+    record() only appends to an in-memory list; attempts are written with one
+    bulk_create and score changes are merged per user into a single F()
+    update of their UserProfile and daily/weekly ScoreBucket, once max_batch
+    attempts are pending or flush_interval seconds have passed. A daemon
+    thread flushes idle buffers and the process flushes whatever is left at
+    exit. Committed deltas are then applied to the in-memory leaderboards.
+
+    Points and challenges_completed are only awarded for a user's first
+    correct attempt at a challenge, so resubmitting a solved one does not
+    inflate the leaderboard.
+
+    A batch that fails because the database is locked or busy is kept for
+    the next flush, which the timer thread makes once flush_interval has
+    passed (record() does not retry on the request thread meanwhile). At
+    most max_pending attempts are kept; the oldest beyond that are dropped.
+    Any other OperationalError (missing table, read-only database) will not
+    go away by retrying, so the batch is dropped. Other database errors mean
+    a bad row (typically an attempt at a challenge deleted meanwhile):
+    attempts whose challenge or user is gone are dropped, and the rest are
+    written one by one so a bad row only loses itself.
+    """
+
+    def __init__(self, max_batch=100, flush_interval=2.0, enabled=True, max_pending=10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        # Serializes flushes so two batches never race on the same solve
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        # No size-triggered flush before this, after a transient failure
+        self._retry_at = 0.0
+        self._timer = None
+        self._counters = {
+            'recorded': 0,
+            'flushes': 0,
+            'written': 0,
+            'scored_players': 0,
+            'failed_flushes': 0,
+            'dropped': 0,
+        }
+
+    def record(self, user_id, challenge_id, answer, is_correct, hints_used, score):
+        """
+        Queue one attempt. Writes synchronously when write-behind is disabled.
+        """
+        attempt = {
+            'user_id': user_id,
+            'challenge_id': challenge_id,
+            'answer_submitted': answer[:200],
+            'is_correct': is_correct,
+            'hints_used': hints_used,
+            'score': score,
+        }
+
+        with self._lock:
+            self._pending.append(attempt)
+            self._counters['recorded'] += 1
+            now = time.monotonic()
+            due = not self.enabled or (now >= self._retry_at and (
+                len(self._pending) >= self.max_batch
+                or now - self._last_flush >= self.flush_interval
+            ))
+
+        if due:
+            self.flush()
+        else:
+            self._ensure_timer()
+
+    def flush(self):
+        """
+        Write every pending attempt and apply the merged score deltas in one
+        transaction
+        Returns: Number of attempts written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+
+            try:
+                written, scored = len(batch), self._write(batch)
+            except DatabaseError as e:
+                if is_transient(e):
+                    logger.exception("Failed to flush %d challenge attempts, will retry", len(batch))
+                    self._requeue(batch)
+                    return 0
+                if isinstance(e, OperationalError):
+                    # The database itself is unusable; retrying would only grow the backlog
+                    logger.exception("Dropped %d challenge attempts", len(batch))
+                    with self._lock:
+                        self._counters['failed_flushes'] += 1
+                        self._counters['dropped'] += len(batch)
+                    return 0
+                logger.exception("Failed to flush %d challenge attempts, writing them one by one", len(batch))
+                with self._lock:
+                    self._counters['failed_flushes'] += 1
+                written, scored = self._salvage(batch)
+
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['written'] += written
+                self._counters['scored_players'] += scored
+            return written
+
+    def _requeue(self, attempts):
+        with self._lock:
+            # Keep them for the next flush rather than losing scores
+            self._pending[:0] = attempts
+            self._counters['failed_flushes'] += 1
+            self._retry_at = time.monotonic() + self.flush_interval
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self._counters['dropped'] += overflow
+        if overflow > 0:
+            logger.error("Dropped the %d oldest challenge attempts, over %d were pending", overflow, self.max_pending)
+        if self.enabled:
+            self._ensure_timer()
+
+    def _salvage(self, batch):
+        """
+        Write what can be written of a batch that failed as a whole
+        Returns: (attempts written, players scored)
+        """
+        from django.contrib.auth.models import User
+
+        from challenges.models import Challenge
+
+        challenge_ids = set(
+            Challenge.objects.filter(id__in={a['challenge_id'] for a in batch}).values_list('id', flat=True)
+        )
+        user_ids = set(User.objects.filter(id__in={a['user_id'] for a in batch}).values_list('id', flat=True))
+        valid = [a for a in batch if a['challenge_id'] in challenge_ids and a['user_id'] in user_ids]
+        dropped = len(batch) - len(valid)
+        if dropped:
+            logger.warning("Dropped %d attempts at deleted challenges or by deleted users", dropped)
+
+        written = scored = 0
+        for i, attempt in enumerate(valid):
+            try:
+                scored += self._write([attempt])
+                written += 1
+            except DatabaseError as e:
+                if is_transient(e):
+                    logger.exception("Failed to write challenge attempts, will retry")
+                    self._requeue(valid[i:])
+                    break
+                logger.exception("Dropped challenge attempt %s", attempt)
+                dropped += 1
+
+        with self._lock:
+            self._counters['dropped'] += dropped
+        return written, scored
+
+    def _write(self, batch):
+        from challenges.models import ChallengeAttempt
+        from users.models import UserProfile
+
+        correct_pairs = {
+            (a['user_id'], a['challenge_id']) for a in batch if a['is_correct']
+        }
+        already_solved = set()
+        if correct_pairs:
+            already_solved = set(
+                ChallengeAttempt.objects
+                .filter(
+                    is_correct=True,
+                    user_id__in={user_id for user_id, _ in correct_pairs},
+                    challenge_id__in={challenge_id for _, challenge_id in correct_pairs},
+                )
+                .values_list('user_id', 'challenge_id')
+            )
+
+        # user_id -> [score delta, completed delta]
+        deltas = defaultdict(lambda: [0, 0])
+        for attempt in batch:
+            pair = (attempt['user_id'], attempt['challenge_id'])
+            if attempt['is_correct'] and pair not in already_solved:
+                already_solved.add(pair)
+                deltas[attempt['user_id']][0] += attempt['score']
+                deltas[attempt['user_id']][1] += 1
+
+        today = timezone.localdate()
+        scored = {}
+        with transaction.atomic():
+            ChallengeAttempt.objects.bulk_create(
+                [ChallengeAttempt(**attempt) for attempt in batch]
+            )
+            for user_id, (score, completed) in deltas.items():
+                if UserProfile.objects.filter(user_id=user_id).update(
+                    total_score=F('total_score') + score,
+                    challenges_completed=F('challenges_completed') + completed,
+                ):
+                    scored[user_id] = (score, completed)
+            self._add_to_buckets(scored, today)
+
+        get_leaderboards().apply(scored, today)
+        return len(scored)
+
+    def _add_to_buckets(self, deltas, today):
+        """Add score deltas to each player's daily and weekly ScoreBucket"""
+        from challenges.models import ScoreBucket
+
+        for period in ('day', 'week'):
+            start = period_start(period, today)
+            missing = []
+            for user_id, (score, completed) in deltas.items():
+                if not ScoreBucket.objects.filter(
+                    user_id=user_id, period=period, period_start=start
+                ).update(
+                    score=F('score') + score,
+                    completed=F('completed') + completed,
+                ):
+                    missing.append(ScoreBucket(
+                        user_id=user_id, period=period, period_start=start,
+                        score=score, completed=completed,
+                    ))
+            ScoreBucket.objects.bulk_create(missing)
+
+    def _ensure_timer(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Thread(
+                target=self._run_timer, name='attempt-writer', daemon=True
+            )
+            self._timer.start()
+
+    def _run_timer(self):
+        """Flush buffers that stop receiving attempts before max_batch"""
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                idle = bool(self._pending) and (
+                    time.monotonic() - self._last_flush >= self.flush_interval
+                )
+            if idle:
+                try:
+                    self.flush()
+                finally:
+                    # This thread's connection would otherwise stay open forever
+                    connection.close()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_challenge_ids(self, user_id):
+        """
+        Challenges a player has attempts for that are not written yet
+        """
+        with self._lock:
+            return {a['challenge_id'] for a in self._pending if a['user_id'] == user_id}
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'pending': len(self._pending)}
+
+
+_attempt_writer = None
+_attempt_writer_lock = threading.Lock()
+
+
+def get_attempt_writer():
+    """
+    Return the process-wide AttemptWriter
+    """
+    global _attempt_writer
+    if _attempt_writer is None:
+        with _attempt_writer_lock:
+            if _attempt_writer is None:
+                from django.conf import settings
+
+                _attempt_writer = AttemptWriter(
+                    max_batch=settings.ATTEMPT_FLUSH_SIZE,
+                    flush_interval=settings.ATTEMPT_FLUSH_INTERVAL,
+                    enabled=settings.ATTEMPT_WRITE_BEHIND,
+                    max_pending=settings.ATTEMPT_MAX_PENDING,
+                )
+                atexit.register(_attempt_writer.flush)
+                register_stats('attempt_writer', _attempt_writer.stats)
+    return _attempt_writer
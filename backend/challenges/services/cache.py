@@ -0,0 +1,288 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .metrics import observe_cache
+
+
+def normalize_key_part(value):
+    """
+    Normalize a title/artist so that "Shape of You " and "shape  of you"
+    share a cache entry
+    """
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', str(value)).casefold()
+    return ' '.join(value.split())
+
+
+def search_key(title, artist=None):
+    """Cache key for a (title, artist) lookup"""
+    return f"search:{normalize_key_part(title)}|{normalize_key_part(artist)}"
+
+
+def song_key(song_id):
+    """Cache key for a Genius song id"""
+    return f"song:{song_id}"
+
+
+class LyricsCache:
+    """
+    Two-tier cache for lyrics payloads.
+
+    The first tier is an in-process LRU (OrderedDict) bounded by entry count.
+    The second tier is the LyricsCacheEntry table, shared by every worker and
+    kept across restarts. Both tiers honour the same TTL; the table is pruned
+    back to its size limit every so often on write. Expired rows stay in the
+    table for stale_grace seconds, so get(allow_stale=True) can still serve
+    them while the upstream is failing.
+    """
+
+    def __init__(self, max_entries=512, ttl=60 * 60 * 24,
+                 persistent_max_entries=10000, persistent=True,
+                 prune_interval=100, stale_grace=60 * 60 * 24 * 7):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent_max_entries = persistent_max_entries
+        self.persistent = persistent
+        self.prune_interval = prune_interval
+        self.stale_grace = stale_grace
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._counters = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'stale_hits': 0,
+            'sets': 0,
+            'evictions': 0,
+        }
+
+    # ----- public API -----
+
+    def get(self, key, allow_stale=False):
+        """
+        Look a key up in memory first, then in the persistent tier.
+        Expired entries are only returned when allow_stale is True.
+        Returns: the cached payload dict, or None on a miss
+        """
+        now = time.time()
+        stale = None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    observe_cache(True)
+                    return payload
+                stale = payload
+
+        if self.persistent:
+            row = self._load_persistent(key)
+            if row is not None:
+                payload, expires_at = row
+                if expires_at > now:
+                    self._remember(key, payload, expires_at)
+                    self._bump('persistent_hits')
+                    observe_cache(True)
+                    return payload
+                stale = payload
+
+        if allow_stale and stale is not None:
+            self._bump('stale_hits')
+            return stale
+
+        self._bump('misses')
+        observe_cache(False)
+        return None
+
+    def expires_in(self, key):
+        """
+        Time left before key expires, without counting a hit or a miss. The
+        persistent tier is always checked, as another worker may have
+        renewed the entry since this process cached it.
+        Returns: Seconds (negative once expired), or None if key is not cached
+        """
+        expiries = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiries.append(entry[1])
+        if self.persistent:
+            row = self._load_persistent(key)
+            if row is not None:
+                expiries.append(row[1])
+        return max(expiries) - time.time() if expiries else None
+
+    async def aget(self, key, allow_stale=False):
+        """
+        Async variant of get(). Fresh memory hits are served inline; anything
+        that needs the persistent tier runs in Django's sync thread.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                observe_cache(True)
+                return entry[0]
+
+        return await sync_to_async(self.get)(key, allow_stale)
+
+    async def aset(self, keys, payload, ttl=None):
+        """Async variant of set()"""
+        if not self.persistent:
+            return self.set(keys, payload, ttl)
+        return await sync_to_async(self.set)(keys, payload, ttl)
+
+    def set(self, keys, payload, ttl=None):
+        """
+        Store one payload under several keys (e.g. search key and song id key)
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        keys = [key for key in keys if key]
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+
+        for key in keys:
+            self._remember(key, payload, expires_at)
+        self._bump('sets')
+
+        if self.persistent and keys:
+            self._store_persistent(keys, payload, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.persistent:
+            try:
+                from challenges.models import LyricsCacheEntry
+                LyricsCacheEntry.objects.filter(key=key).delete()
+            except DatabaseError:
+                pass
+
+    def clear(self, persistent=False):
+        """Drop the memory tier, and optionally the persistent tier too"""
+        with self._lock:
+            self._entries.clear()
+        if persistent and self.persistent:
+            try:
+                from challenges.models import LyricsCacheEntry
+                LyricsCacheEntry.objects.all().delete()
+            except DatabaseError:
+                pass
+
+    def stats(self):
+        """
+        Snapshot of cache counters
+        Returns: Dictionary of counters plus current size and hit ratio
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters['memory_entries'] = len(self._entries)
+
+        hits = counters['memory_hits'] + counters['persistent_hits']
+        lookups = hits + counters['misses']
+        counters['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return counters
+
+    # ----- memory tier -----
+
+    def _remember(self, key, payload, expires_at):
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _bump(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    # ----- persistent tier -----
+
+    def _load_persistent(self, key):
+        from challenges.models import LyricsCacheEntry
+
+        try:
+            row = (
+                LyricsCacheEntry.objects
+                .filter(key=key)
+                .values_list('payload', 'expires_at')
+                .first()
+            )
+        except DatabaseError:
+            return None
+
+        if row is None:
+            return None
+
+        payload, expires_at = row
+        return payload, expires_at.timestamp()
+
+    def _store_persistent(self, keys, payload, expires_at):
+        from challenges.models import LyricsCacheEntry
+
+        expires = timezone.now() + timedelta(seconds=expires_at - time.time())
+        try:
+            for key in keys:
+                LyricsCacheEntry.objects.update_or_create(
+                    key=key,
+                    defaults={
+                        'song_id': payload.get('id'),
+                        'payload': payload,
+                        'expires_at': expires,
+                    }
+                )
+        except DatabaseError:
+            return
+
+        with self._lock:
+            self._writes_since_prune += len(keys)
+            should_prune = self._writes_since_prune >= self.prune_interval
+            if should_prune:
+                self._writes_since_prune = 0
+
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Remove rows that expired more than stale_grace seconds ago and trim
+        the table back to persistent_max_entries, dropping the entries
+        closest to expiry first
+        Returns: Number of rows deleted
+        """
+        from challenges.models import LyricsCacheEntry
+
+        try:
+            cutoff = timezone.now() - timedelta(seconds=self.stale_grace)
+            deleted, _ = LyricsCacheEntry.objects.filter(expires_at__lte=cutoff).delete()
+
+            overflow = LyricsCacheEntry.objects.count() - self.persistent_max_entries
+            if overflow > 0:
+                oldest = list(
+                    LyricsCacheEntry.objects
+                    .order_by('expires_at')
+                    .values_list('pk', flat=True)[:overflow]
+                )
+                LyricsCacheEntry.objects.filter(pk__in=oldest).delete()
+                deleted += len(oldest)
+        except DatabaseError:
+            return 0
+
+        with self._lock:
+            self._counters['evictions'] += deleted
+        return deleted
@@ -0,0 +1,409 @@
+import atexit
+import bisect
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, deque
+
+from .metrics import register_stats
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+# Fields of a search_songs() result kept in the catalog, in snapshot order
+SONG_FIELDS = ('id', 'title', 'artist', 'album', 'release_date', 'thumbnail', 'url')
+
+NON_ALNUM_RE = re.compile(r'[^\w\s]+')
+
+# Prefix key kinds, best first: the query starts the title, starts the
+# artist, or starts some later word of either
+TITLE, ARTIST, WORD = 0, 1, 2
+
+# New prefix keys go to a small sorted list that is merged into the main
+# array once it holds this many
+RECENT_KEYS_MAX = 4096
+
+# Recent searches (time, top result id) kept for trending()
+RECENT_SEARCHES_MAX = 5000
+
+# Trigrams shared by more songs than this (" th", "the", ...) only confirm
+# candidates found through rarer trigrams instead of producing candidates
+COMMON_TRIGRAM_POSTINGS = 5000
+MIN_TRIGRAM_SIMILARITY = 0.5
+
+
+def normalize_text(text):
+    """Casefolded, accents and punctuation stripped, whitespace collapsed"""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(NON_ALNUM_RE.sub(' ', text.casefold()).split())
+
+
+def trigrams(text):
+    """Trigrams of every word, padded so word starts and ends count"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def index_song(song, trigram_index):
+    """
+    Add a song to a trigram -> song ids index (and note its trigram count
+    on the song, for similarity ranking)
+    Returns: The song's prefix keys, (text, kind, song id) per word start
+    """
+    song_id = song['id']
+    title = normalize_text(song.get('title'))
+    artist = normalize_text(song.get('artist'))
+
+    grams = trigrams(f"{title} {artist}")
+    song['_trigrams'] = len(grams)
+    for gram in grams:
+        trigram_index.setdefault(gram, set()).add(song_id)
+
+    keys = set()
+    for kind, text in ((TITLE, title), (ARTIST, artist)):
+        words = text.split()
+        for i in range(len(words)):
+            keys.add((' '.join(words[i:]), kind if i == 0 else WORD, song_id))
+    return keys
+
+
+class SongCatalog:
+    """
+    Every song seen in Genius search results, indexed in memory for
+    autocomplete.
+
+    Prefix lookups bisect a sorted array of (key, kind, song id) entries,
+    one per word start of the title and artist, which gives trie-style
+    O(log n + k) prefix scans without a node object per character.
+    Misspelled queries are matched through a trigram -> song ids index.
+    The catalog is saved as a gzipped JSON snapshot and reloaded at startup.
+    """
+
+    def __init__(self, path=None, save_interval=300.0):
+        self.path = path
+        self.save_interval = save_interval
+
+        self._lock = threading.RLock()
+        self._songs = {}
+        self._seen = Counter()
+        self._prefix_keys = []
+        self._recent_keys = []
+        self._trigrams = {}
+        self._searches = deque(maxlen=RECENT_SEARCHES_MAX)
+
+        self._dirty = False
+        self._saving = False
+        # A snapshot must not be overwritten before it has been read
+        self._loading = False
+        # Set once the snapshot has been read (at once without a snapshot path)
+        self._loaded = threading.Event()
+        if not path:
+            self._loaded.set()
+        self._last_save = time.monotonic()
+        self._counters = {'lookups': 0, 'prefix_hits': 0, 'trigram_hits': 0, 'saves': 0}
+
+    @classmethod
+    def from_songs(cls, songs):
+        """
+        Catalog of a fixed set of songs (e.g. a local lyrics store), indexed
+        in one pass instead of song by song. Has no snapshot path.
+        """
+        catalog = cls()
+        keys = []
+        for song in songs:
+            song = {field: song.get(field) for field in SONG_FIELDS}
+            catalog._songs[song['id']] = song
+            keys.extend(index_song(song, catalog._trigrams))
+        keys.sort()
+        catalog._prefix_keys = keys
+        return catalog
+
+    def __len__(self):
+        return len(self._songs)
+
+    def add(self, songs, query=None):
+        """
+        Add search_songs() results. Songs already in the catalog only have
+        their seen count raised (it ranks autocomplete results).
+
+        Args:
+            query: The search that returned songs; its top result is noted
+                   as a recent search (see trending())
+        """
+        with self._lock:
+            if query and songs and songs[0].get('id') is not None:
+                self._searches.append((time.time(), songs[0]['id']))
+                self._dirty = True
+            for song in songs:
+                song_id = song.get('id')
+                if song_id is None:
+                    continue
+                self._seen[song_id] += 1
+                if song_id in self._songs:
+                    continue
+                song = {field: song.get(field) for field in SONG_FIELDS}
+                self._songs[song_id] = song
+                for key in index_song(song, self._trigrams):
+                    bisect.insort(self._recent_keys, key)
+                self._dirty = True
+
+                if len(self._recent_keys) >= RECENT_KEYS_MAX:
+                    # Two sorted runs: timsort merges them in linear time
+                    self._prefix_keys.extend(self._recent_keys)
+                    self._prefix_keys.sort()
+                    self._recent_keys = []
+        self._maybe_save()
+
+    def _prefix_matches(self, query, limit):
+        """Song ids with a title/artist word starting with query, best first"""
+        best = {}
+        for keys in (self._prefix_keys, self._recent_keys):
+            start = bisect.bisect_left(keys, (query,))
+            # Scan a bounded window so very short prefixes stay cheap
+            for key, kind, song_id in keys[start:start + limit * 20]:
+                if not key.startswith(query):
+                    break
+                if kind < best.get(song_id, WORD + 1):
+                    best[song_id] = kind
+        return sorted(
+            best,
+            key=lambda song_id: (
+                best[song_id], -self._seen[song_id], len(self._songs[song_id]['title'] or '')
+            )
+        )
+
+    def _trigram_matches(self, query):
+        """
+        Song ids sharing at least MIN_TRIGRAM_SIMILARITY of the query's
+        trigrams, most similar first
+        """
+        grams = trigrams(query)
+        postings = [self._trigrams[gram] for gram in grams if gram in self._trigrams]
+
+        rare = [ids for ids in postings if len(ids) <= COMMON_TRIGRAM_POSTINGS]
+        if not rare:
+            # Nothing selective to go on; scoring every song would not be cheap
+            return []
+        common = [ids for ids in postings if len(ids) > COMMON_TRIGRAM_POSTINGS]
+
+        shared = Counter()
+        for ids in rare:
+            shared.update(ids)
+        for song_id in shared:
+            shared[song_id] += sum(1 for ids in common if song_id in ids)
+
+        needed = MIN_TRIGRAM_SIMILARITY * len(grams)
+        matches = [song_id for song_id, count in shared.items() if count >= needed]
+
+        def dice(song_id):
+            return 2 * shared[song_id] / (len(grams) + self._songs[song_id]['_trigrams'])
+
+        matches.sort(key=lambda song_id: (-dice(song_id), -self._seen[song_id]))
+        return matches
+
+    def search(self, query, limit=10):
+        """
+        Autocomplete a partial title or artist.
+        Returns: Up to limit song dictionaries (same keys as search_songs):
+        prefix matches, or typo-tolerant trigram matches when nothing starts
+        with the query
+        """
+        query = normalize_text(query)
+        if not query:
+            return []
+
+        with self._lock:
+            self._counters['lookups'] += 1
+            ids = self._prefix_matches(query, limit)[:limit]
+            if ids:
+                self._counters['prefix_hits'] += 1
+            else:
+                # Slower than a prefix scan, so only for likely typos
+                ids = self._trigram_matches(query)[:limit]
+                if ids:
+                    self._counters['trigram_hits'] += 1
+            return [
+                {field: self._songs[song_id][field] for field in SONG_FIELDS}
+                for song_id in ids
+            ]
+
+    def trending(self, since=None, limit=50):
+        """
+        Songs that topped the most recent searches
+        Args:
+            since: Unix time; older searches are ignored
+        Returns: Up to limit (song dictionary, searches) pairs, most searched first
+        """
+        with self._lock:
+            hits = Counter(
+                song_id for searched_at, song_id in self._searches
+                if (since is None or searched_at >= since) and song_id in self._songs
+            )
+            return [
+                ({field: self._songs[song_id][field] for field in SONG_FIELDS}, count)
+                for song_id, count in hits.most_common(limit)
+            ]
+
+    # ===== SNAPSHOTS =====
+
+    def _maybe_save(self):
+        with self._lock:
+            if not self.path or self._saving or self._loading or not self._dirty:
+                return
+            if time.monotonic() - self._last_save < self.save_interval:
+                return
+            self._saving = True
+        threading.Thread(target=self.save, name='song-catalog-save', daemon=True).start()
+
+    def save(self):
+        """
+        Write the catalog to self.path (atomically, via a temporary file)
+        Returns: True if a snapshot was written
+        """
+        try:
+            with self._lock:
+                if not self.path or self._loading or not self._dirty:
+                    return False
+                songs = [
+                    [song[field] for field in SONG_FIELDS] + [self._seen[song_id]]
+                    for song_id, song in self._songs.items()
+                ]
+                searches = list(self._searches)
+                self._dirty = False
+                self._last_save = time.monotonic()
+
+            payload = json.dumps(
+                {'version': SNAPSHOT_VERSION, 'songs': songs, 'searches': searches},
+                separators=(',', ':'), ensure_ascii=False
+            ).encode()
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+            with self._lock:
+                self._counters['saves'] += 1
+            return True
+        except OSError:
+            logger.exception("Could not save song catalog to %s", self.path)
+            with self._lock:
+                self._dirty = True
+            return False
+        finally:
+            self._saving = False
+
+    def load(self):
+        """
+        Load the snapshot at self.path, if there is one. Indexes are built
+        without holding the lock, so the catalog keeps serving (and adding)
+        songs meanwhile; songs added during the load are merged in.
+        Returns: Number of songs in the catalog afterwards
+        """
+        with self._lock:
+            self._loading = True
+        try:
+            snapshot = self._read_snapshot()
+            rows = snapshot.get('songs', [])
+
+            songs = {}
+            seen = Counter()
+            trigram_index = {}
+            keys = []
+            for row in rows:
+                song = dict(zip(SONG_FIELDS, row))
+                songs[song['id']] = song
+                seen[song['id']] = row[len(SONG_FIELDS)]
+                keys.extend(index_song(song, trigram_index))
+            keys.sort()
+
+            with self._lock:
+                recent = []
+                for song_id, song in self._songs.items():
+                    if song_id not in songs:
+                        songs[song_id] = song
+                        recent.extend(index_song(song, trigram_index))
+                seen.update(self._seen)
+                recent.sort()
+                searches = sorted(
+                    [tuple(search) for search in snapshot.get('searches', [])] + list(self._searches)
+                )
+
+                self._songs = songs
+                self._seen = seen
+                self._trigrams = trigram_index
+                self._prefix_keys = keys
+                self._recent_keys = recent
+                self._searches = deque(searches, maxlen=RECENT_SEARCHES_MAX)
+                return len(self._songs)
+        finally:
+            with self._lock:
+                self._loading = False
+            self._loaded.set()
+
+    def wait_loaded(self, timeout=None):
+        """
+        Block until load() has finished (get_song_catalog loads in the background)
+        Returns: True if it has
+        """
+        return self._loaded.wait(timeout)
+
+    def _read_snapshot(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with gzip.open(self.path, 'rb') as f:
+                snapshot = json.loads(f.read())
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable song catalog snapshot %s", self.path)
+            return {}
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return {}
+        return snapshot
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'songs': len(self._songs),
+                'prefix_keys': len(self._prefix_keys) + len(self._recent_keys),
+                'trigrams': len(self._trigrams),
+                'recent_searches': len(self._searches),
+                'loading': self._loading,
+            }
+
+
+_song_catalog = None
+_song_catalog_lock = threading.Lock()
+
+
+def get_song_catalog():
+    """
+    Return the process-wide SongCatalog. Its snapshot is loaded in the
+    background, so the first requests are served from an empty catalog
+    rather than waiting for it.
+    """
+    global _song_catalog
+    if _song_catalog is None:
+        with _song_catalog_lock:
+            if _song_catalog is None:
+                from django.conf import settings
+
+                catalog = SongCatalog(
+                    path=settings.SONG_CATALOG_PATH,
+                    save_interval=settings.SONG_CATALOG_SAVE_INTERVAL,
+                )
+                threading.Thread(target=catalog.load, name='song-catalog-load', daemon=True).start()
+                atexit.register(catalog.save)
+                register_stats('song_catalog', catalog.stats)
+                _song_catalog = catalog
+    return _song_catalog
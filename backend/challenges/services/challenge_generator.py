@@ -0,0 +1,200 @@
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from .lyrics_text import LyricsDocument, normalize_token
+
+# Words that make poor blanks on their own
+STOPWORDS = frozenset("""
+a about after again all am an and any are as at be because been before being
+but by can could did do does doing don't down for from had has have having he
+her here hers him his how i i'd i'll i'm i've if in into is it it's its just
+let's me more most my no nor not now of off oh on once only or other our ours
+out over own same she so some such than that that's the their theirs them then
+there these they this those through to too under until up very was we were
+what when where which while who whom why will with would yeah yo you you're
+your yours ooh ah na la hey uh
+""".split())
+
+# Relative weight of each scoring signal
+WEIGHTS = {
+    'length': 1.0,
+    'rarity': 1.5,
+    'chorus': 0.75,
+    'position': 0.25,
+}
+
+
+class CorpusStats:
+    """
+    Document frequencies of tokens over a set of lyric lines, used to score
+    how rare (and so how distinctive) a word is
+    """
+
+    def __init__(self, doc_freq=None, total_docs=0):
+        self.doc_freq = doc_freq or {}
+        self.total_docs = total_docs
+        self.built_at = time.time()
+
+    @classmethod
+    def from_lines(cls, lines):
+        doc_freq = Counter()
+        total = 0
+        for text in lines:
+            tokens = {normalize_token(word) for word in text.split()}
+            tokens.discard('')
+            doc_freq.update(tokens)
+            total += 1
+        return cls(dict(doc_freq), total)
+
+    @classmethod
+    def from_database(cls):
+        from challenges.models import LyricLine
+
+        return cls.from_lines(
+            LyricLine.objects.values_list('text', flat=True).iterator(chunk_size=5000)
+        )
+
+    def rarity(self, token):
+        """Smoothed inverse document frequency, 1.0 for unseen corpora"""
+        if not self.total_docs:
+            return 1.0
+        return math.log((self.total_docs + 1) / (self.doc_freq.get(token, 0) + 1)) + 1.0
+
+
+def blank_line(words, start, end):
+    """Same output format as LyricsTextMixin.snippet_from_line"""
+    blanked = list(words)
+    for i in range(start, end):
+        blanked[i] = '____'
+    return ' '.join(blanked)
+
+
+BLANK_RE = re.compile(r'_{2,}')
+
+
+def unblank(blanked_line, answer):
+    """
+    Undo blank_line for a challenge typed in by hand: put the answer's words
+    back in place of the first run of blanks ("____")
+    Returns: (line text, blank start, blank word count), or None when
+    blanked_line has no blank or answer has no words
+    """
+    words = blanked_line.split()
+    answer_words = answer.split()
+    start = next((i for i, word in enumerate(words) if BLANK_RE.fullmatch(word)), None)
+    if start is None or not answer_words:
+        return None
+    end = start
+    while end < len(words) and BLANK_RE.fullmatch(words[end]):
+        end += 1
+    return ' '.join(words[:start] + answer_words + words[end:]), start, len(answer_words)
+
+
+def score_span(tokens, start, end, repeats, corpus):
+    """
+    Score blanking tokens[start:end] of a line.
+    Returns: Score, or None if the span is not a usable answer
+    """
+    span = tokens[start:end]
+    if not all(span):
+        return None
+    # Spans that start or end on a filler word, or are only filler, are skipped
+    if span[0] in STOPWORDS or span[-1] in STOPWORDS:
+        return None
+
+    content = [token for token in span if token not in STOPWORDS]
+    length = sum(min(len(token), 10) for token in content) / len(content)
+    rarity = max(corpus.rarity(token) for token in content)
+    # Lines sung more than once (chorus/hook) are easier to recall
+    chorus = min(repeats - 1, 3)
+    # Prefer blanks away from the very first and last word
+    position = 0.0 if start == 0 or end == len(tokens) else 1.0
+
+    return (
+        WEIGHTS['length'] * length / 10
+        + WEIGHTS['rarity'] * rarity
+        + WEIGHTS['chorus'] * chorus
+        + WEIGHTS['position'] * position
+    )
+
+
+def generate_candidates(lines, corpus=None, top_n=10, max_span=2):
+    """
+    Score every line and candidate word span of a song.
+
+    Args:
+        lines: The song's lyric lines, in order, or its LyricsDocument
+               (whose words and tokens are reused instead of split again)
+        corpus: CorpusStats for rarity scoring (uniform rarity when None)
+        top_n: How many candidates to return
+        max_span: Longest run of consecutive words to blank
+
+    Returns: Up to top_n candidate dictionaries (best first, one per distinct
+    line) with the same keys as create_challenge_snippet plus 'words_to_blank',
+    'start' and 'score'
+    """
+    corpus = corpus or CorpusStats()
+    document = lines if isinstance(lines, LyricsDocument) else None
+    if document is not None:
+        lines = document.lines()
+    repeats = Counter(line.lower() for line in lines)
+    seen = set()
+    candidates = []
+
+    for line_index, line in enumerate(lines):
+        key = line.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+
+        words = document.words(line_index) if document is not None else line.split()
+        if len(words) < 3:
+            continue
+        if document is not None:
+            tokens = document.tokens(line_index)
+        else:
+            tokens = [normalize_token(word) for word in words]
+
+        best = None
+        for span in range(1, max_span + 1):
+            for start in range(0, len(words) - span + 1):
+                score = score_span(tokens, start, start + span, repeats[key], corpus)
+                if score is not None and (best is None or score > best[0]):
+                    best = (score, start, span)
+
+        if best is None:
+            continue
+
+        score, start, span = best
+        candidates.append({
+            'original_line': line,
+            'blanked_line': blank_line(words, start, start + span),
+            'answer': ' '.join(words[start:start + span]),
+            'line_index': line_index,
+            'words_to_blank': span,
+            'start': start,
+            'score': round(score, 4),
+        })
+
+    candidates.sort(key=lambda c: (-c['score'], c['line_index']))
+    return candidates[:top_n]
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus_stats(max_age=60 * 60):
+    """
+    Process-wide CorpusStats built from the LyricLine table, rebuilt at most
+    once per max_age seconds
+    """
+    global _corpus
+    if _corpus is None or time.time() - _corpus.built_at > max_age:
+        with _corpus_lock:
+            if _corpus is None or time.time() - _corpus.built_at > max_age:
+                _corpus = CorpusStats.from_database()
+    return _corpus
@@ -0,0 +1,323 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import register_stats
+from .song_store import find_song, get_line, loose_line, store_song
+from .throttling import BACKGROUND, upstream_priority
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    """The job cannot succeed (no lyrics, no such line), so it is not retried"""
+
+
+def challenge_fields(lyrics_service, song, song_data, line_index, words_to_blank):
+    """
+    Challenge fields for one line of a stored Song, or of fetched lyrics
+    (song_data) when the song has no Genius id to store it under; that line
+    is then stored under the loose song of its title and artist
+    Returns: Dictionary of Challenge field values (without creator and
+    genre), or None when the line can't be turned into a challenge
+    """
+    line = None
+    if song is not None:
+        line = get_line(song, line_index)
+        challenge_data = lyrics_service.snippet_from_line(
+            line.text, line.index, words_to_blank, words=line.words()
+        ) if line else None
+    else:
+        challenge_data = lyrics_service.create_challenge_snippet(
+            song_data['lyrics'], line_index, words_to_blank
+        )
+
+    if not challenge_data:
+        return None
+    if line is None:
+        line = loose_line(song_data['title'], song_data['artist'], challenge_data['original_line'])
+    else:
+        line.song = song
+
+    return {
+        'line': line,
+        'blank_start': challenge_data['start'],
+        'blank_words': challenge_data['words_to_blank'],
+        'correct_answer': challenge_data['answer'],
+    }
+
+
+def fields_from_params(lyrics_service, params):
+    """
+    Resolve a job's song (stored, or fetched and stored) and build its
+    challenge, as create_from_lyrics does
+    Returns: Same as challenge_fields()
+    Raises: JobFailed
+    """
+    title, artist = params['title'], params.get('artist')
+    song, song_data = find_song(title, artist), None
+    if song is None:
+        song_data = lyrics_service.get_lyrics_by_search(title, artist)
+        if not song_data:
+            raise JobFailed('Could not fetch lyrics for this song')
+        song = store_song(song_data)
+
+    fields = challenge_fields(
+        lyrics_service, song, song_data, params.get('line_index', 0), params.get('words_to_blank', 1)
+    )
+    if fields is None:
+        raise JobFailed('Could not create challenge from these lyrics')
+    return fields
+
+
+class ChallengeJobQueue:
+    """
+    Runs queued ChallengeJob rows on a pool of worker threads.
+
+    The table is the queue: a worker claims the oldest queued job with a
+    conditional UPDATE (queued -> running), so every process can run workers
+    against the same table without a broker and each job still runs once.
+    Workers wake up at once for jobs enqueued in this process (notify()) and
+    poll every poll_interval seconds for the others.
+
+    Lyrics are fetched at BACKGROUND upstream priority: ahead of the warm-up,
+    behind players waiting on a request.
+
+    Unexpected errors (including an exhausted upstream budget) are retried
+    up to max_attempts times. Jobs left running by a process that died are
+    queued again after stale_after seconds, and finished jobs are deleted
+    after retention seconds.
+    """
+
+    def __init__(self, lyrics_service=None, workers=2, poll_interval=2.0, max_attempts=3,
+                 stale_after=300.0, retention=60 * 60 * 24.0, maintenance_interval=60.0):
+        self._lyrics_service = lyrics_service
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.retention = retention
+        self.maintenance_interval = maintenance_interval
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._signals = 0
+        self._threads = []
+        self._stopped = threading.Event()
+        self._last_maintenance = 0.0
+        self._counters = {
+            'enqueued': 0,
+            'claimed': 0,
+            'done': 0,
+            'failed': 0,
+            'retried': 0,
+            'requeued_stale': 0,
+            'pruned': 0,
+        }
+
+    @property
+    def lyrics_service(self):
+        if self._lyrics_service is None:
+            from .lyrics_service import get_lyrics_service
+
+            self._lyrics_service = get_lyrics_service()
+        return self._lyrics_service
+
+    # ----- producers -----
+
+    def notify(self):
+        """
+        A job was committed: wake a worker, starting the pool on first use
+        """
+        with self._lock:
+            self._counters['enqueued'] += 1
+            self._signals += 1
+            self._wakeup.notify()
+        self.start()
+
+    # ----- workers -----
+
+    def start(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name=f'challenge-jobs-{len(self._threads)}', daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+        return self
+
+    def stop(self):
+        """Let the workers finish their current job and exit"""
+        self._stopped.set()
+        with self._lock:
+            self._wakeup.notify_all()
+
+    def join(self, timeout=None):
+        for thread in list(self._threads):
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                ran = self.run_one()
+                if not ran:
+                    self._maybe_maintain()
+            except DatabaseError:
+                logger.exception("Challenge job worker could not reach the database")
+                ran = False
+            if ran:
+                continue
+
+            # Idle: drop the connection rather than hold it while waiting
+            connection.close()
+            with self._lock:
+                if not self._signals and not self._stopped.is_set():
+                    self._wakeup.wait(self.poll_interval)
+                self._signals = max(self._signals - 1, 0)
+        connection.close()
+
+    def run_pending(self):
+        """
+        Run queued jobs in the calling thread until none are left
+        Returns: Number of jobs run
+        """
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def run_one(self):
+        """
+        Claim and run the oldest queued job
+        Returns: True if there was one
+        """
+        job = self._claim()
+        if job is None:
+            return False
+        self._run(job)
+        return True
+
+    def _claim(self):
+        from challenges.models import ChallengeJob
+
+        while True:
+            job_id = (
+                ChallengeJob.objects
+                .filter(status=ChallengeJob.QUEUED)
+                .order_by('created_at')
+                .values_list('id', flat=True)
+                .first()
+            )
+            if job_id is None:
+                return None
+            claimed = ChallengeJob.objects.filter(id=job_id, status=ChallengeJob.QUEUED).update(
+                status=ChallengeJob.RUNNING,
+                started_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                self._bump('claimed')
+                return ChallengeJob.objects.get(id=job_id)
+            # Another worker took it first; try the next one
+
+    def _run(self, job):
+        from challenges.models import Challenge, ChallengeJob
+
+        try:
+            with upstream_priority(BACKGROUND):
+                fields = fields_from_params(self.lyrics_service, job.params)
+            with transaction.atomic():
+                challenge = Challenge.objects.create(
+                    creator_id=job.creator_id, genre=job.params.get('genre', ''), **fields
+                )
+                self._finish(job, ChallengeJob.DONE, challenge=challenge)
+        except JobFailed as e:
+            self._finish(job, ChallengeJob.FAILED, error=str(e))
+        except Exception as e:
+            # Usually transient (upstream errors, SQLite "database is locked")
+            if job.attempts < self.max_attempts:
+                logger.warning("Challenge job %s failed (attempt %d), retrying: %s", job.id, job.attempts, e)
+                ChallengeJob.objects.filter(id=job.id).update(status=ChallengeJob.QUEUED)
+                self._bump('retried')
+            else:
+                logger.exception("Challenge job %s failed after %d attempts", job.id, job.attempts)
+                self._finish(job, ChallengeJob.FAILED, error='Could not create the challenge')
+
+    def _finish(self, job, status, challenge=None, error=''):
+        from challenges.models import ChallengeJob
+
+        ChallengeJob.objects.filter(id=job.id).update(
+            status=status, challenge=challenge, error=error[:500], finished_at=timezone.now()
+        )
+        self._bump('done' if status == ChallengeJob.DONE else 'failed')
+
+    def _maybe_maintain(self):
+        with self._lock:
+            if time.monotonic() - self._last_maintenance < self.maintenance_interval:
+                return
+            self._last_maintenance = time.monotonic()
+        self.maintain()
+
+    def maintain(self):
+        """
+        Queue stuck running jobs again and delete old finished ones
+        Returns: (requeued, deleted)
+        """
+        from challenges.models import ChallengeJob
+
+        now = timezone.now()
+        requeued = ChallengeJob.objects.filter(
+            status=ChallengeJob.RUNNING, started_at__lt=now - timedelta(seconds=self.stale_after)
+        ).update(status=ChallengeJob.QUEUED)
+        deleted, _ = ChallengeJob.objects.filter(
+            status__in=[ChallengeJob.DONE, ChallengeJob.FAILED],
+            finished_at__lt=now - timedelta(seconds=self.retention),
+        ).delete()
+
+        with self._lock:
+            self._counters['requeued_stale'] += requeued
+            self._counters['pruned'] += deleted
+        return requeued, deleted
+
+    def _bump(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'workers': sum(1 for thread in self._threads if thread.is_alive()),
+            }
+
+
+_challenge_job_queue = None
+_challenge_job_queue_lock = threading.Lock()
+
+
+def get_challenge_job_queue():
+    """
+    Return the process-wide ChallengeJobQueue. Its workers only start once a
+    job is enqueued in this process.
+    """
+    global _challenge_job_queue
+    if _challenge_job_queue is None:
+        with _challenge_job_queue_lock:
+            if _challenge_job_queue is None:
+                from django.conf import settings
+
+                _challenge_job_queue = ChallengeJobQueue(
+                    workers=settings.CHALLENGE_JOB_WORKERS,
+                    poll_interval=settings.CHALLENGE_JOB_POLL_INTERVAL,
+                    max_attempts=settings.CHALLENGE_JOB_MAX_ATTEMPTS,
+                    retention=settings.CHALLENGE_JOB_RETENTION,
+                )
+                register_stats('challenge_jobs', _challenge_job_queue.stats)
+    return _challenge_job_queue
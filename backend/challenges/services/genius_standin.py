@@ -0,0 +1,182 @@
+import html
+import json
+import random
+import re
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .providers import WEB_ROOT
+
+SONG_PATH_RE = re.compile(r'^/(?:api/)?songs/(\d+)$')
+SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
+SEARCH_PAGE_SIZE = 20
+
+
+def slugify(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return SLUG_RE.sub('-', text).strip('-')
+
+
+class GeniusStandIn:
+    """
+    HTTP server answering the Genius endpoints LyricsService and
+    AsyncLyricsService use, from a LyricsStore:
+
+        GET /search?q=            API search (LyricsService.search_songs)
+        GET /songs/<id>           API song (also /api/songs/<id>)
+        GET /api/search/multi?q=  public multi search (search_song / get_lyrics_by_search)
+        GET /<song path>          song page with data-lyrics-container divs
+
+    Song URLs keep the https://genius.com/ prefix, like the real API; point
+    GENIUS_BASE_URL at this server and both clients rewrite it. latency
+    (seconds) and error_rate (0-1, answered with a 503) simulate a slow or
+    failing upstream.
+    """
+
+    def __init__(self, store, host='127.0.0.1', port=8765, latency=0.0, error_rate=0.0, verbose=False):
+        self.store = store
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+
+        # Song page path -> song id. Imported Genius URLs keep their path.
+        self.paths = {}
+        self._song_paths = {}
+        for song_id in store.ids():
+            song, _ = store.raw(song_id)
+            path = self._page_path(song)
+            if path in self.paths:
+                path = f"{path}-{song_id}"
+            self.paths[path] = song_id
+            self._song_paths[song_id] = path
+
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _page_path(self, song):
+        url = song.get('url') or ''
+        if url.startswith(WEB_ROOT) and len(url) > len(WEB_ROOT):
+            return unquote(urlsplit(url).path)
+        return f"/{slugify(song.get('artist'))}-{slugify(song.get('title'))}-lyrics".replace('/-', '/')
+
+    # ----- responses -----
+
+    def genius_song(self, song):
+        """Song JSON in the shape the Genius API returns it"""
+        path = self._song_paths[song['id']]
+        body = {
+            'id': song['id'],
+            'title': song['title'],
+            'full_title': f"{song['title']} by {song['artist']}",
+            'primary_artist': {'name': song['artist']},
+            'url': WEB_ROOT + path.lstrip('/'),
+            'path': path,
+            'api_path': f"/songs/{song['id']}",
+            'lyrics_state': 'complete',
+            'instrumental': False,
+            'release_date_for_display': song.get('release_date') or None,
+            'song_art_image_thumbnail_url': song.get('thumbnail') or '',
+        }
+        if song.get('album'):
+            body['album'] = {'name': song['album']}
+        return body
+
+    def _hits(self, query, limit=SEARCH_PAGE_SIZE):
+        return [
+            {'index': 'song', 'type': 'song', 'result': self.genius_song(song)}
+            for song in self.store.search(query, limit)
+        ]
+
+    def lyrics_page(self, song_id):
+        song = self.store.get(song_id)
+        lines = '<br/>'.join(html.escape(line) for line in song['lyrics'].split('\n'))
+        return (
+            f"<!DOCTYPE html><html><head><title>{html.escape(song['title'])} Lyrics</title></head>"
+            f'<body><div data-lyrics-container="true">{lines}</div></body></html>'
+        )
+
+    def route(self, path, params):
+        """
+        Returns: (status, content type, body text)
+        """
+        query = params.get('q', [''])[0]
+        if path == '/search':
+            return 200, 'json', {'hits': self._hits(query)}
+        if path == '/api/search/multi':
+            hits = self._hits(query)
+            return 200, 'json', {'sections': [
+                {'type': 'top_hit', 'hits': hits[:1]},
+                {'type': 'song', 'hits': hits},
+            ]}
+
+        match = SONG_PATH_RE.match(path)
+        if match:
+            song_id = int(match.group(1))
+            if song_id in self._song_paths:
+                song, _ = self.store.raw(song_id)
+                return 200, 'json', {'song': self.genius_song(song)}
+        elif path in self.paths:
+            return 200, 'html', self.lyrics_page(self.paths[path])
+        return 404, 'json', None
+
+    # ----- server -----
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if standin.latency:
+                    time.sleep(standin.latency)
+                if standin.error_rate and random.random() < standin.error_rate:
+                    status, kind, body = 503, 'json', None
+                else:
+                    parts = urlsplit(self.path)
+                    status, kind, body = standin.route(unquote(parts.path), parse_qs(parts.query))
+
+                if kind == 'json':
+                    payload = {'meta': {'status': status}}
+                    if body is not None:
+                        payload['response'] = body
+                    data = json.dumps(payload).encode()
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    data = body.encode()
+                    content_type = 'text/html; charset=utf-8'
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                if standin.verbose:
+                    super().log_message(format, *args)
+
+        return Handler
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        """Serve from a background thread (tests, load-test scripts)"""
+        self._thread = threading.Thread(target=self.serve_forever, name='genius-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,331 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .metrics import register_stats
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Leaderboard windows: all-time scores come from UserProfile, the others from
+# ScoreBucket rows for the current day / week
+WINDOWS = ('all', 'week', 'day')
+
+
+def period_start(window, today=None):
+    """
+    First day of the window containing today (weeks start on Monday)
+    Returns: date, or None for the all-time window
+    """
+    if window == 'all':
+        return None
+    today = today or timezone.localdate()
+    if window == 'week':
+        return today - timedelta(days=today.weekday())
+    return today
+
+
+class Leaderboard:
+    """
+    Players kept sorted by (-score, user_id) in a plain list, so top-N is a
+    slice and a player's rank is one bisect, O(log n). Ties are broken by
+    user id.
+
+    A score change finds the player's old and new positions by bisect too,
+    but deleting from and inserting into a list shifts every entry after
+    them: an update is O(n) element moves. They are one memmove, about 5us
+    per update at 10,000 players and 30us at 100,000, so a plain list is
+    still cheaper than a tree up to boards of that size.
+    """
+
+    def __init__(self, rows=()):
+        self._keys = []
+        self._scores = {}
+        self._completed = {}
+        self.load(rows)
+
+    def load(self, rows):
+        """
+        Replace the board with (user_id, score, completed) rows
+        """
+        self._scores = {}
+        self._completed = {}
+        for user_id, score, completed in rows:
+            self._scores[user_id] = score
+            self._completed[user_id] = completed
+        self._keys = sorted((-score, user_id) for user_id, score in self._scores.items())
+
+    def add(self, user_id, score_delta, completed_delta=0):
+        """
+        Apply a score change, moving the player to their new position
+        """
+        old = self._scores.get(user_id)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+        score = (old or 0) + score_delta
+        self._scores[user_id] = score
+        self._completed[user_id] = self._completed.get(user_id, 0) + completed_delta
+        bisect.insort(self._keys, (-score, user_id))
+
+    def top(self, n=10):
+        """
+        Returns: List of (user_id, score, completed), best first
+        """
+        return [
+            (user_id, -negative_score, self._completed[user_id])
+            for negative_score, user_id in self._keys[:n]
+        ]
+
+    def rank(self, user_id):
+        """
+        Returns: (1-based rank, score, completed), or None if the player has
+        no score on this board
+        """
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        position = bisect.bisect_left(self._keys, (-score, user_id))
+        return position + 1, score, self._completed[user_id]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class Leaderboards:
+    """
+    The all-time, weekly and daily boards of this process.
+
+    AttemptWriter applies each flush's score deltas as they are committed.
+    Reads only build a board from the database when there is none yet or its
+    day or week has rolled over. Picking up scores written by other processes
+    is left to refresh(), which the refresher thread (see
+    start_leaderboard_refresher) runs every rebuild_interval seconds.
+
+    Database queries never run under the lock: boards and profiles are
+    fetched first and installed under it, so reads of loaded boards and
+    apply() do not wait on a build. Concurrent reads of the same missing
+    board share one build.
+    """
+
+    def __init__(self, rebuild_interval=60.0):
+        self.rebuild_interval = rebuild_interval
+
+        self._lock = threading.RLock()
+        self._boards = {}
+        self._periods = {}
+        # user_id -> {'username': display name, 'challenges_created': n}
+        self._profiles = {}
+        self._counters = {'rebuilds': 0, 'updates': 0}
+        self._builds = SingleFlight()
+
+    def _rows(self, window, start):
+        """
+        Returns: ((user_id, score, completed) rows of the window, profile info
+        by user_id read along the way)
+        """
+        from challenges.models import ScoreBucket
+        from users.models import UserProfile
+
+        if window == 'all':
+            profiles = UserProfile.objects.values_list(
+                'user_id', 'display_name', 'total_score',
+                'challenges_completed', 'challenges_created',
+            )
+            rows, info = [], {}
+            for user_id, name, score, completed, created in profiles:
+                info[user_id] = {'username': name, 'challenges_created': created}
+                rows.append((user_id, score, completed))
+            return rows, info
+
+        rows = list(
+            ScoreBucket.objects
+            .filter(period=window, period_start=start, user__userprofile__isnull=False)
+            .values_list('user_id', 'score', 'completed')
+        )
+        return rows, {}
+
+    def _current(self, window, start):
+        board = self._boards.get(window)
+        return board if board is not None and self._periods.get(window) == start else None
+
+    def _board(self, window):
+        """The window's board, built first if missing or rolled over"""
+        start = period_start(window)
+        with self._lock:
+            board = self._current(window, start)
+        if board is None:
+            board = self._builds.do((window, start), self._build, window, start)
+        return board
+
+    def _build(self, window, start):
+        rows, profiles = self._rows(window, start)
+        board = Leaderboard(rows)
+        with self._lock:
+            # Keep a board another thread installed meanwhile (e.g. refresh()):
+            # it may already hold deltas this one missed
+            current = self._current(window, start)
+            if current is not None:
+                return current
+            return self._install(window, start, board, profiles)
+
+    def _install(self, window, start, board, profiles):
+        self._boards[window] = board
+        self._periods[window] = start
+        self._profiles.update(profiles)
+        self._counters['rebuilds'] += 1
+        return board
+
+    def refresh(self):
+        """
+        Reload every loaded board from the database. The queries run without
+        the lock, so reads are served from the old boards meanwhile. A score
+        committed while its board reloads can be missing from the new board
+        until the next refresh.
+        Returns: Number of boards reloaded
+        """
+        with self._lock:
+            windows = list(self._boards)
+        for window in windows:
+            start = period_start(window)
+            rows, profiles = self._rows(window, start)
+            board = Leaderboard(rows)
+            with self._lock:
+                self._install(window, start, board, profiles)
+        return len(windows)
+
+    def apply(self, deltas, today=None):
+        """
+        Apply committed score changes ({user_id: (score, completed)}) to every
+        board that is loaded for the period they were written to
+        """
+        with self._lock:
+            for window, board in self._boards.items():
+                if self._periods.get(window) != period_start(window, today):
+                    # Rolled over; the next read rebuilds from ScoreBucket
+                    continue
+                for user_id, (score, completed) in deltas.items():
+                    board.add(user_id, score, completed)
+            self._counters['updates'] += len(deltas)
+
+    def _profile(self, user_ids):
+        """Profile info for the given players, fetching unknown ones in one query"""
+        from users.models import UserProfile
+
+        with self._lock:
+            missing = [user_id for user_id in user_ids if user_id not in self._profiles]
+        if missing:
+            profiles = UserProfile.objects.filter(user_id__in=missing).values_list(
+                'user_id', 'display_name', 'challenges_created'
+            )
+            fetched = {
+                user_id: {'username': name, 'challenges_created': created}
+                for user_id, name, created in profiles
+            }
+            with self._lock:
+                self._profiles.update(fetched)
+        with self._lock:
+            return {user_id: self._profiles.get(user_id, {}) for user_id in user_ids}
+
+    def _entry(self, rank, user_id, score, completed, profile):
+        return {
+            'rank': rank,
+            'username': profile.get('username'),
+            'score': score,
+            'challenges_completed': completed,
+            'challenges_created': profile.get('challenges_created', 0),
+        }
+
+    def top(self, window='all', n=10):
+        """
+        Returns: List of leaderboard entries (same keys as the original
+        leaderboard endpoint), best first
+        """
+        board = self._board(window)
+        with self._lock:
+            rows = board.top(n)
+        profiles = self._profile([user_id for user_id, _, _ in rows])
+        return [
+            self._entry(position + 1, user_id, score, completed, profiles[user_id])
+            for position, (user_id, score, completed) in enumerate(rows)
+        ]
+
+    def rank(self, user_id, window='all'):
+        """
+        Returns: The player's leaderboard entry plus 'total_players', or None
+        if they have no score in this window
+        """
+        board = self._board(window)
+        with self._lock:
+            found = board.rank(user_id)
+            total = len(board)
+        if found is None:
+            return None
+        rank, score, completed = found
+        entry = self._entry(rank, user_id, score, completed, self._profile([user_id])[user_id])
+        entry['total_players'] = total
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'players': {window: len(board) for window, board in self._boards.items()},
+            }
+
+
+_leaderboards = None
+_leaderboard_refresher = None
+_leaderboards_lock = threading.Lock()
+
+
+def get_leaderboards():
+    """
+    Return the process-wide Leaderboards
+    """
+    global _leaderboards
+    if _leaderboards is None:
+        with _leaderboards_lock:
+            if _leaderboards is None:
+                from django.conf import settings
+
+                _leaderboards = Leaderboards(rebuild_interval=settings.LEADERBOARD_REBUILD_INTERVAL)
+                register_stats('leaderboards', _leaderboards.stats)
+    return _leaderboards
+
+
+def _refresh_forever(leaderboards):
+    from django.db import connection
+
+    while True:
+        time.sleep(leaderboards.rebuild_interval)
+        try:
+            leaderboards.refresh()
+        except Exception:
+            logger.exception("Leaderboard refresh failed")
+        finally:
+            connection.close()
+
+
+def start_leaderboard_refresher():
+    """
+    Start the daemon thread that reloads the leaderboards every
+    LEADERBOARD_REBUILD_INTERVAL seconds. Called by the WSGI/ASGI entry
+    points; elsewhere (management commands, tests) boards are built on first
+    read and only kept current by AttemptWriter.
+    Returns: The thread, or None when the interval is 0
+    """
+    global _leaderboard_refresher
+    leaderboards = get_leaderboards()
+    if leaderboards.rebuild_interval <= 0:
+        return None
+    with _leaderboards_lock:
+        if _leaderboard_refresher is None:
+            _leaderboard_refresher = threading.Thread(
+                target=_refresh_forever, args=(leaderboards,), name='leaderboard-refresher', daemon=True
+            )
+            _leaderboard_refresher.start()
+    return _leaderboard_refresher
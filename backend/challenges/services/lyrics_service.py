@@ -1,122 +1,36 @@
-import lyricsgenius
-from decouple import config
-import re
-
-class LyricsService:
-    def __init__(self):
-        """Initialize Genius API client"""
-        api_key = config('GENIUS_API_KEY')
-        self.genius = lyricsgenius.Genius(
-            api_key,
-            skip_non_songs=True,
-            excluded_terms=["(Remix)", "(Live)"],
-            remove_section_headers=True,
-            verbose=False
-        )
-    
-    def search_songs(self, query, max_results=10):
-        """
-        Search for songs by title or artist
-        Returns: List of song dictionaries with basic info
-        """
-        try:
-            response = self.genius.search_songs(query)
-            
-            songs = []
-            for hit in response['hits'][:max_results]:
-                song_data = hit['result']
-                songs.append({
-                    'id': song_data['id'],
-                    'title': song_data['title'],
-                    'artist': song_data['primary_artist']['name'],
-                    'album': song_data.get('album', {}).get('name', 'Unknown'),
-                    'release_date': song_data.get('release_date_for_display', 'Unknown'),
-                    'thumbnail': song_data.get('song_art_image_thumbnail_url', ''),
-                    'url': song_data['url']
-                })
-            
-            return songs
-        except Exception as e:
-            print(f"Error searching songs: {str(e)}")
-            return []
-    
-    def get_lyrics(self, song_id):
-        """
-        Get full lyrics for a specific song by ID
-        Returns: Dictionary with song info and lyrics
-        """
-        try:
-            song = self.genius.song(song_id)
-            
-            if song and 'song' in song:
-                song_data = song['song']
-                lyrics = song_data.get('lyrics', '')
-                
-                # Clean up lyrics
-                lyrics = self._clean_lyrics(lyrics)
-                
-                return {
-                    'id': song_data['id'],
-                    'title': song_data['title'],
-                    'artist': song_data['primary_artist']['name'],
-                    'lyrics': lyrics,
-                    'url': song_data['url']
-                }
-            
-            return None
-        except Exception as e:
-            print(f"Error fetching lyrics: {str(e)}")
-            return None
-    
-    def get_lyrics_by_search(self, title, artist=None):
-        """
-        Search and get lyrics in one go
-        Returns: Dictionary with song info and lyrics
-        """
-        try:
-            query = f"{title} {artist}" if artist else title
-            song = self.genius.search_song(title, artist)
-            
-            if song:
-                lyrics = self._clean_lyrics(song.lyrics)
-                
-                return {
-                    'id': song.id if hasattr(song, 'id') else None,
-                    'title': song.title if hasattr(song, 'title') else title,
-                    'artist': song.artist if hasattr(song, 'artist') else artist,
-                    'lyrics': lyrics,
-                    'url': song.url if hasattr(song, 'url') else ''
-                }
-            
-            return None
-        except Exception as e:
-            print(f"Error fetching lyrics: {str(e)}")
-            return None
-        
+from django.conf import settings
+import logging
+import threading
+
+from .cache import LyricsCache, normalize_key_part, search_key, song_key
+from .catalog import get_song_catalog
+from .lyrics_text import lyrics_document
+from .metrics import register_stats
+from .providers import get_lyrics_provider
+from .singleflight import SingleFlight
+from .throttling import UpstreamThrottled, get_upstream_budget
+from .upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+class LyricsTextMixin:
+    """
+    Text helpers shared by LyricsService and AsyncLyricsService
+    """
+
     def _clean_lyrics(self, lyrics):
         """
-        Clean up lyrics text - remove unnecessary metadata
+        Clean up lyrics text: remove Genius metadata (contributors header,
+        ads, embed counter) and extra whitespace
         """
-        # Remove "Embed" and numbers at the end
-        lyrics = re.sub(r'\d+Embed$', '', lyrics)
-        lyrics = re.sub(r'Embed$', '', lyrics)
-        
-        # Remove "You might also like" text
-        lyrics = lyrics.replace('You might also like', '')
-        
-        # Remove extra whitespace
-        lyrics = re.sub(r'\n\s*\n', '\n\n', lyrics)
-        lyrics = lyrics.strip()
-        
-        return lyrics
+        return lyrics_document(lyrics).text
     
     def split_into_lines(self, lyrics):
         """
         Split lyrics into individual lines for challenge creation
         Returns: List of lyric lines
         """
-        lines = [line.strip() for line in lyrics.split('\n') if line.strip()]
-        return lines
+        return lyrics_document(lyrics).lines()
     
     def create_challenge_snippet(self, lyrics, line_index, words_to_blank=1):
         """
@@ -129,13 +43,23 @@ class LyricsService:
         
         Returns: Dictionary with original line, blanked line, and answer
         """
-        lines = self.split_into_lines(lyrics)
+        document = lyrics_document(lyrics)
+        line = document.line(line_index)
         
-        if line_index >= len(lines):
+        if line is None:
             return None
         
-        original_line = lines[line_index]
-        words = original_line.split()
+        return self.snippet_from_line(line, line_index, words_to_blank, words=document.words(line_index))
+    
+    def snippet_from_line(self, original_line, line_index, words_to_blank=1, words=None):
+        """
+        Create a fill-in-the-blank challenge from a single, already split line
+        (e.g. a stored LyricLine, passing its precomputed words)
+        
+        Returns: Same dictionary as create_challenge_snippet
+        """
+        if words is None:
+            words = original_line.split()
         
         if len(words) < words_to_blank:
             return None
@@ -148,7 +72,7 @@ class LyricsService:
         answer = ' '.join(words[start_index:end_index])
         
         # Create blanked version
-        blanked_words = words.copy()
+        blanked_words = list(words)
         for i in range(start_index, end_index):
             blanked_words[i] = '____'
         
@@ -158,9 +82,232 @@ class LyricsService:
             'original_line': original_line,
             'blanked_line': blanked_line,
             'answer': answer,
-            'line_index': line_index
+            'line_index': line_index,
+            'words_to_blank': words_to_blank,
+            'start': start_index,
+        }
+
+
+class LyricsService(LyricsTextMixin):
+    def __init__(self, cache=None, upstream=None, catalog=None, provider=None):
+        """
+        Args:
+            provider: Where songs come from (default: settings.LYRICS_PROVIDER,
+                      see services.providers)
+        """
+        self.provider = provider if provider is not None else get_lyrics_provider()
+        self.cache = cache if cache is not None else get_lyrics_cache()
+        self.upstream = upstream if upstream is not None else get_upstream_client()
+        # Every song seen in search results feeds the autocomplete catalog
+        self.catalog = catalog if catalog is not None else get_song_catalog()
+        # Concurrent identical lookups share one upstream Genius call
+        self.inflight = SingleFlight()
+    
+    def _provider_call(self, fn, *args):
+        """Call a provider method, through the upstream client if it is remote"""
+        if self.provider.remote:
+            return self.upstream.call(fn, *args)
+        return fn(*args)
+    
+    def search_songs(self, query, max_results=10):
+        """
+        Search for songs by title or artist
+        Returns: List of song dictionaries with basic info
+        """
+        try:
+            songs = self.inflight.do(
+                f"search_songs:{normalize_key_part(query)}",
+                self._provider_call,
+                self.provider.search_songs,
+                query
+            )[:max_results]
+            
+            self.catalog.add(songs, query=query)
+            return songs
+        except UpstreamThrottled:
+            raise
+        except Exception as e:
+            logger.warning("Error searching songs: %s", e)
+            return []
+
+    def stats(self):
+        """
+        Cache, request-coalescing and upstream counters for monitoring
+        Returns: Dictionary with 'cache', 'coalescing' and 'upstream' sections
+        """
+        return {
+            'cache': self.cache.stats(),
+            'coalescing': self.inflight.stats(),
+            'upstream': self.upstream.stats(),
         }
 
+    def _stale_or_none(self, key, error):
+        """
+        Upstream failed or the breaker is open: fall back to an expired cache
+        entry rather than failing the request
+        Raises: UpstreamThrottled when out of upstream budget with nothing stale
+        """
+        stale = self.cache.get(key, allow_stale=True)
+        if isinstance(error, (CircuitOpenError, UpstreamThrottled)):
+            logger.info("%s, %s for %s", error, 'serving stale' if stale else 'no stale entry', key)
+        else:
+            logger.warning("Error fetching lyrics for %s: %s", key, error)
+        if stale is None and isinstance(error, UpstreamThrottled):
+            raise error
+        return dict(stale) if stale is not None else None
+    
+    def get_lyrics(self, song_id):
+        """
+        Get full lyrics for a specific song by ID
+        Returns: Dictionary with song info and lyrics
+        """
+        key = song_key(song_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        try:
+            result = self.inflight.do(key, self._fetch_lyrics, song_id)
+            return dict(result) if result else None
+        except Exception as e:
+            return self._stale_or_none(key, e)
+
+    def _fetch_lyrics(self, song_id):
+        """
+        Fetch a song by ID from the provider and cache it
+        Returns: Dictionary with song info and lyrics, or None
+        """
+        result = self._provider_call(self.provider.song, song_id)
+        
+        if result:
+            # Clean up lyrics
+            lyrics = self._clean_lyrics(result['lyrics'] or '')
+            result['lyrics'] = lyrics
+            # Only cache real lyrics so a later full fetch isn't shadowed
+            if lyrics:
+                self.cache.set(song_key(result['id']), result)
+            return result
+        
+        return None
+    
+    def get_lyrics_by_search(self, title, artist=None):
+        """
+        Search and get lyrics in one go
+        Cached on the normalized (title, artist) pair and on the Genius song id
+        Returns: Dictionary with song info and lyrics
+        """
+        key = search_key(title, artist)
+        cached = self.cache.get(key)
+        if cached is not None:
+            # Callers add keys (e.g. 'lines') to the result, so hand out a copy
+            return dict(cached)
+
+        try:
+            result = self.inflight.do(key, self._fetch_lyrics_by_search, key, title, artist)
+            return dict(result) if result else None
+        except Exception as e:
+            return self._stale_or_none(key, e)
+
+    def refresh_lyrics_by_search(self, title, artist=None):
+        """
+        Fetch a song again even if it is cached, renewing its cache entry
+        (used by the warm-up worker). Errors are raised, not served stale.
+        Returns: Dictionary with song info and lyrics, or None
+        """
+        key = search_key(title, artist)
+        result = self.inflight.do(key, self._fetch_lyrics_by_search, key, title, artist)
+        return dict(result) if result else None
+
+    def _fetch_lyrics_by_search(self, key, title, artist=None):
+        """
+        Search the provider for a song (on Genius: scrape its lyrics) and
+        cache the result
+        Returns: Dictionary with song info and lyrics, or None
+        """
+        result = self._provider_call(self.provider.search_song, title, artist)
+        
+        if result:
+            result['lyrics'] = self._clean_lyrics(result['lyrics'] or '')
+            song_id = result['id']
+            self.cache.set(
+                [key, song_key(song_id) if song_id else None],
+                result
+            )
+            return result
+        
+        return None
+
+
+# Singleton instance, built on first use so that importing views, running
+# migrations or starting a worker does not construct a Genius client
+_lyrics_service = None
+_lyrics_cache = None
+_upstream_client = None
+_lyrics_service_lock = threading.Lock()
+
+
+def get_upstream_client():
+    """
+    Return the process-wide Genius UpstreamClient, so the sync and async
+    services share one circuit breaker, one upstream budget and one set of
+    latency metrics
+    """
+    global _upstream_client
+    if _upstream_client is None:
+        with _lyrics_service_lock:
+            if _upstream_client is None:
+                _upstream_client = UpstreamClient(
+                    name='genius',
+                    breaker=CircuitBreaker(
+                        failure_threshold=getattr(settings, 'GENIUS_BREAKER_FAILURES', 5),
+                        reset_timeout=getattr(settings, 'GENIUS_BREAKER_RESET', 30.0),
+                    ),
+                    retries=getattr(settings, 'GENIUS_RETRIES', 2),
+                    backoff_base=getattr(settings, 'GENIUS_BACKOFF_BASE', 0.2),
+                    backoff_max=getattr(settings, 'GENIUS_BACKOFF_MAX', 2.0),
+                    deadline=getattr(settings, 'GENIUS_DEADLINE', 10.0),
+                    budget=get_upstream_budget(),
+                )
+                register_stats('upstream', _upstream_client.stats)
+    return _upstream_client
+
+
+def get_lyrics_cache():
+    """
+    Return the process-wide LyricsCache shared by the sync and async services
+    """
+    global _lyrics_cache
+    if _lyrics_cache is None:
+        with _lyrics_service_lock:
+            if _lyrics_cache is None:
+                _lyrics_cache = LyricsCache(
+                    max_entries=getattr(settings, 'LYRICS_CACHE_MAX_ENTRIES', 512),
+                    ttl=getattr(settings, 'LYRICS_CACHE_TTL', 60 * 60 * 24),
+                    persistent_max_entries=getattr(settings, 'LYRICS_CACHE_PERSISTENT_MAX_ENTRIES', 10000),
+                    persistent=getattr(settings, 'LYRICS_CACHE_PERSISTENT', True),
+                    stale_grace=getattr(settings, 'LYRICS_CACHE_STALE_GRACE', 60 * 60 * 24 * 7),
+                )
+                register_stats('lyrics_cache', _lyrics_cache.stats)
+    return _lyrics_cache
+
+
+def get_lyrics_service():
+    """
+    Return the shared LyricsService, creating it on first call
+    """
+    global _lyrics_service
+    if _lyrics_service is None:
+        cache = get_lyrics_cache()
+        upstream = get_upstream_client()
+        with _lyrics_service_lock:
+            if _lyrics_service is None:
+                _lyrics_service = LyricsService(cache=cache, upstream=upstream)
+                register_stats('coalescing', _lyrics_service.inflight.stats)
+    return _lyrics_service
+
 
-# Singleton instance
-lyrics_service = LyricsService()
\ No newline at end of file
+def __getattr__(name):
+    # Keeps `from ...lyrics_service import lyrics_service` working, lazily
+    if name == 'lyrics_service':
+        return get_lyrics_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,231 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+from .cache import search_key
+from .catalog import SONG_FIELDS, SongCatalog
+from .metrics import register_stats
+
+# File layout:
+#   MAGIC
+#   one zlib-compressed UTF-8 lyrics blob per song
+#   zlib-compressed JSON index: {'version': 1, 'songs': [[*SONG_FIELDS, offset, length], ...]}
+#   footer: index offset, index length, MAGIC
+# Only the index is read into memory; lyrics are decompressed from the
+# memory-mapped file when a song is asked for.
+MAGIC = b'LYRQSTR1'
+FOOTER = struct.Struct('<QQ8s')
+INDEX_VERSION = 1
+
+SECTION_HEADER_RE = re.compile(r'^[ \t]*\[[^\]\n]*\][ \t]*$', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+class LyricsStoreError(Exception):
+    """The store file is missing, truncated or not a lyrics store"""
+
+
+def strip_section_headers(lyrics):
+    """Drop [Verse 1] / [Chorus] lines, as Genius scraping does"""
+    lyrics = SECTION_HEADER_RE.sub('', lyrics)
+    return BLANK_LINES_RE.sub('\n\n', lyrics).strip()
+
+
+class LyricsStoreWriter:
+    """
+    Build a store file one song at a time, in constant memory apart from the
+    index. The file is written next to path and only replaces it on close(),
+    so readers never see a half-written store.
+
+        with LyricsStoreWriter(path) as writer:
+            writer.add({'id': 1, 'title': ..., 'artist': ..., 'lyrics': ...})
+    """
+
+    def __init__(self, path, level=6):
+        self.path = path
+        self.level = level
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        # Song id -> index row; a song added twice keeps its last version
+        self._songs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __len__(self):
+        return len(self._songs)
+
+    def _write_blob(self, song, blob):
+        self._file.write(blob)
+        self._songs[song['id']] = [song.get(field) for field in SONG_FIELDS] + [self._offset, len(blob)]
+        self._offset += len(blob)
+
+    def add(self, song):
+        """
+        Args:
+            song: Dictionary with an 'id', 'lyrics' and any of SONG_FIELDS
+        """
+        lyrics = (song.get('lyrics') or '').encode('utf-8')
+        self._write_blob(song, zlib.compress(lyrics, self.level))
+
+    def copy_from(self, store):
+        """Copy every song of an open LyricsStore without recompressing it"""
+        for song_id in store.ids():
+            song, blob = store.raw(song_id)
+            self._write_blob(song, blob)
+
+    def close(self):
+        index = zlib.compress(json.dumps(
+            {'version': INDEX_VERSION, 'songs': list(self._songs.values())},
+            separators=(',', ':'), ensure_ascii=False
+        ).encode('utf-8'), self.level)
+        self._file.write(index)
+        self._file.write(FOOTER.pack(self._offset, len(index), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class LyricsStore:
+    """
+    Read-only view of a store file written by LyricsStoreWriter: lookups by
+    Genius id or by (title, artist), and title/artist search through a
+    SongCatalog built from the index
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._file = open(path, 'rb')
+        except OSError as e:
+            raise LyricsStoreError(f"Cannot open lyrics store {path}: {e}") from e
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise LyricsStoreError(f"Lyrics store {path} is empty") from e
+
+        self._songs = {}
+        self._by_key = {}
+        self._by_title = {}
+        self._load_index()
+
+        self._lock = threading.Lock()
+        self._counters = {'lookups': 0, 'hits': 0, 'searches': 0}
+
+    def _load_index(self):
+        if len(self._map) < len(MAGIC) + FOOTER.size or self._map[:len(MAGIC)] != MAGIC:
+            raise LyricsStoreError(f"{self.path} is not a lyrics store")
+        offset, length, magic = FOOTER.unpack(self._map[-FOOTER.size:])
+        if magic != MAGIC:
+            raise LyricsStoreError(f"{self.path} is truncated")
+        try:
+            index = json.loads(zlib.decompress(self._map[offset:offset + length]))
+        except (zlib.error, ValueError) as e:
+            raise LyricsStoreError(f"{self.path} has a corrupt index") from e
+        if index.get('version') != INDEX_VERSION:
+            raise LyricsStoreError(f"{self.path} has an unsupported index version")
+
+        for row in index['songs']:
+            song = dict(zip(SONG_FIELDS, row))
+            song['_blob'] = (row[-2], row[-1])
+            self._songs[song['id']] = song
+            self._by_key.setdefault(search_key(song['title'], song['artist']), song['id'])
+            self._by_title.setdefault(search_key(song['title']), song['id'])
+        self.catalog = SongCatalog.from_songs(self._songs.values())
+
+    def __len__(self):
+        return len(self._songs)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def ids(self):
+        return list(self._songs)
+
+    def raw(self, song_id):
+        """
+        Returns: (song fields, compressed lyrics bytes), for copying
+        """
+        song = self._songs[song_id]
+        offset, length = song['_blob']
+        return song, self._map[offset:offset + length]
+
+    def get(self, song_id):
+        """
+        Returns: Dictionary with SONG_FIELDS plus 'lyrics', or None
+        """
+        with self._lock:
+            self._counters['lookups'] += 1
+        song = self._songs.get(song_id)
+        if song is None:
+            return None
+        offset, length = song['_blob']
+        result = {field: song[field] for field in SONG_FIELDS}
+        result['lyrics'] = zlib.decompress(self._map[offset:offset + length]).decode('utf-8')
+        with self._lock:
+            self._counters['hits'] += 1
+        return result
+
+    def find(self, title, artist=None):
+        """
+        Song by title and artist (normalized like the lyrics cache keys),
+        falling back to the title alone, then to the best search match
+        Returns: Same as get(), or None
+        """
+        song_id = self._by_key.get(search_key(title, artist))
+        if song_id is None:
+            song_id = self._by_title.get(search_key(title))
+        if song_id is None:
+            matches = self.search(f"{title} {artist or ''}", 1)
+            song_id = matches[0]['id'] if matches else None
+        return self.get(song_id) if song_id is not None else None
+
+    def search(self, query, limit=10):
+        """
+        Returns: Up to limit song dictionaries (SONG_FIELDS), best first
+        """
+        with self._lock:
+            self._counters['searches'] += 1
+        return self.catalog.search(query, limit)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'songs': len(self._songs), 'bytes': len(self._map)}
+
+
+_lyrics_store = None
+_lyrics_store_lock = threading.Lock()
+
+
+def get_lyrics_store():
+    """
+    Return the process-wide LyricsStore at settings.LYRICS_STORE_PATH
+    """
+    global _lyrics_store
+    if _lyrics_store is None:
+        with _lyrics_store_lock:
+            if _lyrics_store is None:
+                from django.conf import settings
+
+                _lyrics_store = LyricsStore(settings.LYRICS_STORE_PATH)
+                register_stats('lyrics_store', _lyrics_store.stats)
+    return _lyrics_store
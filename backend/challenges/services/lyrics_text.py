@@ -0,0 +1,216 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+# Text Genius adds around the lyrics. Each pattern starts with a literal (or
+# is anchored), so the regex engine skips ahead instead of trying it at
+# every position.
+# Page header on the first line: "123 ContributorsTranslationsEspañolSong
+# Title Lyrics", sometimes followed by a description ending in "Read More".
+# Only stripped after the contributor count, so lyrics that merely start
+# with "Translations" keep their first line.
+HEADER_RE = re.compile(
+    r'\s*[\d.,]+K?\s*Contributors?(?:[^\n]*?Lyrics(?:[^\n]*?Read More)?|[^\n]*)'
+)
+# Ad fragments glued to lyric lines
+ADS_RE = re.compile(
+    r'You might also like'
+    r'|See [^\n]{1,80}? LiveGet tickets as low as \$[\d.,]+'
+    r'|Get tickets as low as \$[\d.,]+'
+)
+# Embed counter at the very end ("123Embed")
+EMBED = 'Embed'
+
+
+def strip_artifacts(lyrics):
+    """
+    Returns: lyrics without the Genius page header, ads and embed counter
+    """
+    header = HEADER_RE.match(lyrics)
+    if header:
+        lyrics = lyrics[header.end():]
+    lyrics = ADS_RE.sub('', lyrics)
+    end = lyrics.rstrip()
+    if end.endswith(EMBED):
+        lyrics = end[:-len(EMBED)].rstrip('0123456789')
+    return lyrics
+
+
+WORD_RE = re.compile(r'\S+')
+
+TOKEN_STRIP_RE = re.compile(r"^[^\w']+|[^\w']+$")
+
+
+def normalize_token(word):
+    """Lowercase a word and trim surrounding punctuation"""
+    return TOKEN_STRIP_RE.sub('', word.lower().replace('’', "'"))
+
+
+class LyricsDocument:
+    """
+    Cleaned lyrics plus where every line and word sits in them.
+
+    text is the cleaned lyrics: Genius artifacts removed, every line
+    stripped, runs of blank lines kept as one blank line. Building it takes
+    one pass of strip_artifacts() and one pass over the lines, which records line i
+    as the span line_starts[i]:line_ends[i] of text. Word offsets are added
+    on first use, in one scan of text: word j spans
+    word_starts[j]:word_ends[j], and line i holds words first_word[i] to
+    first_word[i + 1] - 1. Lines, words and snippets are slices of text, so
+    nothing is split again after parsing.
+    """
+
+    __slots__ = (
+        'text', 'line_starts', 'line_ends', '_first_word', '_word_starts', '_word_ends', '_tokens',
+    )
+
+    def __init__(self, lyrics):
+        line_starts, line_ends = array('L'), array('L')
+        parts = []
+        length = 0
+        blank = False
+
+        for line in strip_artifacts(lyrics).split('\n'):
+            line = line.strip()
+            if not line:
+                blank = True
+                continue
+            if parts:
+                separator = '\n\n' if blank else '\n'
+                parts.append(separator)
+                length += len(separator)
+            parts.append(line)
+            line_starts.append(length)
+            length += len(line)
+            line_ends.append(length)
+            blank = False
+
+        self.text = ''.join(parts)
+        self.line_starts = line_starts
+        self.line_ends = line_ends
+        self._first_word = self._word_starts = self._word_ends = self._tokens = None
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    def _index(self, line_index):
+        """
+        Returns: line_index as a non-negative index (negative ones count from
+        the end), or None when there is no such line
+        """
+        count = len(self.line_starts)
+        if line_index < 0:
+            line_index += count
+        return line_index if 0 <= line_index < count else None
+
+    def _index_words(self):
+        if self._first_word is not None:
+            return
+        spans = [match.span() for match in WORD_RE.finditer(self.text)]
+        starts = array('L', [start for start, _ in spans])
+        self._word_ends = array('L', [end for _, end in spans])
+        self._word_starts = starts
+        # Lines are stripped, so a line's first word starts where the line does
+        first_word = array('L', [bisect_left(starts, start) for start in self.line_starts])
+        first_word.append(len(starts))
+        self._first_word = first_word
+
+    @property
+    def first_word(self):
+        self._index_words()
+        return self._first_word
+
+    @property
+    def word_starts(self):
+        self._index_words()
+        return self._word_starts
+
+    @property
+    def word_ends(self):
+        self._index_words()
+        return self._word_ends
+
+    def lines(self):
+        """
+        Returns: List of the non-empty lines
+        """
+        text = self.text
+        return [text[start:end] for start, end in zip(self.line_starts, self.line_ends)]
+
+    def line(self, line_index):
+        """
+        Returns: Text of one line, or None when there is no such line
+        """
+        i = self._index(line_index)
+        return None if i is None else self.text[self.line_starts[i]:self.line_ends[i]]
+
+    def words(self, line_index):
+        """
+        Returns: The words of one line (as str.split() would give them)
+        """
+        line = self.line(line_index)
+        return line.split() if line is not None else []
+
+    def word_offsets(self, line_index):
+        """
+        Returns: [[start, end], ...] of each word relative to the start of its
+        line, as stored in LyricLine.word_offsets
+        """
+        i = self._index(line_index)
+        if i is None:
+            return []
+        first_word = self.first_word
+        base, first, last = self.line_starts[i], first_word[i], first_word[i + 1]
+        return [
+            [start - base, end - base]
+            for start, end in zip(self._word_starts[first:last], self._word_ends[first:last])
+        ]
+
+    def tokens(self, line_index):
+        """
+        Returns: normalize_token() of each word of one line, computed once for
+        the whole document on first use
+        """
+        if self._tokens is None:
+            text = self.text
+            self._tokens = [
+                normalize_token(text[start:end]) for start, end in zip(self.word_starts, self.word_ends)
+            ]
+        i = self._index(line_index)
+        if i is None:
+            return []
+        return self._tokens[self._first_word[i]:self._first_word[i + 1]]
+
+
+# Recently parsed documents, by the text they were parsed from and by their
+# cleaned text. Cached payloads hand out the same str objects, whose hash
+# Python keeps, so repeat lookups cost no rescan of the lyrics.
+DOCUMENT_CACHE_SIZE = 256
+
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+
+
+def lyrics_document(lyrics):
+    """
+    Parse lyrics (raw from Genius, or already cleaned) into a LyricsDocument,
+    reusing the document of a recent call with the same text
+    Returns: LyricsDocument
+    """
+    lyrics = lyrics or ''
+    with _documents_lock:
+        document = _documents.get(lyrics)
+        if document is not None:
+            _documents.move_to_end(lyrics)
+            return document
+
+    document = LyricsDocument(lyrics)
+    with _documents_lock:
+        _documents[lyrics] = document
+        # Cleaning the cleaned text gives it back, so it maps to the same document
+        _documents[document.text] = document
+        while len(_documents) > DOCUMENT_CACHE_SIZE:
+            _documents.popitem(last=False)
+    return document
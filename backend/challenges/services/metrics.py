@@ -0,0 +1,312 @@
+import bisect
+import contextvars
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+
+# Request latency histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'lyriq'
+NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# Stats of the request being handled. asgiref copies the context into
+# sync_to_async threads, so DB queries and upstream calls made for an async
+# view are still counted against it.
+_current = contextvars.ContextVar('lyriq_request_stats', default=None)
+
+
+class RequestStats:
+    """Work done while handling one request"""
+
+    __slots__ = (
+        'queries', 'db_time', 'upstream_calls', 'upstream_errors', 'upstream_time',
+        'cache_hits', 'cache_misses',
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.upstream_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def start_request():
+    """
+    Start collecting stats for the current request
+    Returns: (RequestStats, token for finish_request)
+    """
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def db_timer(execute, sql, params, many, context):
+    """Connection execute wrapper counting queries and their time per request"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver installing db_timer on every connection"""
+    if db_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_timer)
+
+
+def observe_upstream(elapsed, error=None):
+    """Count an upstream (Genius) call against the current request"""
+    stats = _current.get()
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.upstream_time += elapsed
+        if error is not None:
+            stats.upstream_errors += 1
+
+
+def observe_cache(hit):
+    """Count a lyrics cache lookup (fresh hit or miss) against the current request"""
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+class ViewMetrics:
+    __slots__ = (
+        'responses', 'buckets', 'duration', 'queries', 'db_time',
+        'upstream_calls', 'upstream_errors', 'upstream_time', 'cache_hits', 'cache_misses',
+    )
+
+    def __init__(self):
+        self.responses = {}
+        self.buckets = [0] * (len(REQUEST_BUCKETS) + 1)
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.upstream_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    """
+    Per-view request metrics, plus the stats() of every registered component
+    (lyrics cache, upstream client, attempt writer, ...), rendered in the
+    Prometheus text format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._sources = {}
+
+    def register(self, name, stats):
+        """
+        Add a component to the metrics page
+        Args:
+            name: Metric name prefix, e.g. 'lyrics_cache'
+            stats: Callable returning the component's stats() dictionary
+        """
+        with self._lock:
+            self._sources[name] = stats
+
+    def record(self, view, method, status, duration, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            key = (method, status)
+            metrics.responses[key] = metrics.responses.get(key, 0) + 1
+            metrics.buckets[bisect.bisect_left(REQUEST_BUCKETS, duration)] += 1
+            metrics.duration += duration
+            metrics.queries += stats.queries
+            metrics.db_time += stats.db_time
+            metrics.upstream_calls += stats.upstream_calls
+            metrics.upstream_errors += stats.upstream_errors
+            metrics.upstream_time += stats.upstream_time
+            metrics.cache_hits += stats.cache_hits
+            metrics.cache_misses += stats.cache_misses
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """
+        Returns: Every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            views = {
+                view: (dict(m.responses), list(m.buckets), m.duration, m.queries, m.db_time,
+                       m.upstream_calls, m.upstream_errors, m.upstream_time, m.cache_hits, m.cache_misses)
+                for view, m in self._views.items()
+            }
+            sources = dict(self._sources)
+
+        out = _Exposition()
+        out.family('http_requests_total', 'counter', 'Responses by view, method and status', [
+            ({'view': view, 'method': method, 'status': status}, count)
+            for view, data in sorted(views.items())
+            for (method, status), count in sorted(data[0].items())
+        ])
+        out.histogram('http_request_duration_seconds', 'Request latency by view', [
+            ({'view': view}, REQUEST_BUCKETS, data[1], data[2])
+            for view, data in sorted(views.items())
+        ])
+        for name, index, help_text in (
+            ('db_queries_total', 3, 'Database queries by view'),
+            ('db_query_duration_seconds_total', 4, 'Time spent in database queries by view'),
+            ('upstream_calls_total', 5, 'Genius calls (including retries) by view'),
+            ('upstream_errors_total', 6, 'Failed Genius calls by view'),
+            ('upstream_duration_seconds_total', 7, 'Time spent waiting on Genius by view'),
+            ('cache_hits_total', 8, 'Fresh lyrics cache hits by view'),
+            ('cache_misses_total', 9, 'Lyrics cache misses by view'),
+        ):
+            out.family(f'view_{name}', 'counter', help_text, [
+                ({'view': view}, data[index]) for view, data in sorted(views.items())
+            ])
+        # Only views that looked anything up, so the ratio is never 0/0
+        out.family('view_cache_hit_ratio', 'gauge', 'Lyrics cache hit ratio by view', [
+            ({'view': view}, round(data[8] / (data[8] + data[9]), 4))
+            for view, data in sorted(views.items()) if data[8] + data[9]
+        ])
+
+        for name, stats in sorted(sources.items()):
+            try:
+                out.flatten(name, stats())
+            except Exception:
+                logging.getLogger(__name__).exception("Could not collect %s metrics", name)
+        return out.text()
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _is_histogram(value):
+    return isinstance(value, dict) and {'buckets', 'sum', 'count'} <= value.keys()
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines = []
+
+    def _name(self, name):
+        return NAME_RE.sub('_', f'{METRIC_PREFIX}_{name}')
+
+    def family(self, name, kind, help_text, samples):
+        name = self._name(name)
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+    def histogram(self, name, help_text, series):
+        """series: (labels, bucket bounds, per-bucket counts with +Inf last, sum)"""
+        name = self._name(name)
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} histogram')
+        for labels, bounds, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(tuple(bounds) + (float('inf'),), counts):
+                cumulative += count
+                self.lines.append(f'{name}_bucket{_labels({**labels, "le": _number(float(bound))})} {cumulative}')
+            self.lines.append(f'{name}_sum{_labels(labels)} {_number(float(total))}')
+            self.lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+
+    def flatten(self, name, value):
+        """
+        Render a component's stats() dictionary: numbers and booleans become
+        untyped samples, nested dictionaries extend the name, strings become
+        a {state="..."} 1 sample, and {'buckets', 'sum', 'count'} dictionaries
+        (UpstreamClient latency) become histograms
+        """
+        if _is_histogram(value):
+            bounds = [bound for bound, _ in value['buckets'] if not math.isinf(bound)]
+            counts = [count for _, count in value['buckets']]
+            self.histogram(name, f'{name} histogram', [({}, bounds, counts, value['sum'])])
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                self.flatten(f'{name}_{key}', item)
+        elif isinstance(value, str):
+            self.family(name, 'gauge', name, [({'state': value}, 1)])
+        elif isinstance(value, (int, float)):
+            self.family(name, 'untyped', name, [({}, value)])
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    Return the process-wide MetricsRegistry
+    """
+    return _registry
+
+
+def register_stats(name, stats):
+    """Shortcut for get_metrics().register"""
+    _registry.register(name, stats)
+
+
+class SampledLog:
+    """
+    Structured (one JSON object per line) logging of a random fraction of
+    events. Call sites check sampled() before building any fields, so with
+    a rate of 0 (the default) or the logger disabled nothing is formatted.
+
+        if answer_log.sampled():
+            answer_log.emit('answer_submitted', challenge=challenge.id, ...)
+    """
+
+    def __init__(self, logger, rate):
+        self.logger = logger
+        self.rate = rate
+
+    def sampled(self):
+        return (
+            self.rate > 0
+            and (self.rate >= 1 or random.random() < self.rate)
+            and self.logger.isEnabledFor(logging.INFO)
+        )
+
+    def emit(self, event, **fields):
+        self.logger.info(json.dumps({'event': event, **fields}, default=str))
@@ -0,0 +1,193 @@
+import threading
+from abc import ABC, abstractmethod
+
+from decouple import config
+from django.conf import settings
+
+from .upstream import charge_request, request_timeout
+
+# Genius hosts, replaced by GENIUS_BASE_URL (e.g. the genius_standin server)
+API_ROOT = 'https://api.genius.com/'
+PUBLIC_API_ROOT = 'https://genius.com/api/'
+WEB_ROOT = 'https://genius.com/'
+
+
+def genius_roots(base_url=None):
+    """
+    Returns: (API root, public API root, web root) for Genius, or for a
+    stand-in server at base_url serving all three from one host
+    """
+    if base_url is None:
+        base_url = getattr(settings, 'GENIUS_BASE_URL', '')
+    if not base_url:
+        return API_ROOT, PUBLIC_API_ROOT, WEB_ROOT
+    base_url = base_url.rstrip('/') + '/'
+    return base_url, base_url + 'api/', base_url
+
+
+def song_from_hit(song_data):
+    """Song dictionary (catalog SONG_FIELDS) from a Genius search hit result"""
+    return {
+        'id': song_data['id'],
+        'title': song_data['title'],
+        'artist': song_data['primary_artist']['name'],
+        'album': (song_data.get('album') or {}).get('name', 'Unknown'),
+        'release_date': song_data.get('release_date_for_display', 'Unknown'),
+        'thumbnail': song_data.get('song_art_image_thumbnail_url', ''),
+        'url': song_data['url']
+    }
+
+
+class LyricsProvider(ABC):
+    """
+    Where LyricsService gets songs from. Lyrics are returned as the provider
+    has them; cleaning and caching stay in the service.
+
+    remote: Calls go over the network, so the service routes them through
+    its UpstreamClient (circuit breaker, retries, metrics)
+    """
+
+    name = None
+    remote = True
+
+    @abstractmethod
+    def search_songs(self, query):
+        """
+        Returns: List of song dictionaries (id, title, artist, album,
+        release_date, thumbnail, url), best match first
+        """
+
+    @abstractmethod
+    def song(self, song_id):
+        """
+        Returns: Dictionary with id, title, artist, lyrics and url, or None
+        """
+
+    @abstractmethod
+    def search_song(self, title, artist=None):
+        """
+        Best match for a title (and artist)
+        Returns: Same as song()
+        """
+
+
+class GeniusProvider(LyricsProvider):
+    """
+    The Genius API through lyricsgenius (lyrics are scraped from the song
+    page). With base_url, every request goes to that host instead.
+    """
+
+    name = 'genius'
+
+    def __init__(self, api_key=None, base_url=None):
+        # Imported here so that loading this module stays cheap (see get_lyrics_service)
+        import lyricsgenius
+        from requests.adapters import HTTPAdapter
+
+        self.genius = lyricsgenius.Genius(
+            api_key or config('GENIUS_API_KEY'),
+            skip_non_songs=True,
+            excluded_terms=["(Remix)", "(Live)"],
+            remove_section_headers=True,
+            verbose=False,
+            timeout=getattr(settings, 'GENIUS_TIMEOUT', 5.0)
+        )
+        self.genius.API_ROOT, self.genius.PUBLIC_API_ROOT, self.genius.WEB_ROOT = genius_roots(base_url)
+
+        class DeadlineAdapter(HTTPAdapter):
+            # lyricsgenius sends every request with its fixed timeout; inside
+            # UpstreamClient.call() cut it to what is left of the deadline.
+            # One lookup can send several requests, each charged to the budget
+            def send(self, request, timeout=None, **kwargs):
+                timeout = request_timeout(timeout)
+                charge_request()
+                return super().send(request, timeout=timeout, **kwargs)
+
+        # lyricsgenius keeps one requests.Session; give it a keep-alive pool
+        # large enough for every worker thread instead of the default 10
+        adapter = DeadlineAdapter(
+            pool_connections=4,
+            pool_maxsize=getattr(settings, 'GENIUS_MAX_KEEPALIVE', 20),
+        )
+        self.genius._session.mount('https://', adapter)
+        self.genius._session.mount('http://', adapter)
+
+    def search_songs(self, query):
+        response = self.genius.search_songs(query)
+        return [song_from_hit(hit['result']) for hit in response['hits']]
+
+    def song(self, song_id):
+        song = self.genius.song(song_id)
+        if not song or 'song' not in song:
+            return None
+        song_data = song['song']
+        return {
+            'id': song_data['id'],
+            'title': song_data['title'],
+            'artist': song_data['primary_artist']['name'],
+            'lyrics': song_data.get('lyrics', ''),
+            'url': song_data['url']
+        }
+
+    def search_song(self, title, artist=None):
+        song = self.genius.search_song(title, artist or '')
+        if not song:
+            return None
+        return {
+            'id': song.to_dict().get('id'),
+            'title': song.title if hasattr(song, 'title') else title,
+            'artist': song.artist if hasattr(song, 'artist') else artist,
+            'lyrics': song.lyrics,
+            'url': song.url if hasattr(song, 'url') else ''
+        }
+
+
+class LocalProvider(LyricsProvider):
+    """
+    Songs from a local LyricsStore (see the import_lyrics command): no
+    network, no API key, no quota
+    """
+
+    name = 'local'
+    remote = False
+
+    def __init__(self, store):
+        self.store = store
+
+    def search_songs(self, query):
+        return self.store.search(query, 20)
+
+    def song(self, song_id):
+        return self._song(self.store.get(song_id))
+
+    def search_song(self, title, artist=None):
+        return self._song(self.store.find(title, artist))
+
+    def _song(self, song):
+        if song is None:
+            return None
+        return {field: song[field] for field in ('id', 'title', 'artist', 'lyrics', 'url')}
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_lyrics_provider():
+    """
+    Return the provider chosen by settings.LYRICS_PROVIDER ('genius' or 'local')
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = getattr(settings, 'LYRICS_PROVIDER', 'genius')
+                if name == 'local':
+                    from .lyrics_store import get_lyrics_store
+
+                    _provider = LocalProvider(get_lyrics_store())
+                elif name == 'genius':
+                    _provider = GeniusProvider()
+                else:
+                    raise ValueError(f"Unknown LYRICS_PROVIDER {name!r} (expected 'genius' or 'local')")
+    return _provider
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at rate tokens per second up to capacity.
+    Thread-safe; acquire() blocks until a token is free, aacquire() awaits,
+    try_acquire() never waits.
+
+    floor: Tokens a caller must leave in the bucket. Callers with a higher
+    floor are refused earlier as the bucket drains, and get tokens later as
+    it refills (see services.throttling.UpstreamBudget).
+    """
+
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._counters = {'granted': 0, 'denied': 0, 'waited_seconds': 0.0}
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens, floor=0.0):
+        """
+        Returns: 0 when the tokens were taken, else seconds until they will be
+        """
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens - tokens >= floor:
+                self._tokens -= tokens
+                self._counters['granted'] += 1
+                return 0
+            return (tokens + floor - self._tokens) / self.rate
+
+    def _denied(self):
+        with self._lock:
+            self._counters['denied'] += 1
+
+    def _waited(self, seconds):
+        if seconds:
+            with self._lock:
+                self._counters['waited_seconds'] += seconds
+
+    def try_acquire(self, tokens=1, floor=0.0):
+        """
+        Returns: True if the tokens were taken
+        """
+        if self._take(tokens, floor) == 0:
+            return True
+        self._denied()
+        return False
+
+    def acquire(self, tokens=1, timeout=None, stop=None, floor=0.0):
+        """
+        Wait for tokens, giving up after timeout seconds or once the stop
+        Event is set
+        Returns: True if the tokens were taken
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        started = self._clock()
+        while True:
+            wait = self._take(tokens, floor)
+            if wait == 0:
+                break
+            if deadline is not None:
+                wait = min(wait, deadline - self._clock())
+                if wait <= 0:
+                    self._denied()
+                    return False
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+        self._waited(self._clock() - started)
+        return True
+
+    async def aacquire(self, tokens=1, timeout=None, floor=0.0):
+        """
+        acquire() for coroutines: waits with asyncio.sleep
+        Returns: True if the tokens were taken
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        started = self._clock()
+        while True:
+            wait = self._take(tokens, floor)
+            if wait == 0:
+                break
+            if deadline is not None:
+                wait = min(wait, deadline - self._clock())
+                if wait <= 0:
+                    self._denied()
+                    return False
+            await asyncio.sleep(wait)
+
+        self._waited(self._clock() - started)
+        return True
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for work that did not happen"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def time_until(self, tokens=1, floor=0.0):
+        """
+        Returns: Seconds until tokens could be taken (0 if they can be now)
+        """
+        with self._lock:
+            self._refill(self._clock())
+            return max(tokens + floor - self._tokens, 0) / self.rate
+
+    def stats(self):
+        with self._lock:
+            self._refill(self._clock())
+            return {**self._counters, 'tokens': round(self._tokens, 3), 'rate': self.rate}
@@ -0,0 +1,76 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'challenges_challenge_fts'
+
+# bm25 column weights: song_title, artist, original_lyric, genre
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = None
+
+
+def fts_available():
+    """
+    True when the FTS5 index from migration 0009 (rebuilt over the songs
+    and lines in 0011) exists (SQLite with FTS5)
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available
+
+
+def search_terms(query):
+    """Words of a user query, lowercased, at most 10"""
+    return [term.lower() for term in TERM_RE.findall(query)][:10]
+
+
+def match_expression(terms):
+    """
+    FTS5 MATCH expression requiring every term, each as a prefix, so partial
+    words typed into a search box still match ("sha" finds "shape"). Terms are
+    quoted, so FTS operators in user input are taken literally.
+    """
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_challenge_ids(query, limit=20, offset=0):
+    """
+    Rank challenges for a search query.
+    Returns: Challenge ids, best match first (bm25 with FTS5, newest first
+    with the LIKE fallback)
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if fts_available():
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                [match_expression(terms), limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    from challenges.models import Challenge
+
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(line__song__title__icontains=term) | Q(line__song__artist__icontains=term)
+            | Q(line__text__icontains=term) | Q(genre__icontains=term)
+        )
+    return list(
+        Challenge.objects.filter(condition)
+        .order_by('-created_at', '-id')
+        .values_list('id', flat=True)[offset:offset + limit]
+    )
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight upstream call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running block until it finishes and receive the
+    same result, or the same exception. Once the call completes the key is
+    forgotten, so this coalesces in-flight work only and never caches.
+
+    Uses threading primitives, so it covers threaded WSGI workers as well as
+    sync views that Django runs in its thread pool under ASGI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {'calls': 0, 'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless an identical call is already running
+        Returns: The (shared) result of the call
+        """
+        with self._lock:
+            self._counters['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._counters['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        """
+        Returns: Dictionary with total, executed and coalesced call counts
+        and the number of calls currently in flight
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters['in_flight'] = len(self._calls)
+        return counters
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for async views.
+
+    Followers await the leader's future (shielded, so a cancelled follower
+    does not cancel the shared call). Calls are tracked per event loop, since
+    a future cannot be awaited from a different loop; run them on a
+    ServiceLoop to coalesce across requests whatever loop each view runs on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {'calls': 0, 'executed': 0, 'coalesced': 0}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs) unless an identical call is already running
+        Returns: The (shared) result of the call
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+
+        with self._lock:
+            self._counters['calls'] += 1
+            future = self._calls.get(call_key)
+            if future is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                future = loop.create_future()
+                self._calls[call_key] = future
+                self._counters['executed'] += 1
+                leader = True
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(call_key, None)
+
+    def stats(self):
+        """
+        Returns: Dictionary with total, executed and coalesced call counts
+        and the number of calls currently in flight
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters['in_flight'] = len(self._calls)
+        return counters
+
+
+class ServiceLoop:
+    """
+    An event loop running on its own daemon thread, started on first use.
+
+    Under WSGI Django runs every async view in a new event loop that is closed
+    when the view returns, so anything bound to a loop (pooled connections,
+    in-flight futures) would only last one request. Coroutines passed to run()
+    execute here instead, on one loop per process, whichever server runs the
+    views.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name=self.name, daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    async def run(self, coro):
+        """
+        Await coro on the service loop. The caller going away (a cancelled
+        view) does not cancel it, as other callers may be sharing its result.
+        Returns: The result of coro
+        """
+        loop = self._start()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stop(self, cleanup=None, timeout=5.0):
+        """
+        Run the cleanup coroutine function on the loop, then stop and close it
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        if cleanup is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(cleanup(), loop).result(timeout)
+            except Exception as e:
+                logger.warning("Cleanup of %s failed: %s", self.name, e)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
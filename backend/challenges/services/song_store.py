@@ -0,0 +1,224 @@
+import difflib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .cache import search_key
+from .lyrics_text import lyrics_document
+
+
+def split_lines_with_offsets(lyrics):
+    """
+    Split lyrics the same way LyricsService.split_into_lines does and record
+    where each word sits inside its (stripped) line
+    Returns: List of (line_text, [[start, end], ...]) tuples
+    """
+    document = lyrics_document(lyrics)
+    return [(document.line(i), document.word_offsets(i)) for i in range(len(document))]
+
+
+def build_lines(song, lyrics):
+    """Unsaved LyricLine rows for a song's lyrics"""
+    from challenges.models import LyricLine
+
+    return [
+        LyricLine(song=song, index=index, text=text, word_offsets=offsets)
+        for index, (text, offsets) in enumerate(split_lines_with_offsets(lyrics))
+    ]
+
+
+def loose_song(title, artist):
+    """
+    The id-less Song that holds lines of (title, artist) that are not part of
+    stored Genius lyrics: lines of challenges typed in by hand, lines dropped
+    from a song's lyrics since challenges were made from them, and the lines
+    migration 0004 backfilled. find_song() never returns it.
+    Returns: Song, created if needed
+    """
+    from challenges.models import Song
+
+    key = search_key(title, artist)
+    song = Song.objects.filter(lookup_key=key, genius_id__isnull=True).order_by('id').first()
+    if song is None:
+        song = Song.objects.create(title=title or '', artist=artist or '', lookup_key=key)
+    return song
+
+
+def _append_lines(song, lines):
+    """
+    Give lines (unsaved, or rows of another song) the next indices of song
+    and add their text to its lyrics
+    """
+    last = song.lines.aggregate(last=Max('index'))['last']
+    for index, line in enumerate(lines, start=0 if last is None else last + 1):
+        line.song = song
+        line.index = index
+    texts = [line.text for line in lines]
+    song.lyrics = '\n'.join([song.lyrics, *texts] if song.lyrics else texts)
+    song.save(update_fields=['lyrics', 'updated_at'])
+
+
+def loose_line(title, artist, text):
+    """
+    A line of (title, artist) that is not looked up in stored lyrics, e.g.
+    the line of a challenge typed in by hand
+    Returns: LyricLine under loose_song(title, artist), added if needed
+    """
+    from challenges.models import LyricLine
+
+    lines = split_lines_with_offsets(text)
+    text, offsets = lines[0] if lines else ('', [])
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                song = loose_song(title, artist)
+                line = LyricLine.objects.filter(song=song, text=text).first()
+                if line is None:
+                    line = LyricLine(text=text, word_offsets=offsets)
+                    _append_lines(song, [line])
+                    line.save()
+                return line
+        except IntegrityError:
+            # Another request took the same index; look again
+            if attempt == 2:
+                raise
+
+
+def sync_lines(song, lyrics):
+    """
+    Bring a stored song's lines in line with new lyrics. Lines whose text is
+    unchanged keep their row, and with it the challenges made from them, and
+    only move to their new index. Lines that are gone move to the song's
+    loose_song() when challenges use them and are deleted otherwise; new
+    ones are inserted.
+    Returns: (kept, added, removed) line counts
+    """
+    from challenges.models import LyricLine
+
+    old = list(LyricLine.objects.filter(song=song).order_by('index'))
+    new = build_lines(song, lyrics)
+    matcher = difflib.SequenceMatcher(
+        None, [line.text for line in old], [line.text for line in new], autojunk=False
+    )
+    kept = {}
+    for old_start, new_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            kept[old_start + offset] = new_start + offset
+
+    removed = [line.pk for position, line in enumerate(old) if position not in kept]
+    if removed:
+        used = set(
+            LyricLine.objects.filter(pk__in=removed, challenges__isnull=False).values_list('pk', flat=True)
+        )
+        if used:
+            moving = [line for line in old if line.pk in used]
+            _append_lines(loose_song(song.title, song.artist), moving)
+            LyricLine.objects.bulk_update(moving, ['song', 'index'])
+        LyricLine.objects.filter(pk__in=[pk for pk in removed if pk not in used]).delete()
+
+    moved = [(old[position], index) for position, index in kept.items() if old[position].index != index]
+    if moved:
+        # Park moved rows past every index in use first, so no update hits
+        # the (song, index) constraint on a row that has not moved yet
+        shift = len(old) + len(new)
+        for line, index in moved:
+            line.index = index + shift
+        LyricLine.objects.bulk_update([line for line, _ in moved], ['index'])
+        for line, index in moved:
+            line.index = index
+        LyricLine.objects.bulk_update([line for line, _ in moved], ['index'])
+
+    taken = set(kept.values())
+    added = [line for line in new if line.index not in taken]
+    LyricLine.objects.bulk_create(added)
+    return len(kept), len(added), len(removed)
+
+
+def store_song(song_data):
+    """
+    Persist a song returned by LyricsService (keyed by its Genius id) together
+    with its split lines. When the lyrics changed, the stored lines are
+    updated in place (see sync_lines).
+    Returns: The Song, or None when the payload has no Genius id
+    """
+    from challenges.models import LyricLine, Song
+
+    genius_id = song_data.get('id')
+    if not genius_id:
+        return None
+
+    lyrics = song_data.get('lyrics') or ''
+    song = Song.objects.filter(genius_id=genius_id).first()
+    if song is not None and song.lyrics == lyrics:
+        return song
+
+    try:
+        with transaction.atomic():
+            song, created = Song.objects.update_or_create(
+                genius_id=genius_id,
+                defaults={
+                    'title': song_data.get('title') or '',
+                    'artist': song_data.get('artist') or '',
+                    'url': song_data.get('url') or '',
+                    'lyrics': lyrics,
+                    'lookup_key': search_key(song_data.get('title'), song_data.get('artist')),
+                }
+            )
+            if created:
+                LyricLine.objects.bulk_create(build_lines(song, lyrics))
+            else:
+                sync_lines(song, lyrics)
+    except IntegrityError:
+        # Another worker stored the same song concurrently
+        song = Song.objects.get(genius_id=genius_id)
+
+    return song
+
+
+def find_song(title, artist=None):
+    """
+    Find an already stored Genius song by the name a user typed, so creating a
+    challenge for a known song does not need the lyrics service at all
+    Returns: Song or None
+    """
+    from challenges.models import Song
+
+    return (
+        Song.objects
+        .filter(lookup_key=search_key(title, artist), genius_id__isnull=False)
+        .first()
+    )
+
+
+def get_line(song, line_index):
+    """
+    Returns: The song's LyricLine at line_index, or None
+    """
+    from challenges.models import LyricLine
+
+    lines = LyricLine.objects.filter(song=song)
+    if line_index < 0:
+        # Negative indices count from the end, like indexing the split lines
+        line_index += lines.count()
+        if line_index < 0:
+            return None
+    return lines.filter(index=line_index).first()
+
+
+def get_lines(song, line_indices):
+    """
+    Fetch several lines of a song with one query. Negative indices count from
+    the end, as in get_line.
+    Returns: Dictionary mapping each requested index to its LyricLine (or None)
+    """
+    from challenges.models import LyricLine
+
+    lines = LyricLine.objects.filter(song=song)
+    count = lines.count() if any(index < 0 for index in line_indices) else 0
+    wanted = {index: index + count if index < 0 else index for index in line_indices}
+
+    by_index = {
+        line.index: line
+        for line in lines.filter(index__in=[i for i in wanted.values() if i >= 0])
+    }
+    return {index: by_index.get(resolved) for index, resolved in wanted.items()}
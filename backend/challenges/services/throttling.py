@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .metrics import register_stats
+from .ratelimit import TokenBucket
+
+# Who is asking for an upstream call, most important first
+INTERACTIVE = 'interactive'  # a player waiting on a request
+BACKGROUND = 'background'    # challenge jobs: someone polls for the result
+PREFETCH = 'prefetch'        # lyrics warm-up: nobody is waiting
+PRIORITIES = (INTERACTIVE, BACKGROUND, PREFETCH)
+
+# Share of the burst each priority must leave in the budget for the ones
+# above it, so prefetching is shed first and players are served last to go
+RESERVES = {INTERACTIVE: 0.0, BACKGROUND: 0.25, PREFETCH: 0.5}
+
+# Seconds each priority may wait for budget before giving up
+MAX_WAITS = {INTERACTIVE: 1.0, BACKGROUND: 30.0, PREFETCH: 0.0}
+
+_priority = ContextVar('upstream_priority', default=INTERACTIVE)
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def upstream_priority(priority):
+    """
+    Run upstream calls made in the block (in this thread or task) at priority
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown upstream priority {priority!r}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF-style rate string ('30/min', '1000/day')
+    Returns: Requests per second, or None for an empty rate
+    """
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count) / _PERIODS[period.strip()[0]]
+
+
+class UpstreamThrottled(Exception):
+    """Raised instead of calling the upstream when its budget is spent"""
+
+    def __init__(self, retry_after, priority=INTERACTIVE):
+        super().__init__(f"upstream budget spent for {priority} calls, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.priority = priority
+
+
+class UpstreamBudget:
+    """
+    Process-wide allowance of upstream calls: a token bucket refilled at rate
+    calls per second, holding up to burst.
+
+    Every caller spends from the same bucket, but lower priorities must leave
+    RESERVES of it untouched: as the bucket drains, prefetch calls are refused
+    first, then background ones, and interactive calls get the last tokens.
+    Each priority waits up to its max_wait for a token (prefetch does not wait
+    at all) before UpstreamThrottled is raised. Retries are only made from
+    spare budget (spend_retry).
+    """
+
+    def __init__(self, rate, burst=None, max_waits=None, clock=time.monotonic):
+        self.bucket = TokenBucket(rate, burst or rate, clock=clock)
+        self.max_waits = {**MAX_WAITS, **(max_waits or {})}
+        self.floors = {priority: RESERVES[priority] * self.bucket.capacity for priority in PRIORITIES}
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counters = {
+            priority: {'granted': 0, 'shed': 0, 'waited_seconds': 0.0} for priority in PRIORITIES
+        }
+        self._retries = {'granted': 0, 'denied': 0}
+        self._refunded = 0
+
+    def _account(self, priority, granted, waited):
+        with self._lock:
+            counters = self._counters[priority]
+            counters['granted' if granted else 'shed'] += 1
+            counters['waited_seconds'] += waited
+        if not granted:
+            raise UpstreamThrottled(self.bucket.time_until(floor=self.floors[priority]), priority)
+
+    def acquire(self, priority=None):
+        """
+        Take one call from the budget, waiting up to the priority's max_wait
+        Raises: UpstreamThrottled
+        """
+        priority = priority or current_priority()
+        started = self._clock()
+        granted = self.bucket.acquire(timeout=self.max_waits[priority], floor=self.floors[priority])
+        self._account(priority, granted, self._clock() - started)
+
+    async def aacquire(self, priority=None):
+        """
+        acquire() for coroutines
+        Raises: UpstreamThrottled
+        """
+        priority = priority or current_priority()
+        started = self._clock()
+        granted = await self.bucket.aacquire(timeout=self.max_waits[priority], floor=self.floors[priority])
+        self._account(priority, granted, self._clock() - started)
+
+    def spend_retry(self, priority=None):
+        """
+        Take one call for a retry, only if the budget has it to spare right now
+        Returns: True if the retry may go ahead
+        """
+        priority = priority or current_priority()
+        granted = self.bucket.try_acquire(floor=self.floors[priority])
+        with self._lock:
+            self._retries['granted' if granted else 'denied'] += 1
+        return granted
+
+    def refund(self):
+        """Give back a call that was not made (e.g. the circuit was open)"""
+        self.bucket.refund()
+        with self._lock:
+            self._refunded += 1
+
+    def stats(self):
+        bucket = self.bucket.stats()
+        with self._lock:
+            return {
+                'tokens': bucket['tokens'],
+                'rate': bucket['rate'],
+                'capacity': self.bucket.capacity,
+                **{priority: dict(counters) for priority, counters in self._counters.items()},
+                'retries': dict(self._retries),
+                'refunded': self._refunded,
+            }
+
+
+class ClientBuckets:
+    """
+    One TokenBucket per client key (user or IP address), rate requests per
+    second with bursts of up to burst. Only the max_clients most recently
+    seen clients are remembered.
+    """
+
+    def __init__(self, rate, burst=1.0, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'throttled': 0, 'evicted': 0}
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, clock=self._clock)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+                    self._counters['evicted'] += 1
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def allow(self, key):
+        """
+        Returns: 0 if the client may go ahead, else seconds until it may
+        """
+        bucket = self._bucket(key)
+        wait = 0 if bucket.try_acquire() else bucket.time_until()
+        with self._lock:
+            self._counters['allowed' if wait == 0 else 'throttled'] += 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'clients': len(self._buckets), 'rate': self.rate}
+
+
+_upstream_budget = None
+_client_buckets = None
+_throttling_lock = threading.Lock()
+
+
+def get_upstream_budget():
+    """
+    Return the process-wide UpstreamBudget for Genius calls, or None when
+    UPSTREAM_RATE is 0
+    """
+    global _upstream_budget
+    from django.conf import settings
+
+    if settings.UPSTREAM_RATE <= 0:
+        return None
+    if _upstream_budget is None:
+        with _throttling_lock:
+            if _upstream_budget is None:
+                _upstream_budget = UpstreamBudget(
+                    settings.UPSTREAM_RATE,
+                    burst=settings.UPSTREAM_BURST,
+                    max_waits={
+                        INTERACTIVE: settings.UPSTREAM_INTERACTIVE_MAX_WAIT,
+                        BACKGROUND: settings.UPSTREAM_BACKGROUND_MAX_WAIT,
+                    },
+                )
+                register_stats('upstream_budget', _upstream_budget.stats)
+    return _upstream_budget
+
+
+def get_client_buckets():
+    """
+    Return the process-wide per-client buckets behind LyricsClientThrottle,
+    or None when LYRICS_THROTTLE_RATE is empty
+    """
+    global _client_buckets
+    from django.conf import settings
+
+    rate = parse_rate(settings.LYRICS_THROTTLE_RATE)
+    if not rate:
+        return None
+    if _client_buckets is None:
+        with _throttling_lock:
+            if _client_buckets is None:
+                _client_buckets = ClientBuckets(rate, burst=settings.LYRICS_THROTTLE_BURST)
+                register_stats('client_throttle', _client_buckets.stats)
+    return _client_buckets
@@ -0,0 +1,361 @@
+import asyncio
+import bisect
+import contextvars
+import random
+import re
+import threading
+import time
+
+from .metrics import observe_upstream
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# time.monotonic() by which the UpstreamClient.call() running in this context
+# must be done. Providers read it through request_timeout(), as one provider
+# call may make several HTTP requests and the provider object is shared.
+_call_deadline = contextvars.ContextVar('lyriq_upstream_deadline', default=None)
+# HTTP requests sent by the current attempt of a UpstreamClient.call()
+_call_requests = contextvars.ContextVar('lyriq_upstream_requests', default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an upstream call runs out of its time budget"""
+
+
+def _status_code(exc):
+    """
+    Best-effort HTTP status of an upstream error. lyricsgenius reports non-200
+    responses as an AssertionError whose message contains the status code.
+    """
+    response = getattr(exc, 'response', None)
+    code = getattr(response, 'status_code', None)
+    if code is not None:
+        return code
+    match = re.search(r'status code: (\d{3})', str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(exc):
+    """
+    Timeouts, connection failures, 429 and 5xx are worth retrying; anything
+    else (404, bad input, parse errors) will fail the same way again
+    """
+    if isinstance(exc, (DeadlineExceeded, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+
+    # requests / httpx transport errors, matched by name to avoid importing both
+    for cls in type(exc).__mro__:
+        if cls.__name__ in ('Timeout', 'ConnectionError', 'TransportError', 'TimeoutException'):
+            return True
+
+    code = _status_code(exc)
+    return code is not None and (code == 429 or code >= 500)
+
+
+def request_timeout(timeout):
+    """
+    Timeout for one HTTP request made inside UpstreamClient.call(): the
+    client's own timeout, cut down to what is left of the call's deadline
+    Returns: Seconds, or timeout unchanged outside a call
+    Raises: DeadlineExceeded if the deadline has already passed
+    """
+    deadline = _call_deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Upstream call deadline passed")
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def charge_request():
+    """
+    Account for one HTTP request made inside UpstreamClient.call(). The call
+    has paid for the first request of each attempt (the budget token taken on
+    entry, or the one spent on the retry); every further request, e.g. the
+    song info and lyrics page after a search, takes a token of its own.
+    Does nothing outside a call or without a budget.
+    Raises: UpstreamThrottled
+    """
+    requests = _call_requests.get()
+    if requests is None:
+        return
+    requests['sent'] += 1
+    if requests['sent'] > 1 and requests['budget'] is not None:
+        requests['budget'].acquire()
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    closed    -> calls pass; failure_threshold consecutive failures open it
+    open      -> calls are rejected until reset_timeout has passed
+    half_open -> one trial call is let through; success closes the breaker,
+                 failure opens it again
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._counters = {'opened': 0, 'rejected': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """
+        Returns: True if a call may go upstream now
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def release_trial(self):
+        """Give back a half-open trial that ended without an outcome (cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self._counters['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                **self._counters,
+            }
+
+
+class UpstreamClient:
+    """
+    Wraps calls to an upstream API (Genius) with a circuit breaker, per-call
+    deadlines and jittered exponential backoff for idempotent calls.
+
+    With a budget (services.throttling.UpstreamBudget), the budget is charged
+    per HTTP request: every call first takes one token at the caller's
+    priority, and retries only go ahead when the budget has a token to spare.
+    acall() runs one request per call; a call() whose fn sends several pays
+    for the others through charge_request().
+
+    The same client (and so the same breaker) is shared by LyricsService and
+    AsyncLyricsService: call() runs sync functions, acall() awaits coroutines.
+    """
+
+    def __init__(self, name='genius', breaker=None, retries=2, backoff_base=0.2,
+                 backoff_max=2.0, deadline=10.0, budget=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0}
+        self._latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._latency_sum = 0.0
+        self._latency_count = 0
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _admit(self):
+        with self._lock:
+            self._counters['calls'] += 1
+        if not self.breaker.allow():
+            with self._lock:
+                self._counters['short_circuited'] += 1
+            if self.budget is not None:
+                # The call was never made, so it does not count
+                self.budget.refund()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _observe(self, elapsed, error=None):
+        with self._lock:
+            self._latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            self._latency_sum += elapsed
+            self._latency_count += 1
+            if error is not None:
+                self._counters['errors'] += 1
+        observe_upstream(elapsed, error)
+
+    def _should_retry(self, exc, attempt, idempotent, started, deadline):
+        if not idempotent or attempt >= self.retries or not is_retryable(exc):
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() - started + delay >= deadline:
+            return None
+        if self.budget is not None and not self.budget.spend_retry():
+            return None
+        with self._lock:
+            self._counters['retries'] += 1
+        return delay
+
+    def _release_if_interrupted(self, exc):
+        # Exceptions have had their outcome recorded. Cancellation (a
+        # CancelledError in wait_for or the backoff sleep, ServiceLoop.stop())
+        # and interrupts have not, and would leave a half-open breaker
+        # waiting forever on a trial that never reports back.
+        if not isinstance(exc, Exception):
+            self.breaker.release_trial()
+
+    def _record_outcome(self, exc):
+        # Only upstream health problems count against the breaker
+        if exc is None or not is_retryable(exc):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def call(self, fn, *args, idempotent=True, deadline=None, **kwargs):
+        """
+        Call a blocking upstream function. A blocking call cannot be
+        cancelled, so fn's HTTP requests are given what is left of the
+        deadline as their timeout (see request_timeout), and the deadline
+        stops further retries.
+        Returns: Whatever fn returns
+        Raises: UpstreamThrottled, CircuitOpenError, DeadlineExceeded, or
+        whatever fn raises
+        """
+        deadline = self.deadline if deadline is None else deadline
+        started = time.monotonic()
+        if self.budget is not None:
+            self.budget.acquire()
+        self._admit()
+
+        attempt = 0
+        token = _call_deadline.set(started + deadline)
+        requests = {'budget': self.budget, 'sent': 0}
+        requests_token = _call_requests.set(requests)
+        try:
+            while True:
+                attempt_started = time.monotonic()
+                requests['sent'] = 0
+                try:
+                    if attempt_started - started >= deadline:
+                        raise DeadlineExceeded(f"{self.name} call exceeded {deadline}s")
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    self._observe(time.monotonic() - attempt_started, e)
+                    delay = self._should_retry(e, attempt, idempotent, started, deadline)
+                    if delay is None:
+                        self._record_outcome(e)
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+                self._observe(time.monotonic() - attempt_started)
+                self._record_outcome(None)
+                return result
+        except BaseException as e:
+            self._release_if_interrupted(e)
+            raise
+        finally:
+            _call_requests.reset(requests_token)
+            _call_deadline.reset(token)
+
+    async def acall(self, fn, *args, idempotent=True, deadline=None, **kwargs):
+        """
+        Await an upstream coroutine function, cancelling it at the deadline
+        Returns: Whatever the coroutine returns
+        Raises: Same as call()
+        """
+        deadline = self.deadline if deadline is None else deadline
+        started = time.monotonic()
+        if self.budget is not None:
+            await self.budget.aacquire()
+        self._admit()
+
+        attempt = 0
+        try:
+            while True:
+                attempt_started = time.monotonic()
+                remaining = deadline - (attempt_started - started)
+                try:
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"{self.name} call exceeded {deadline}s")
+                    try:
+                        result = await asyncio.wait_for(fn(*args, **kwargs), timeout=remaining)
+                    except asyncio.TimeoutError as e:
+                        raise DeadlineExceeded(f"{self.name} call exceeded {deadline}s") from e
+                except Exception as e:
+                    self._observe(time.monotonic() - attempt_started, e)
+                    delay = self._should_retry(e, attempt, idempotent, started, deadline)
+                    if delay is None:
+                        self._record_outcome(e)
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                self._observe(time.monotonic() - attempt_started)
+                self._record_outcome(None)
+                return result
+        except BaseException as e:
+            self._release_if_interrupted(e)
+            raise
+
+    def stats(self):
+        """
+        Returns: Dictionary with call counters, breaker state and a latency
+        histogram ({'buckets': [(upper_bound, count), ...], 'sum', 'count'})
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            buckets = list(zip(LATENCY_BUCKETS + (float('inf'),), self._latency_buckets))
+            latency = {
+                'buckets': buckets,
+                'sum': round(self._latency_sum, 6),
+                'count': self._latency_count,
+            }
+        counters['breaker'] = self.breaker.stats()
+        counters['latency'] = latency
+        return counters
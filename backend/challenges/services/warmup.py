@@ -0,0 +1,276 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DatabaseError, connection
+
+from .cache import search_key
+from .metrics import register_stats
+from .ratelimit import TokenBucket
+from .throttling import PREFETCH, UpstreamThrottled, upstream_priority
+from .upstream import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# What happened to each planned song in a warm-up run
+OUTCOMES = ('fresh', 'fetched', 'not_found', 'failed', 'skipped')
+
+# Seconds plan() waits for the song catalog snapshot before going without it
+CATALOG_LOAD_TIMEOUT = 30.0
+
+
+def trending_songs(catalog, limit=100, window=60 * 60 * 24):
+    """
+    Songs most likely to be asked for next: the top results of searches made
+    in the last window seconds (SongCatalog.trending) plus the songs with the
+    most challenges, one point per search or challenge
+    Returns: Up to limit (title, artist) pairs, most in demand first
+    """
+    from django.db.models import Count
+
+    from challenges.models import Challenge
+
+    # search key -> [points, title, artist]
+    demand = {}
+
+    def count(title, artist, points):
+        if title:
+            entry = demand.setdefault(search_key(title, artist), [0, title, artist])
+            entry[0] += points
+
+    for song, searches in catalog.trending(since=time.time() - window, limit=limit):
+        count(song['title'], song['artist'], searches)
+
+    try:
+        rows = (
+            Challenge.objects
+            .values('line__song__title', 'line__song__artist')
+            .annotate(challenges=Count('id'))
+            .order_by('-challenges')[:limit]
+        )
+        for row in rows:
+            count(row['line__song__title'], row['line__song__artist'], row['challenges'])
+    except DatabaseError:
+        logger.exception("Could not count challenges per song for the lyrics warm-up")
+
+    ranked = sorted(demand.values(), key=lambda entry: -entry[0])
+    return [(title, artist) for _, title, artist in ranked[:limit]]
+
+
+class LyricsWarmer:
+    """
+    Fetches in-demand songs into the lyrics cache before players ask for them.
+
+    Songs are fetched through LyricsService on a bounded thread pool. Songs
+    whose cache entry has more than refresh_margin seconds left are skipped;
+    the others are fetched again, so popular entries are renewed before
+    they expire instead of missing once a day. Upstream fetches share a token
+    bucket of rate songs per minute, and a run stops fetching while the
+    Genius circuit breaker is open. Fetches run at PREFETCH priority, so when
+    the shared upstream budget runs low they are skipped before any player
+    request is delayed.
+    """
+
+    def __init__(self, service, workers=4, rate=60.0, refresh_margin=60 * 60 * 2,
+                 limit=100, window=60 * 60 * 24):
+        self.service = service
+        self.workers = workers
+        self.refresh_margin = refresh_margin
+        self.limit = limit
+        self.window = window
+        self.budget = TokenBucket(rate / 60.0)
+
+        self._stop = threading.Event()
+        # One run at a time per process (scheduler and command alike)
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {'runs': 0, **dict.fromkeys(OUTCOMES, 0)}
+        self._last_run = None
+
+    def plan(self, limit=None):
+        """
+        Returns: (title, artist) pairs to warm, most in demand first
+        """
+        # Recent searches come from the catalog snapshot in a fresh process
+        self.service.catalog.wait_loaded(CATALOG_LOAD_TIMEOUT)
+        return trending_songs(self.service.catalog, limit or self.limit, self.window)
+
+    def run(self, limit=None):
+        """
+        Plan and warm in one go
+        Returns: Same as warm()
+        """
+        return self.warm(self.plan(limit))
+
+    def warm(self, songs):
+        """
+        Make sure each (title, artist) pair is cached and not about to expire
+        Returns: Dictionary with a count per OUTCOMES entry plus 'seconds',
+        or None if another run is in progress
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.monotonic()
+            result = dict.fromkeys(OUTCOMES, 0)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lyrics-warmup') as pool:
+                try:
+                    for outcome in pool.map(self._warm_one, songs):
+                        result[outcome] += 1
+                except BaseException:
+                    # Let queued songs drain as 'skipped' instead of fetching them
+                    self._stop.set()
+                    raise
+            result['seconds'] = round(time.monotonic() - started, 3)
+
+            with self._lock:
+                self._counters['runs'] += 1
+                for outcome in OUTCOMES:
+                    self._counters[outcome] += result[outcome]
+                self._last_run = dict(result, finished=time.time())
+            return result
+        finally:
+            self._run_lock.release()
+
+    def _upstream_open(self):
+        service = self.service
+        return service.provider.remote and service.upstream.breaker.state == CircuitBreaker.OPEN
+
+    def _warm_one(self, song):
+        title, artist = song
+        try:
+            if self._stop.is_set():
+                return 'skipped'
+            left = self.service.cache.expires_in(search_key(title, artist))
+            if left is not None and left > self.refresh_margin:
+                return 'fresh'
+            if self.service.provider.remote:
+                if self._upstream_open() or not self.budget.acquire(stop=self._stop):
+                    return 'skipped'
+                # The breaker may have opened while we waited for the budget
+                if self._upstream_open():
+                    return 'skipped'
+
+            try:
+                with upstream_priority(PREFETCH):
+                    result = self.service.refresh_lyrics_by_search(title, artist)
+            except UpstreamThrottled:
+                return 'skipped'
+            except Exception as e:
+                logger.warning("Lyrics warm-up could not fetch %s by %s: %s", title, artist, e)
+                return 'failed'
+            return 'fetched' if result and result.get('lyrics') else 'not_found'
+        finally:
+            # Pool threads are discarded after the run; so is their connection
+            connection.close()
+
+    def stop(self):
+        """Skip whatever is left of the current run, and of any later one"""
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'last_run': dict(self._last_run) if self._last_run else {},
+                'budget': self.budget.stats(),
+            }
+
+
+class WarmupScheduler:
+    """
+    Runs LyricsWarmer.run() every interval seconds from a daemon thread. The
+    first run starts after a random delay of up to jitter seconds, so server
+    workers started together do not plan and fetch at the same moment (the
+    ones that come later find the shared cache tier already warm).
+
+    Without a warmer, get_lyrics_warmer() is called on the first run, so
+    starting the scheduler does not build a Genius client.
+    """
+
+    def __init__(self, warmer=None, interval=15 * 60.0, jitter=60.0):
+        self.warmer = warmer
+        self.interval = interval
+        self.jitter = jitter
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='lyrics-warmup-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self.warmer is not None:
+            self.warmer.stop()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = random.uniform(0, min(self.interval, self.jitter))
+        while not self._stopped.wait(delay):
+            try:
+                if self.warmer is None:
+                    self.warmer = get_lyrics_warmer()
+                result = self.warmer.run()
+                if result:
+                    logger.info("Lyrics warm-up: %s", result)
+            except Exception:
+                logger.exception("Lyrics warm-up run failed")
+            finally:
+                connection.close()
+            delay = self.interval
+
+
+_lyrics_warmer = None
+_warmup_scheduler = None
+_lyrics_warmer_lock = threading.Lock()
+
+
+def get_lyrics_warmer():
+    """
+    Return the process-wide LyricsWarmer, configured from the WARMUP_* settings
+    """
+    global _lyrics_warmer
+    if _lyrics_warmer is None:
+        from django.conf import settings
+
+        from .lyrics_service import get_lyrics_service
+
+        service = get_lyrics_service()
+        with _lyrics_warmer_lock:
+            if _lyrics_warmer is None:
+                _lyrics_warmer = LyricsWarmer(
+                    service,
+                    workers=settings.WARMUP_WORKERS,
+                    rate=settings.WARMUP_RATE,
+                    refresh_margin=settings.WARMUP_REFRESH_MARGIN,
+                    limit=settings.WARMUP_LIMIT,
+                    window=settings.WARMUP_WINDOW,
+                )
+                register_stats('warmup', _lyrics_warmer.stats)
+    return _lyrics_warmer
+
+
+def start_warmup_scheduler():
+    """
+    Start the in-process warm-up scheduler if settings.WARMUP_SCHEDULER is
+    on. Called by the WSGI/ASGI entry points, so management commands and
+    tests never start it.
+    Returns: The WarmupScheduler, or None when it is disabled
+    """
+    global _warmup_scheduler
+    from django.conf import settings
+
+    if not settings.WARMUP_SCHEDULER:
+        return None
+    with _lyrics_warmer_lock:
+        if _warmup_scheduler is None:
+            _warmup_scheduler = WarmupScheduler(interval=settings.WARMUP_INTERVAL).start()
+    return _warmup_scheduler
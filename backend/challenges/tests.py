@@ -1,3 +1,1690 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+import asyncio
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import string
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from difflib import SequenceMatcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.db.models import Exists, OuterRef
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from users.models import UserProfile
+
+from .models import Challenge, ChallengeAttempt, ChallengeJob, LyricLine, LyricsCacheEntry, ScoreBucket, Song
+from .renderers import FastJSONRenderer
+from .services.answer_matching import answers_match, compact, normalize
+from .services.async_lyrics_service import AsyncLyricsService
+from .services.attempt_writer import AttemptWriter
+from .services.cache import LyricsCache, search_key
+from .services.challenge_generator import generate_candidates
+from .services.challenge_jobs import ChallengeJobQueue
+from .services.catalog import SongCatalog
+from .services.genius_standin import GeniusStandIn
+from .services.leaderboard import Leaderboard, Leaderboards, period_start
+from .services.lyrics_service import LyricsService
+from .services.lyrics_store import LyricsStore, LyricsStoreWriter
+from .services.lyrics_text import LyricsDocument, lyrics_document
+from .services.metrics import SampledLog, finish_request, get_metrics, start_request
+from .services.providers import GeniusProvider, LocalProvider, LyricsProvider
+from .services import search
+from .services.ratelimit import TokenBucket
+from .services.singleflight import AsyncSingleFlight, ServiceLoop, SingleFlight
+from .services.song_store import loose_line, split_lines_with_offsets, store_song
+from .services.throttling import (
+    BACKGROUND, INTERACTIVE, PREFETCH, ClientBuckets, UpstreamBudget, UpstreamThrottled, upstream_priority,
+)
+from .services.upstream import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamClient, request_timeout,
+)
+from .services.warmup import LyricsWarmer
+from .throttling import LyricsClientThrottle
+from .serializers import (
+    CHALLENGE_DETAIL_VALUES, CHALLENGE_VALUES,
+    ChallengeDetailSerializer, ChallengeSerializer, challenge_rows,
+)
+
+# Latest migration creating the search index and its triggers
+search_migration = importlib.import_module('challenges.migrations.0012_challenge_drop_text')
+
+
+def make_challenges(count, creators):
+    text = 'I am in love with the shape of you'
+    [(_, offsets)] = split_lines_with_offsets(text)
+    songs = Song.objects.bulk_create([
+        Song(title=f'Song {i}', artist='Artist', lyrics=text, lookup_key=search_key(f'Song {i}', 'Artist'))
+        for i in range(count)
+    ])
+    lines = LyricLine.objects.bulk_create([
+        LyricLine(song=song, index=0, text=text, word_offsets=offsets) for song in songs
+    ])
+    Challenge.objects.bulk_create([
+        Challenge(
+            creator=creators[i % len(creators)],
+            line=line,
+            blank_start=6,
+            correct_answer='shape',
+        )
+        for i, line in enumerate(lines)
+    ])
+
+
+class ChallengeListQueryTests(TestCase):
+    """
+    A list page must cost the same number of queries whatever the table size
+    (no per-row creator lookup, no COUNT over the table)
+    """
+
+    def setUp(self):
+        self.creators = [User.objects.create_user(f'creator{i}') for i in range(10)]
+
+    def list_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_page_uses_constant_queries(self):
+        make_challenges(5, self.creators)
+        small, _ = self.list_queries('/api/challenges/')
+
+        make_challenges(300, self.creators)
+        large, data = self.list_queries('/api/challenges/')
+
+        self.assertEqual(small, 1)
+        self.assertEqual(large, small)
+        self.assertEqual(len(data['results']), 50)
+        self.assertTrue(data['results'][0]['creator_name'].startswith('creator'))
+
+    def test_cursor_walks_every_challenge_once(self):
+        make_challenges(120, self.creators)
+
+        seen = []
+        url = '/api/challenges/?page_size=50'
+        while url:
+            queries, data = self.list_queries(url)
+            self.assertEqual(queries, 1)
+            seen.extend(challenge['id'] for challenge in data['results'])
+            url = data['next']
+
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(set(seen), set(Challenge.objects.values_list('id', flat=True)))
+
+    def test_my_challenges_page_uses_constant_queries(self):
+        make_challenges(200, self.creators)
+        self.client.force_login(self.creators[0])
+
+        queries, data = self.list_queries('/api/challenges/my_challenges/')
+
+        # Session and user lookups, then the page itself
+        self.assertLessEqual(queries, 3)
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual({c['creator_name'] for c in data['results']}, {'creator0'})
+
+
+class FastReadPathTests(TestCase):
+    """
+    challenge_rows + FastJSONRenderer must render exactly what the
+    ModelSerializers + JSONRenderer did
+    """
+
+    def setUp(self):
+        creator = User.objects.create_user('creator')
+        make_challenges(3, [creator])
+        Song.objects.filter(title='Song 1').update(title='Beyoncé “Halo” \u2028 line')
+        Challenge.objects.filter(line__song__title__startswith='Beyonc').update(genre='R&B </script>')
+
+    def test_list_json_is_identical(self):
+        queryset = Challenge.objects.select_related('creator', 'line__song').order_by('id')
+        old = JSONRenderer().render(ChallengeSerializer(queryset, many=True).data)
+        new = FastJSONRenderer().render(challenge_rows(queryset.values(*CHALLENGE_VALUES)))
+        self.assertEqual(new, old)
+
+    def test_detail_json_is_identical(self):
+        challenge = Challenge.objects.get(line__song__title__startswith='Beyonc')
+        response = self.client.get(f'/api/challenges/{challenge.id}/')
+        self.assertEqual(response.content, JSONRenderer().render(ChallengeDetailSerializer(challenge).data))
+
+        rows = Challenge.objects.filter(id=challenge.id).values(*CHALLENGE_DETAIL_VALUES)
+        self.assertEqual(challenge_rows(rows, detail=True), [ChallengeDetailSerializer(challenge).data])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class HotQueryPlanTests(TestCase):
+    """
+    Every hot query must be answered from an index: no full table scan and
+    no separate sort step
+    """
+
+    # "SCAN <table>" without an index, or a sort the index can't provide
+    FULL_SCAN_RE = re.compile(r'\bSCAN \w+\b(?! USING)')
+    TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('player')
+        make_challenges(20, [cls.user])
+        cls.challenge = Challenge.objects.first()
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(self.FULL_SCAN_RE.search(plan), f"Full scan in:\n{plan}")
+        self.assertNotIn(self.TEMP_SORT, plan, f"Sort without index in:\n{plan}")
+
+    def test_challenge_list_page(self):
+        self.assertUsesIndex(Challenge.objects.order_by('-created_at', '-id')[:51])
+        cursor_time = self.challenge.created_at
+        self.assertUsesIndex(
+            Challenge.objects.filter(created_at__lt=cursor_time).order_by('-created_at', '-id')[:51]
+        )
+
+    def test_my_challenges(self):
+        self.assertUsesIndex(
+            Challenge.objects.filter(creator=self.user).order_by('-created_at', '-id')[:51]
+        )
+
+    def test_challenges_by_genre(self):
+        self.assertUsesIndex(Challenge.objects.filter(genre='Pop').order_by('-created_at')[:50])
+
+    def test_attempts_by_user_and_challenge(self):
+        self.assertUsesIndex(
+            ChallengeAttempt.objects.filter(user=self.user, challenge=self.challenge).order_by()
+        )
+        self.assertUsesIndex(
+            ChallengeAttempt.objects.filter(
+                is_correct=True, user_id__in=[self.user.id], challenge_id__in=[self.challenge.id]
+            ).order_by().values_list('user_id', 'challenge_id')
+        )
+
+    def test_solves_per_challenge(self):
+        self.assertUsesIndex(
+            ChallengeAttempt.objects.filter(challenge=self.challenge, is_correct=True).order_by()
+        )
+
+    def test_leaderboard(self):
+        self.assertUsesIndex(UserProfile.objects.order_by('-total_score')[:10])
+
+    def test_random_unplayed_challenge(self):
+        played = ChallengeAttempt.objects.filter(user=self.user, challenge=OuterRef('pk'))
+        self.assertUsesIndex(
+            Challenge.objects.filter(id__gte=self.challenge.id)
+            .exclude(Exists(played)).order_by('id')[:1]
+        )
+
+
+class ChallengeSearchTests(TestCase):
+    """
+    FTS5 search: bm25 ranking, prefix terms, user input taken literally and
+    the index following updates and deletes; plus the LIKE fallback
+    """
+
+    def setUp(self):
+        creator = User.objects.create_user('creator')
+        rows = [
+            ('Love Story', 'Taylor Swift', "We were both young when I first saw you", 'Country'),
+            ('Halo', 'Beyoncé', "Remember those walls I built, baby love", 'Pop'),
+            ('Shape of You', 'Ed Sheeran', "I'm in love with the shape of you", 'Pop'),
+        ]
+        self.ids = [
+            Challenge.objects.create(
+                creator=creator, genre=genre, line=loose_line(title, artist, lyric), correct_answer='love',
+            ).id
+            for title, artist, lyric, genre in rows
+        ]
+
+    def search(self, q, **params):
+        response = self.client.get('/api/challenges/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_ranking_and_prefixes(self):
+        self.assertTrue(search.fts_available())
+        # A title match outranks lyric matches
+        self.assertEqual(self.search('love')[0], self.ids[0])
+        self.assertEqual(self.search('sha'), [self.ids[2]])
+        self.assertEqual(self.search('beyonce POP'), [self.ids[1]])
+        self.assertEqual(self.search('love', limit=1, offset=1), [self.search('love')[1]])
+
+    def test_operators_are_literal(self):
+        # Quotes, stars and brackets are dropped; OR, NOT, NEAR and column
+        # filters become words that must appear
+        for query in ('"halo', 'halo*', '(halo)', 'halo^'):
+            self.assertEqual(self.search(query), [self.ids[1]], query)
+        for query in ('love OR halo', 'love NOT halo', 'NEAR(love halo)', 'genre:pop', '"*"'):
+            self.assertEqual(self.search(query), [], query)
+
+    def test_index_follows_updates_and_deletes(self):
+        Song.objects.filter(title='Halo').update(title='Crazy in Love')
+        self.assertEqual(search.search_challenge_ids('halo'), [])
+        self.assertEqual(search.search_challenge_ids('crazy'), [self.ids[1]])
+
+        Challenge.objects.filter(id=self.ids[2]).delete()
+        self.assertEqual(search.search_challenge_ids('sheeran'), [])
+
+    def test_triggers_exist(self):
+        # A migration that rebuilds one of the tables drops its triggers
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertLessEqual(set(search_migration.TRIGGERS), triggers)
+
+    def test_index_follows_lines_moving_songs(self):
+        song = store_song({'id': 7, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Everywhere I am looking now'})
+        challenge = Challenge.objects.create(
+            creator=User.objects.get(username='creator'), line=song.lines.get(), correct_answer='Everywhere',
+        )
+        self.assertEqual(search.search_challenge_ids('everywhere'), [challenge.id])
+
+        # The line drops out of the lyrics and moves to the loose song
+        store_song({'id': 7, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls'})
+        self.assertEqual(search.search_challenge_ids('everywhere halo'), [challenge.id])
+
+    def test_like_fallback(self):
+        original = search._fts_available
+        search._fts_available = False
+        self.addCleanup(setattr, search, '_fts_available', original)
+
+        # Newest first, every term required
+        self.assertEqual(self.search('love'), self.ids[::-1])
+        self.assertEqual(self.search('pop halo'), [self.ids[1]])
+        self.assertEqual(self.search('love OR "halo'), [])
+
+
+class RandomChallengeTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('player')
+        make_challenges(30, [self.user])
+        self.client.force_login(self.user)
+
+    def test_skips_attempted_challenges(self):
+        ids = list(Challenge.objects.order_by('id').values_list('id', flat=True))
+        ChallengeAttempt.objects.bulk_create([
+            ChallengeAttempt(user=self.user, challenge_id=challenge_id, answer_submitted='x', is_correct=False)
+            for challenge_id in ids[:-2]
+        ])
+
+        served = set()
+        for _ in range(20):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/challenges/random/')
+            self.assertEqual(response.status_code, 200)
+            served.add(response.json()['id'])
+            # Session and user lookups, the id bounds, at most two probes
+            self.assertLessEqual(len(queries), 5)
+        self.assertLessEqual(served, set(ids[-2:]))
+
+        response = self.client.get(f'/api/challenges/random/?exclude={ids[-2]},{ids[-1]}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_genre_filter_and_anonymous_players(self):
+        challenge = Challenge.objects.order_by('id').first()
+        Challenge.objects.filter(id=challenge.id).update(genre='Jazz')
+        self.client.logout()
+
+        response = self.client.get('/api/challenges/random/?genre=jazz')
+        self.assertEqual(response.json()['id'], challenge.id)
+        self.assertEqual(self.client.get('/api/challenges/random/?exclude=a').status_code, 400)
+
+
+class ConditionalRequestTests(TestCase):
+    """
+    Unchanged challenges are answered with a 304 from the page query alone
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user('creator')
+        make_challenges(5, [self.creator])
+
+    def revalidate(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        return response, len(queries)
+
+    def test_list_revalidation(self):
+        first = self.client.get('/api/challenges/')
+        etag = first['ETag']
+        self.assertIn('public', first['Cache-Control'])
+
+        response, queries = self.revalidate('/api/challenges/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(queries, 1)
+
+        challenge = Challenge.objects.first()
+        challenge.genre = 'Pop'
+        challenge.save()
+        response, _ = self.revalidate('/api/challenges/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        Challenge.objects.filter(id=challenge.id).delete()
+        self.assertNotEqual(self.client.get('/api/challenges/')['ETag'], response['ETag'])
+
+    def test_detail_revalidation(self):
+        challenge = Challenge.objects.first()
+        url = f'/api/challenges/{challenge.id}/'
+        first = self.client.get(url)
+
+        response, queries = self.revalidate(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 1)
+
+        response, _ = self.revalidate(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # The browsable API is a different representation of the same row
+        html = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertNotEqual(html['ETag'], first['ETag'])
+
+    def test_my_challenges_are_private(self):
+        self.client.force_login(self.creator)
+        response = self.client.get('/api/challenges/my_challenges/')
+        self.assertIn('private', response['Cache-Control'])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        get_metrics().reset()
+        make_challenges(3, [User.objects.create_user('creator')])
+
+    def sample(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(' ', 1)[1])
+        self.fail(f"No {line_start} sample in:\n{text}")
+
+    def test_per_view_metrics(self):
+        for _ in range(3):
+            self.client.get('/api/challenges/')
+        self.client.get('/api/challenges/999999/')
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+
+        view = 'view="challenge-list"'
+        self.assertEqual(self.sample(text, f'lyriq_http_requests_total{{{view},method="GET",status="200"}}'), 3)
+        self.assertEqual(self.sample(text, 'lyriq_http_requests_total{view="challenge-detail",method="GET",status="404"}'), 1)
+        self.assertEqual(self.sample(text, f'lyriq_http_request_duration_seconds_bucket{{{view},le="+Inf"}}'), 3)
+        self.assertEqual(self.sample(text, f'lyriq_http_request_duration_seconds_count{{{view}}}'), 3)
+        self.assertEqual(self.sample(text, f'lyriq_view_db_queries_total{{{view}}}'), 3)
+        self.assertGreater(self.sample(text, f'lyriq_view_db_query_duration_seconds_total{{{view}}}'), 0)
+
+    def test_per_view_cache_hit_ratio(self):
+        cache = LyricsCache(persistent=False)
+        cache.set('song:1', {'id': 1})
+        for view, keys in (('lyrics-by-id', ['song:1', 'song:1', 'song:1', 'song:2']),
+                           ('lyrics-search', ['song:3'])):
+            stats, token = start_request()
+            for key in keys:
+                cache.get(key)
+            finish_request(token)
+            get_metrics().record(view, 'GET', 200, 0.01, stats)
+        get_metrics().record('challenge-list', 'GET', 200, 0.01, start_request()[0])
+
+        text = get_metrics().render()
+        self.assertEqual(self.sample(text, 'lyriq_view_cache_hits_total{view="lyrics-by-id"}'), 3)
+        self.assertEqual(self.sample(text, 'lyriq_view_cache_misses_total{view="lyrics-by-id"}'), 1)
+        self.assertEqual(self.sample(text, 'lyriq_view_cache_hit_ratio{view="lyrics-by-id"}'), 0.75)
+        self.assertEqual(self.sample(text, 'lyriq_view_cache_hit_ratio{view="lyrics-search"}'), 0)
+        # A view that never touched the cache has no ratio
+        self.assertNotIn('lyriq_view_cache_hit_ratio{view="challenge-list"}', text)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_only_staff_outside_debug(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user('player'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+        self.client.logout()
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+    def test_sampled_log(self):
+        logger = logging.getLogger('challenges.tests.sampled')
+        self.assertFalse(SampledLog(logger, 0).sampled())
+
+        log = SampledLog(logger, 1)
+        with self.assertLogs(logger, 'INFO') as logs:
+            self.assertTrue(log.sampled())
+            log.emit('answer_submitted', challenge=1, is_correct=True)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {
+            'event': 'answer_submitted', 'challenge': 1, 'is_correct': True,
+        })
+
+
+class LyricsCacheTests(TestCase):
+    """Expiry, stale fallback and pruning of the two cache tiers"""
+
+    def test_memory_tier_is_lru_with_ttl(self):
+        cache = LyricsCache(max_entries=2, persistent=False)
+        cache.set(['search:halo|beyonce', 'song:2'], {'id': 2})
+        cache.set('song:3', {'id': 3}, ttl=-1)
+        cache.get('song:2')
+        cache.set('song:4', {'id': 4})
+
+        # song:3 pushed out the search key, then song:4 pushed out song:3,
+        # which had not been used since song:2 was read
+        self.assertIsNone(cache.get('search:halo|beyonce'))
+        self.assertEqual(cache.get('song:2'), {'id': 2})
+        self.assertIsNone(cache.get('song:3'))
+        self.assertEqual(cache.get('song:4'), {'id': 4})
+        stats = cache.stats()
+        self.assertEqual(
+            (stats['memory_hits'], stats['misses'], stats['evictions'], stats['memory_entries']), (3, 2, 2, 2)
+        )
+
+    def test_persistent_tier_is_shared_and_expires(self):
+        LyricsCache().set('song:1', {'id': 1})
+        LyricsCache().set('song:2', {'id': 2}, ttl=-1)
+
+        cache = LyricsCache()
+        self.assertEqual(cache.get('song:1'), {'id': 1})
+        self.assertEqual(cache.get('song:1'), {'id': 1})
+        self.assertIsNone(cache.get('song:2'))
+        self.assertEqual(cache.get('song:2', allow_stale=True), {'id': 2})
+        stats = cache.stats()
+        self.assertEqual((stats['persistent_hits'], stats['memory_hits'], stats['stale_hits']), (1, 1, 1))
+
+    def test_prune_keeps_stale_rows_within_grace(self):
+        cache = LyricsCache(max_entries=1, persistent_max_entries=2, stale_grace=3600)
+        cache.set('song:1', {'id': 1}, ttl=-60)
+        cache.set('song:2', {'id': 2}, ttl=-7200)
+        self.assertEqual(cache.prune(), 1)
+
+        # Only the table can still have song:1 (the memory tier holds song:2)
+        cache.clear()
+        self.assertIsNone(cache.get('song:1'))
+        self.assertEqual(cache.get('song:1', allow_stale=True), {'id': 1})
+
+        cache.set('song:3', {'id': 3})
+        cache.set('song:4', {'id': 4})
+        self.assertEqual(cache.prune(), 1)
+        self.assertEqual(
+            sorted(LyricsCacheEntry.objects.values_list('key', flat=True)), ['song:3', 'song:4']
+        )
+
+
+class SingleFlightTests(SimpleTestCase):
+    """
+    Concurrent calls with the same key run once and share the result or the
+    exception; nothing is kept once the call is done
+    """
+
+    def call_concurrently(self, flight, fn, count=4):
+        release = threading.Event()
+        results = []
+
+        def blocked():
+            release.wait(5)
+            return fn()
+
+        def call():
+            try:
+                results.append(flight.do('song', blocked))
+            except Exception as e:
+                results.append(type(e).__name__)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        # Let the leader finish only once every caller has joined the call
+        while flight.stats()['calls'] < count:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_followers_share_the_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return 'lyrics'
+
+        self.assertEqual(self.call_concurrently(flight, fetch), ['lyrics'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.do('song', fetch), 'lyrics')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight.stats(), {'calls': 5, 'executed': 2, 'coalesced': 3, 'in_flight': 0})
+
+    def test_followers_share_the_exception(self):
+        def fetch():
+            raise TimeoutError()
+
+        self.assertEqual(self.call_concurrently(SingleFlight(), fetch), ['TimeoutError'] * 4)
+
+
+class LocalLyricsTests(SimpleTestCase):
+    """
+    NDJSON import into the local store, served directly (LocalProvider) and
+    through the Genius stand-in server
+    """
+
+    SONGS = [
+        {'id': 1, 'title': 'Shape of You', 'primary_artist': {'name': 'Ed Sheeran'},
+         'lyrics': "[Chorus]\nI'm in love with the shape of you\nWe push and pull like a magnet do"},
+        {'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls I built'},
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'lyrics.bin')
+        self.dump = os.path.join(tmp.name, 'dump.ndjson')
+        self.import_songs(self.SONGS + [{'id': 3, 'title': 'No lyrics'}])
+
+    def import_songs(self, songs, *args):
+        with open(self.dump, 'w') as f:
+            f.write('\n'.join(json.dumps(song) for song in songs) + '\n')
+        call_command('import_lyrics', self.dump, '--store', self.path, *args,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+    def service(self, provider):
+        return LyricsService(cache=LyricsCache(persistent=False), catalog=SongCatalog(), provider=provider)
+
+    def open_store(self):
+        store = LyricsStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_import_and_local_provider(self):
+        self.import_songs([{'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Halo, halo'}], '--append')
+        store = self.open_store()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get(2)['lyrics'], 'Halo, halo')
+
+        service = self.service(LocalProvider(store))
+        song = service.get_lyrics_by_search('shape of you', 'ed sheeran')
+        self.assertEqual(song['lyrics'], "I'm in love with the shape of you\nWe push and pull like a magnet do")
+        self.assertEqual([s['id'] for s in service.search_songs('beyonce')], [2])
+
+    def test_providers_implement_every_method(self):
+        class SearchOnly(LyricsProvider):
+            def search_songs(self, query):
+                return []
+
+        self.assertRaises(TypeError, SearchOnly)
+        self.assertIsInstance(LocalProvider(self.open_store()), LyricsProvider)
+
+    def test_standin_serves_genius_clients(self):
+        standin = GeniusStandIn(self.open_store(), port=0).start()
+        self.addCleanup(standin.shutdown)
+
+        service = self.service(GeniusProvider(api_key='test', base_url=standin.url))
+        self.assertEqual(service.search_songs('shape')[0]['title'], 'Shape of You')
+        song = service.get_lyrics_by_search('Shape of You', 'Ed Sheeran')
+        self.assertEqual((song['id'], song['artist']), (1, 'Ed Sheeran'))
+        self.assertEqual(song['lyrics'], "I'm in love with the shape of you\nWe push and pull like a magnet do")
+
+    def test_async_service_outlives_view_loops(self):
+        standin = GeniusStandIn(self.open_store(), port=0).start()
+        self.addCleanup(standin.shutdown)
+        with override_settings(GENIUS_BASE_URL=standin.url):
+            service = AsyncLyricsService(
+                cache=LyricsCache(persistent=False), api_key='test', upstream=UpstreamClient()
+            )
+
+        # As under WSGI, every view runs in a fresh event loop
+        song = asyncio.run(service.get_lyrics_by_search('Halo', 'Beyoncé'))
+        client = service._http
+        self.assertEqual(asyncio.run(service.search_songs('shape'))[0]['id'], 1)
+        self.assertEqual(song['lyrics'], 'Remember those walls I built')
+        self.assertIs(service._http, client)
+        self.assertFalse(client.is_closed)
+
+        service.close()
+        self.assertTrue(client.is_closed)
+
+    def test_coalescing_across_view_loops(self):
+        loop = ServiceLoop('test-loop')
+        self.addCleanup(loop.stop)
+        inflight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return 'lyrics'
+
+        results = []
+        views = [
+            threading.Thread(target=lambda: results.append(asyncio.run(loop.run(inflight.do('song', fetch)))))
+            for _ in range(4)
+        ]
+        for view in views:
+            view.start()
+        for view in views:
+            view.join()
+        self.assertEqual((results, len(calls)), (['lyrics'] * 4, 1))
+        self.assertEqual(inflight.stats()['coalesced'], 3)
+
+
+
+class LyricsWarmupTests(TestCase):
+    """
+    The warm-up plans from recent searches and challenge counts, fetches
+    what is missing and renews only entries close to expiry
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'lyrics.bin')
+        with LyricsStoreWriter(path) as writer:
+            writer.add({'id': 1, 'title': 'Shape of You', 'artist': 'Ed Sheeran', 'lyrics': 'The shape of you'})
+            writer.add({'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls'})
+        store = LyricsStore(path)
+        self.addCleanup(store.close)
+
+        self.service = LyricsService(
+            cache=LyricsCache(persistent=False, ttl=3600),
+            catalog=SongCatalog(),
+            provider=LocalProvider(store),
+        )
+        user = User.objects.create_user('creator')
+        make_challenges(2, [user])
+        Song.objects.update(title='Shape of You', artist='Ed Sheeran')
+
+    def test_plan_and_refresh(self):
+        self.service.search_songs('halo')
+
+        warmer = LyricsWarmer(self.service, workers=2, refresh_margin=60)
+        self.assertEqual(warmer.plan(), [('Shape of You', 'Ed Sheeran'), ('Halo', 'Beyoncé')])
+
+        result = warmer.run()
+        self.assertEqual((result['fetched'], result['fresh']), (2, 0))
+        self.assertEqual(self.service.cache.get(search_key('Halo', 'Beyoncé'))['lyrics'], 'Remember those walls')
+        self.assertEqual(warmer.run()['fresh'], 2)
+
+        # Entries with less than the margin left are fetched again
+        warmer.refresh_margin = 2 * 3600
+        self.assertEqual(warmer.run()['fetched'], 2)
+        self.assertEqual(warmer.stats()['runs'], 3)
+
+
+class ChallengeJobTests(TestCase):
+    """
+    create_from_lyrics in job mode answers 202 at once; a queue worker
+    creates the challenge and the status endpoint returns it
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'lyrics.bin')
+        with LyricsStoreWriter(path) as writer:
+            writer.add({'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls I built'})
+        store = LyricsStore(path)
+        self.addCleanup(store.close)
+
+        self.queue = ChallengeJobQueue(lyrics_service=LyricsService(
+            cache=LyricsCache(persistent=False), catalog=SongCatalog(), provider=LocalProvider(store),
+        ))
+        self.user = User.objects.create_user('creator')
+        self.client.force_login(self.user)
+
+    def enqueue(self, **body):
+        return self.client.post(
+            '/api/challenges/create_from_lyrics/', body,
+            content_type='application/json', HTTP_PREFER='respond-async'
+        )
+
+    def test_job_lifecycle(self):
+        response = self.enqueue(title='Halo', artist='Beyoncé', line_index=0, words_to_blank=1)
+        self.assertEqual(response.status_code, 202)
+        url = response['Location']
+        self.assertEqual(response.json()['status_url'], url)
+        self.assertFalse(Challenge.objects.exists())
+
+        pending = self.client.get(url)
+        self.assertEqual((pending.json()['status'], pending['Retry-After']), ('queued', '1'))
+
+        self.enqueue(title='Unknown song nobody wrote')
+        self.enqueue(title='Halo', artist='Beyoncé', line_index=40)
+        self.assertEqual(self.queue.run_pending(), 3)
+
+        done = self.client.get(url).json()
+        self.assertEqual(done['status'], 'done')
+        self.assertEqual(done['challenge']['blanked_lyric'], 'Remember ____ walls I built')
+        self.assertEqual(
+            sorted(ChallengeJob.objects.filter(status='failed').values_list('error', flat=True)),
+            ['Could not create challenge from these lyrics', 'Could not fetch lyrics for this song']
+        )
+
+        self.client.force_login(User.objects.create_user('someone-else'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(CHALLENGE_JOB_MAX_PENDING=1)
+    def test_validation_pending_limit_and_stale_jobs(self):
+        self.assertEqual(self.enqueue(title='Halo', words_to_blank='two').status_code, 400)
+        self.assertEqual(self.enqueue(title='Halo').status_code, 202)
+        self.assertEqual(self.enqueue(title='Halo').status_code, 429)
+
+        ChallengeJob.objects.update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.queue.maintain(), (1, 0))
+        self.assertEqual(self.queue.run_pending(), 1)
+        self.assertEqual(Challenge.objects.get().creator, self.user)
+
+
+class SongCatalogTests(SimpleTestCase):
+    """
+    Autocomplete from the song catalog: prefix matches ranked by where they
+    match, trigram matches for typos, and snapshots that reload the same
+    catalog
+    """
+
+    SONGS = [
+        {'id': 1, 'title': 'Shape of You', 'artist': 'Ed Sheeran'},
+        {'id': 2, 'title': 'Halo', 'artist': 'Beyoncé'},
+        {'id': 3, 'title': 'Blinding Lights', 'artist': 'The Weeknd'},
+        {'id': 4, 'title': 'Shake It Off', 'artist': 'Taylor Swift'},
+        {'id': 5, 'title': 'Sweet Caroline', 'artist': 'Neil Diamond'},
+    ]
+
+    def ids(self, catalog, query, limit=10):
+        return [song['id'] for song in catalog.search(query, limit)]
+
+    def test_prefix_lookup(self):
+        catalog = SongCatalog()
+        catalog.add(self.SONGS)
+        catalog.add([self.SONGS[3]])
+
+        # Title starts first (the more often seen one first), then artist
+        # starts, then later words
+        self.assertEqual(self.ids(catalog, 'sh'), [4, 1])
+        self.assertEqual(self.ids(catalog, 'S'), [4, 1, 5])
+        self.assertEqual(self.ids(catalog, 'beyo'), [2])
+        self.assertEqual(self.ids(catalog, 'of you'), [1])
+        self.assertEqual(self.ids(catalog, 'the wee'), [3])
+        self.assertEqual(self.ids(catalog, 'sh', limit=1), [4])
+        self.assertEqual(catalog.search('halo')[0], {
+            'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'album': None,
+            'release_date': None, 'thumbnail': None, 'url': None,
+        })
+
+    def test_trigram_fuzzy_matching(self):
+        catalog = SongCatalog.from_songs(self.SONGS)
+        self.assertEqual(self.ids(catalog, 'shpe of you'), [1])
+        self.assertEqual(self.ids(catalog, 'blindin lihgts'), [3])
+        self.assertEqual(self.ids(catalog, 'beyonse'), [2])
+        self.assertEqual(self.ids(catalog, 'zzqx'), [])
+        stats = catalog.stats()
+        self.assertEqual((stats['lookups'], stats['prefix_hits'], stats['trigram_hits']), (4, 0, 3))
+
+    def test_snapshot_round_trip(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'catalog.json.gz')
+        catalog = SongCatalog(path=path)
+        catalog.add(self.SONGS, query='shape')
+        catalog.add([self.SONGS[3]], query='shake')
+        self.assertTrue(catalog.save())
+        self.assertFalse(catalog.save())
+
+        restored = SongCatalog(path=path)
+        # Songs seen before the snapshot is read are merged into it
+        restored.add([{'id': 6, 'title': 'Shallow', 'artist': 'Lady Gaga'}])
+        self.assertEqual(restored.load(), 6)
+        self.assertTrue(restored.wait_loaded(0))
+        # Seen counts survive; equally seen songs go shortest title first
+        self.assertEqual(self.ids(restored, 'sh'), [4, 6, 1])
+        self.assertEqual(self.ids(restored, 'blindng'), [3])
+        self.assertEqual(
+            [(song['id'], count) for song, count in restored.trending()], [(1, 1), (4, 1)]
+        )
+
+        # An unreadable snapshot is ignored rather than failing startup
+        with open(path, 'wb') as f:
+            f.write(b'not gzip')
+        with self.assertLogs('challenges.services.catalog', 'ERROR'):
+            self.assertEqual(SongCatalog(path=path).load(), 0)
+
+
+class UpstreamClientTests(SimpleTestCase):
+    """
+    Breaker state transitions and which failures the client retries
+    """
+
+    def failing(self, exc, calls):
+        def fn():
+            calls.append(1)
+            raise exc
+        return fn
+
+    def test_breaker_opens_then_lets_one_trial_through(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] += 30
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # A failed trial opens the breaker again at once
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        now[0] += 30
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow() and breaker.allow())
+        self.assertEqual(breaker.stats(), {
+            'state': CircuitBreaker.CLOSED, 'consecutive_failures': 0, 'opened': 2, 'rejected': 2,
+        })
+
+    def test_retry_policy(self):
+        client = UpstreamClient(retries=2, backoff_base=0)
+
+        calls = []
+        self.assertRaises(TimeoutError, client.call, self.failing(TimeoutError(), calls))
+        self.assertEqual(len(calls), 3)
+
+        # Not worth retrying: client errors and non-idempotent calls
+        not_found = Exception('Response status code: 404')
+        calls = []
+        self.assertRaises(Exception, client.call, self.failing(not_found, calls))
+        self.assertRaises(TimeoutError, client.call, self.failing(TimeoutError(), calls), idempotent=False)
+        self.assertEqual(len(calls), 2)
+
+        # 429 and 5xx are, and an answer after a retry counts as a success
+        calls = []
+        outcomes = [Exception('Response status code: 503'), Exception('Response status code: 429')]
+
+        def flaky():
+            calls.append(1)
+            if outcomes:
+                raise outcomes.pop(0)
+            return 'ok'
+
+        self.assertEqual(client.call(flaky), 'ok')
+        self.assertEqual(len(calls), 3)
+        stats = client.stats()
+        self.assertEqual((stats['calls'], stats['retries'], stats['errors']), (4, 4, 7))
+        self.assertEqual(stats['breaker']['consecutive_failures'], 0)
+
+    def test_async_deadline(self):
+        client = UpstreamClient(retries=5, backoff_base=0, deadline=0.05)
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(1)
+
+        self.assertRaises(DeadlineExceeded, asyncio.run, client.acall(slow))
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_trial_is_released(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        client = UpstreamClient(breaker=breaker, retries=0)
+        breaker.record_failure()
+        now[0] += 30
+
+        async def cancel_trial():
+            task = asyncio.ensure_future(client.acall(asyncio.sleep, 10))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(client.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        breaker.record_failure()
+        now[0] += 30
+
+        def interrupted():
+            raise KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, client.call, interrupted)
+        self.assertEqual(client.call(lambda: 'ok'), 'ok')
+
+    def test_sync_deadline_caps_request_timeouts(self):
+        self.assertEqual(request_timeout(5.0), 5.0)
+        client = UpstreamClient(retries=0, deadline=0.5)
+        self.assertLessEqual(client.call(request_timeout, 5.0), 0.5)
+        self.assertEqual(client.call(request_timeout, 0.1), 0.1)
+
+        class Slow(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(2)
+                try:
+                    self.send_response(200)
+                    self.end_headers()
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Slow)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        # GENIUS_TIMEOUT alone would wait 5s for the first byte
+        with override_settings(GENIUS_TIMEOUT=5.0):
+            provider = GeniusProvider(api_key='test', base_url=f'http://127.0.0.1:{server.server_port}')
+        client = UpstreamClient(retries=5, backoff_base=0, deadline=0.3)
+        started = time.monotonic()
+        with self.assertRaises(Exception) as raised:
+            client.call(provider.search_songs, 'halo')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(type(raised.exception).__name__, 'Timeout')
+
+
+class UpstreamThrottlingTests(SimpleTestCase):
+    """
+    The token bucket, one upstream budget shared by every priority (prefetch
+    shed first), and a per-client throttle in front of cache misses
+    """
+
+    def setUp(self):
+        self.now = [0.0]
+
+    def budget(self, rate=1.0, burst=4):
+        waits = dict.fromkeys([INTERACTIVE, BACKGROUND, PREFETCH], 0)
+        return UpstreamBudget(rate, burst=burst, max_waits=waits, clock=lambda: self.now[0])
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2.0, clock=lambda: self.now[0])
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.now[0] += 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_budget_priorities(self):
+        budget = self.budget()
+        with upstream_priority(PREFETCH):
+            budget.acquire()
+            budget.acquire()
+            # Half of the burst is kept for background and interactive calls
+            self.assertRaises(UpstreamThrottled, budget.acquire)
+        budget.acquire(BACKGROUND)
+        self.assertRaises(UpstreamThrottled, budget.acquire, BACKGROUND)
+        budget.acquire()
+        with self.assertRaises(UpstreamThrottled) as raised:
+            budget.acquire()
+        self.assertEqual((raised.exception.priority, raised.exception.retry_after), (INTERACTIVE, 1.0))
+
+        self.now[0] += 1
+        budget.acquire()
+        stats = budget.stats()
+        self.assertEqual(
+            [(stats[p]['granted'], stats[p]['shed']) for p in (INTERACTIVE, BACKGROUND, PREFETCH)],
+            [(2, 1), (1, 1), (2, 1)]
+        )
+
+    def test_client_spends_budget(self):
+        calls = []
+
+        def timeout():
+            calls.append(1)
+            raise TimeoutError()
+
+        budget = self.budget(burst=2)
+        client = UpstreamClient(retries=3, backoff_base=0, budget=budget)
+        self.assertEqual(client.call(lambda: 'ok'), 'ok')
+        # The second token is the only one left: no retries
+        self.assertRaises(TimeoutError, client.call, timeout)
+        self.assertEqual(len(calls), 1)
+        self.assertRaises(UpstreamThrottled, client.call, timeout)
+        self.assertEqual(len(calls), 1)
+
+        # Calls rejected by an open breaker give their token back
+        self.now[0] += 1
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        client = UpstreamClient(breaker=breaker, budget=budget)
+        self.assertRaises(CircuitOpenError, client.call, timeout)
+        self.assertEqual((budget.stats()['tokens'], budget.stats()['refunded']), (1.0, 1))
+
+    def test_service_raises_without_stale_entry(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'lyrics.bin')
+        with LyricsStoreWriter(path) as writer:
+            writer.add({'id': 1, 'title': 'Shape of You', 'artist': 'Ed Sheeran', 'lyrics': 'The shape of you'})
+            writer.add({'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls'})
+        store = LyricsStore(path)
+        self.addCleanup(store.close)
+        standin = GeniusStandIn(store, port=0).start()
+        self.addCleanup(standin.shutdown)
+
+        service = LyricsService(
+            cache=LyricsCache(persistent=False),
+            catalog=SongCatalog(),
+            provider=GeniusProvider(api_key='test', base_url=standin.url),
+            upstream=UpstreamClient(budget=self.budget(burst=3)),
+        )
+        # Search, song info and lyrics page: three requests, three tokens
+        self.assertEqual(service.get_lyrics_by_search('Halo', 'Beyoncé')['id'], 2)
+        self.assertEqual(service.upstream.budget.stats()[INTERACTIVE]['granted'], 3)
+        # Cache hits cost nothing
+        self.assertEqual(service.get_lyrics_by_search('Halo', 'Beyoncé')['id'], 2)
+        self.assertRaises(UpstreamThrottled, service.get_lyrics_by_search, 'Shape of You')
+        self.assertRaises(UpstreamThrottled, service.search_songs, 'shape')
+
+    def test_async_service_spends_the_same_budget(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'lyrics.bin')
+        with LyricsStoreWriter(path) as writer:
+            writer.add({'id': 2, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember those walls'})
+        store = LyricsStore(path)
+        self.addCleanup(store.close)
+        standin = GeniusStandIn(store, port=0).start()
+        self.addCleanup(standin.shutdown)
+
+        budget = self.budget(burst=3)
+        with override_settings(GENIUS_BASE_URL=standin.url):
+            service = AsyncLyricsService(
+                cache=LyricsCache(persistent=False), api_key='test', upstream=UpstreamClient(budget=budget)
+            )
+        self.addCleanup(service.close)
+        self.assertEqual(asyncio.run(service.get_lyrics_by_search('Halo', 'Beyoncé'))['id'], 2)
+        self.assertEqual(budget.stats()[INTERACTIVE]['granted'], 3)
+
+    def test_client_throttle(self):
+        factory = RequestFactory()
+        throttle = LyricsClientThrottle()
+        throttle.buckets = ClientBuckets(rate=1 / 60, burst=2, max_clients=2, clock=lambda: self.now[0])
+
+        request = factory.get('/api/lyrics/search/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(throttle.get_client_key(request), 'ip:10.0.0.1')
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+        self.assertAlmostEqual(throttle.wait(), 60.0)
+
+        # Other clients have their own bucket; the least recent one is forgotten
+        for ip in ('10.0.0.2', '10.0.0.3'):
+            self.assertTrue(throttle.allow_request(factory.get('/', REMOTE_ADDR=ip), None))
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertEqual(throttle.buckets.stats()['evicted'], 2)
+
+
+class ChallengeCandidatesTests(SimpleTestCase):
+    """
+    Parameter checks of /api/lyrics/candidates/ and /api/lyrics/search/,
+    made before any Genius call
+    """
+
+    def test_bad_top_n_is_rejected(self):
+        for top_n in ('ten', '2.5', ''):
+            response = self.client.get('/api/lyrics/candidates/', {'title': 'Halo', 'top_n': top_n})
+            self.assertEqual(response.status_code, 400, top_n)
+            self.assertEqual(response.json(), {'error': 'top_n must be an integer'})
+
+        response = self.client.get('/api/lyrics/candidates/', {'top_n': '5'})
+        self.assertEqual(response.json(), {'error': 'Query parameter "title" is required'})
+
+    def test_bad_max_results_is_rejected(self):
+        for max_results in ('ten', '2.5', ''):
+            response = self.client.get('/api/lyrics/search/', {'q': 'halo', 'max_results': max_results})
+            self.assertEqual(response.status_code, 400, max_results)
+            self.assertEqual(response.json(), {'error': 'max_results must be an integer'})
+
+
+class LyricsTextTests(SimpleTestCase):
+    """
+    Lyrics are cleaned and split once into a LyricsDocument that line lists,
+    snippets and candidates are sliced from
+    """
+
+    RAW = (
+        '47 ContributorsTranslationsEspañolShape of You Lyrics[Verse 1]\n'
+        "The club isn't the best place to find a lover\n"
+        'See Ed Sheeran LiveGet tickets as low as $65You might also like\n'
+        '\n\n  I\'m in love   with the shape of you  \n'
+        'We push and pull like a magnet doYou might also like\n'
+        "I'm in love with the shape of you12Embed"
+    )
+
+    def test_cleaning_and_offsets(self):
+        document = LyricsDocument(self.RAW)
+        self.assertEqual(document.text, (
+            "[Verse 1]\nThe club isn't the best place to find a lover\n\n"
+            "I'm in love   with the shape of you\nWe push and pull like a magnet do\n"
+            "I'm in love with the shape of you"
+        ))
+        self.assertEqual(LyricsDocument(document.text).text, document.text)
+        self.assertEqual(len(document), 5)
+        self.assertEqual(document.line(-1), "I'm in love with the shape of you")
+        self.assertIsNone(document.line(5))
+
+        for i, line in enumerate(document.lines()):
+            self.assertEqual(document.words(i), line.split())
+            self.assertEqual([line[start:end] for start, end in document.word_offsets(i)], line.split())
+        self.assertEqual(document.tokens(0), ['verse', '1'])
+        self.assertEqual(document.tokens(2)[:3], ["i'm", 'in', 'love'])
+        self.assertEqual(split_lines_with_offsets(document.text)[2], (document.line(2), document.word_offsets(2)))
+
+    def test_lyrics_without_artifacts_are_unchanged(self):
+        lyrics = (
+            'Translations of a lonely heart\n'
+            'Lyrics I wrote on the back of a letter\n'
+            '\n'
+            '99 problems but the beat ain\'t one\n'
+            'Every Contributor to the song'
+        )
+        self.assertEqual(lyrics_document(lyrics).lines(), lyrics.replace('\n\n', '\n').split('\n'))
+        self.assertEqual(LyricsDocument(lyrics).text, lyrics)
+
+    def test_service_helpers_share_the_document(self):
+        service = LyricsService(cache=LyricsCache(persistent=False), catalog=SongCatalog(), provider=object())
+        lyrics = service._clean_lyrics(self.RAW)
+        self.assertIs(lyrics_document(lyrics), lyrics_document(self.RAW))
+        self.assertEqual(service.split_into_lines(lyrics), lyrics_document(lyrics).lines())
+
+        snippet = service.create_challenge_snippet(lyrics, 3, 2)
+        self.assertEqual(snippet['blanked_line'], 'We push ____ ____ like a magnet do')
+        self.assertEqual(snippet['answer'], 'and pull')
+        self.assertIsNone(service.create_challenge_snippet(lyrics, 10))
+        self.assertEqual(
+            generate_candidates(lyrics_document(lyrics)), generate_candidates(service.split_into_lines(lyrics))
+        )
+
+
+class SongStoreTests(TestCase):
+    """
+    Storing new lyrics for a known song keeps the rows of unchanged lines, so
+    challenges made from them stay linked
+    """
+
+    def test_changed_lyrics_keep_unchanged_lines(self):
+        song = store_song({'id': 7, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Remember\nthose walls\nI built'})
+        lines = {line.text: line for line in song.lines.all()}
+        user = User.objects.create_user('creator')
+        kept, gone = [
+            Challenge.objects.create(creator=user, line=lines[text], blank_words=len(text.split()), correct_answer=text)
+            for text in ('I built', 'those walls')
+        ]
+
+        store_song({'id': 7, 'title': 'Halo', 'artist': 'Beyoncé', 'lyrics': 'Intro\nRemember\nI built\nOutro'})
+
+        self.assertEqual(
+            list(song.lines.values_list('index', 'text')),
+            [(0, 'Intro'), (1, 'Remember'), (2, 'I built'), (3, 'Outro')]
+        )
+        kept.refresh_from_db()
+        gone.refresh_from_db()
+        self.assertEqual((kept.line_id, kept.line.index), (lines['I built'].pk, 2))
+        # A line a challenge still uses moves to the song's loose song
+        self.assertEqual(gone.line_id, lines['those walls'].pk)
+        self.assertEqual((gone.line.song.genius_id, gone.line.song.title, gone.line.index), (None, 'Halo', 0))
+        self.assertEqual(gone.blanked_lyric, '____ ____')
+        self.assertFalse(song.lines.filter(text='those walls').exists())
+
+
+class HandTypedChallengeTests(TestCase):
+    """
+    Challenges created through the API store their line (the blanked lyric
+    with the answer put back) under the loose song of their title and artist
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('creator')
+        self.client.force_login(self.user)
+
+    def post(self, **body):
+        return self.client.post('/api/challenges/', {
+            'song_title': 'Halo', 'artist': 'Beyoncé', 'genre': 'Pop',
+            'blanked_lyric': 'Remember those ____ I built', 'correct_answer': 'walls', **body,
+        }, content_type='application/json')
+
+    def test_create_and_update(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['blanked_lyric'], 'Remember those ____ I built')
+        challenge = Challenge.objects.get(id=response.json()['id'])
+        self.assertEqual((challenge.original_lyric, challenge.song_title), ('Remember those walls I built', 'Halo'))
+        self.assertIsNone(challenge.line.song.genius_id)
+
+        # The same line again reuses the row
+        other = Challenge.objects.get(id=self.post(correct_answer='walls').json()['id'])
+        self.assertEqual(other.line_id, challenge.line_id)
+
+        response = self.client.patch(
+            f'/api/challenges/{challenge.id}/', {'correct_answer': 'wall of'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        challenge.refresh_from_db()
+        self.assertEqual(challenge.original_lyric, 'Remember those wall of I built')
+        self.assertEqual(challenge.blanked_lyric, 'Remember those ____ ____ I built')
+        self.assertEqual(challenge.line.song_id, other.line.song_id)
+
+    def test_blank_is_required(self):
+        response = self.post(blanked_lyric='Remember those walls I built')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('blanked_lyric', response.json())
+        self.assertFalse(Challenge.objects.exists())
+
+
+class BatchCreateTests(TestCase):
+    """
+    create_batch_from_lyrics inserts the valid items together and reports
+    the others by position
+    """
+
+    def setUp(self):
+        store_song({
+            'id': 7, 'title': 'Halo', 'artist': 'Beyoncé',
+            'lyrics': 'Remember those walls I built\nWell baby they are tumbling down',
+        })
+        self.user = User.objects.create_user('creator')
+
+    def create(self, **body):
+        return self.client.post(
+            '/api/challenges/create_batch_from_lyrics/', {'title': 'Halo', 'artist': 'Beyoncé', **body},
+            content_type='application/json'
+        )
+
+    def test_valid_items_are_created_and_invalid_ones_reported(self):
+        self.assertEqual(self.create(items=[{}]).status_code, 401)
+        self.client.force_login(self.user)
+
+        response = self.create(genre='Pop', items=[
+            {'line_index': 0},
+            'line 1',
+            {'line_index': 'first'},
+            {'line_index': 1, 'words_to_blank': 0},
+            {'line_index': 40},
+            {'line_index': -1, 'words_to_blank': 2},
+        ])
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([c['blanked_lyric'] for c in data['created']], [
+            'Remember ____ walls I built', 'Well baby ____ ____ tumbling down',
+        ])
+        self.assertEqual(data['errors'], [
+            {'index': 1, 'error': 'Each item must be an object'},
+            {'index': 2, 'error': 'line_index and words_to_blank must be integers'},
+            {'index': 3, 'error': 'words_to_blank must be at least 1'},
+            {'index': 4, 'error': 'Could not create challenge from these lyrics'},
+        ])
+        self.assertEqual(
+            list(Challenge.objects.order_by('id').values_list('genre', 'line__index', 'creator')),
+            [('Pop', 0, self.user.pk), ('Pop', 1, self.user.pk)]
+        )
+
+    def test_rejected_batches(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.create(items=[]).status_code, 400)
+        self.assertEqual(self.create(items=[{}] * 51).status_code, 400)
+        self.assertEqual(self.create(items=[{'line_index': 40}]).status_code, 400)
+        self.assertFalse(Challenge.objects.exists())
+
+
+def legacy_check_answer(correct_answer, user_answer):
+    """check_answer before answer_matching, minus its debug prints"""
+    correct = correct_answer.lower().strip()
+    user = user_answer.lower().strip()
+    if correct == user:
+        return True
+    if correct.replace(" ", "") == user.replace(" ", ""):
+        return True
+    return SequenceMatcher(None, correct, user).ratio() >= 0.80
+
+
+class AnswerMatchingTests(SimpleTestCase):
+    """answers_match gives the verdicts the old check_answer gave"""
+
+    ANSWERS = ['shape', 'love', 'tumbling down', "it's me", 'never gonna give you up', 'I', 'Ça va', '']
+
+    def submissions(self, answer, rng):
+        yield answer
+        yield answer.upper()
+        yield f'  {answer} '
+        yield answer.replace(' ', '')
+        yield ' '.join(answer)
+        yield answer[::-1]
+        yield ''
+        for _ in range(30):
+            text = list(answer)
+            for _ in range(rng.randint(1, 3)):
+                i = rng.randrange(len(text) + 1)
+                op = rng.choice('dis')
+                if op == 'd' and i < len(text):
+                    del text[i]
+                elif op == 's' and i < len(text):
+                    text[i] = rng.choice(string.ascii_lowercase + " '")
+                else:
+                    text.insert(i, rng.choice(string.ascii_lowercase + " '"))
+            yield ''.join(text)
+
+    def test_same_verdicts_as_check_answer(self):
+        rng = random.Random(1234)
+        checked = accepted = 0
+        for answer in self.ANSWERS:
+            correct = normalize(answer)
+            for submitted in self.submissions(answer, rng):
+                expected = legacy_check_answer(answer, submitted)
+                self.assertEqual(answers_match(correct, submitted), expected, (answer, submitted))
+                self.assertEqual(answers_match(correct, submitted, compact(correct)), expected, (answer, submitted))
+                checked += 1
+                accepted += expected
+        # Both outcomes are well represented
+        self.assertGreater(accepted, checked // 4)
+        self.assertLess(accepted, checked * 3 // 4)
+
+    def test_lenient_only_adds_matches(self):
+        for answer, submitted in (("won't", 'will not'), ("I'm", 'I am!')):
+            self.assertFalse(answers_match(normalize(answer), submitted))
+            self.assertTrue(answers_match(normalize(answer), submitted, lenient=True))
+        self.assertFalse(answers_match(normalize('shape'), 'heart', lenient=True))
+
+
+class RoundSubmissionTests(TestCase):
+    """
+    submit_round checks every answer on its own: a bad item gets an error
+    entry and the rest of the round is still scored
+    """
+
+    def setUp(self):
+        make_challenges(2, [User.objects.create_user('creator')])
+        self.ids = list(Challenge.objects.order_by('id').values_list('id', flat=True))
+
+    def submit_round(self, answers):
+        return self.client.post(
+            '/api/challenges/submit_round/', {'answers': answers}, content_type='application/json'
+        )
+
+    def test_per_item_results(self):
+        missing = max(self.ids) + 1
+        response = self.submit_round([
+            {'challenge_id': self.ids[0], 'answer': 'Shape ', 'hints_used': 2},
+            {'challenge_id': str(self.ids[1]), 'answer': 'heart'},
+            'shape',
+            {'challenge_id': missing, 'answer': 'shape'},
+            {'challenge_id': self.ids[1], 'answer': '  '},
+            {'answer': 'shape'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['total_score'], data['correct_count'], data['answered']), (80, 1, 6))
+        results = data['results']
+        self.assertEqual(
+            [(r['challenge_id'], r.get('is_correct'), r.get('score')) for r in results[:2]],
+            [(self.ids[0], True, 80), (self.ids[1], False, 0)]
+        )
+        self.assertEqual(results[1]['correct_answer'], 'shape')
+        self.assertEqual([(r['challenge_id'], r['error']) for r in results[2:]], [
+            (None, 'Each answer must be an object'),
+            (missing, 'Challenge not found'),
+            (self.ids[1], 'Answer is required'),
+            (None, 'challenge_id must be an integer'),
+        ])
+
+    def test_rejected_rounds(self):
+        self.assertEqual(self.submit_round([]).status_code, 400)
+        self.assertEqual(self.submit_round('shape').status_code, 400)
+        too_many = [{'challenge_id': self.ids[0], 'answer': 'shape'}] * 51
+        self.assertEqual(self.submit_round(too_many).status_code, 400)
+
+
+class AnswerSubmissionTests(TestCase):
+    """
+    hints_used must be a whole number of at least 0 on both answer endpoints
+    """
+
+    def setUp(self):
+        make_challenges(2, [User.objects.create_user('creator')])
+        self.ids = list(Challenge.objects.values_list('id', flat=True))
+
+    def submit(self, hints_used):
+        return self.client.post(
+            f'/api/challenges/{self.ids[0]}/submit_answer/',
+            {'answer': 'shape', 'hints_used': hints_used}, content_type='application/json'
+        )
+
+    def test_submit_answer_hints(self):
+        for bad in (-1, 'abc', 1.5, True, None):
+            self.assertEqual(self.submit(bad).status_code, 400, bad)
+        self.assertEqual(self.submit(2).json()['score'], 80)
+        self.assertEqual(self.submit('3').json()['score'], 70)
+        self.assertEqual(self.submit(20).json()['score'], 0)
+
+    def test_submit_round_hints(self):
+        def round_(*answers):
+            return self.client.post(
+                '/api/challenges/submit_round/', {'answers': list(answers)}, content_type='application/json'
+            )
+
+        response = round_(
+            {'challenge_id': self.ids[0], 'answer': 'shape'},
+            {'challenge_id': self.ids[1], 'answer': 'shape', 'hints_used': -1000},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('answers[1]', response.json()['error'])
+        self.assertEqual(round_({'challenge_id': self.ids[0], 'answer': 'x', 'hints_used': 'abc'}).status_code, 400)
+
+        data = round_(
+            {'challenge_id': self.ids[0], 'answer': 'shape', 'hints_used': 1},
+            {'challenge_id': 'nope', 'answer': 'shape'},
+        ).json()
+        self.assertEqual(data['total_score'], 90)
+        self.assertEqual(data['results'][1]['error'], 'challenge_id must be an integer')
+
+
+class LeaderboardTests(TestCase):
+    """
+    Ranks (ties broken by user id), day/week windows that ignore older
+    periods, deltas from AttemptWriter and reloads from the database
+    """
+
+    def setUp(self):
+        self.users = []
+        for i, (score, completed) in enumerate([(300, 3), (500, 5), (300, 2)]):
+            user = User.objects.create_user(f'player{i}')
+            UserProfile.objects.create(
+                user=user, firebase_uid=f'uid{i}', display_name=f'Player {i}',
+                total_score=score, challenges_completed=completed,
+            )
+            self.users.append(user.id)
+        today = timezone.localdate()
+        ScoreBucket.objects.bulk_create([
+            ScoreBucket(user_id=self.users[0], period='day', period_start=today, score=50, completed=1),
+            ScoreBucket(user_id=self.users[2], period='day', period_start=today, score=90, completed=1),
+            ScoreBucket(user_id=self.users[1], period='day', period_start=today - timedelta(days=1), score=400),
+            ScoreBucket(user_id=self.users[1], period='week', period_start=period_start('week'), score=70),
+        ])
+
+    def test_board_ranks(self):
+        board = Leaderboard([(1, 30, 1), (2, 50, 2), (3, 30, 1)])
+        self.assertEqual(board.top(2), [(2, 50, 2), (1, 30, 1)])
+        self.assertEqual([board.rank(user_id)[0] for user_id in (1, 2, 3)], [2, 1, 3])
+        board.add(3, 25, 1)
+        board.add(4, 10)
+        self.assertEqual(board.top(), [(3, 55, 2), (2, 50, 2), (1, 30, 1), (4, 10, 0)])
+        self.assertIsNone(board.rank(5))
+
+    def test_windows(self):
+        boards = Leaderboards()
+        self.assertEqual(
+            [(e['rank'], e['username'], e['score']) for e in boards.top('all')],
+            [(1, 'Player 1', 500), (2, 'Player 0', 300), (3, 'Player 2', 300)]
+        )
+        # Yesterday's 400 points are not part of today's board
+        self.assertEqual([e['username'] for e in boards.top('day')], ['Player 2', 'Player 0'])
+        self.assertIsNone(boards.rank(self.users[1], 'day'))
+        entry = boards.rank(self.users[1], 'week')
+        self.assertEqual((entry['rank'], entry['score'], entry['total_players']), (1, 70, 1))
+
+    def test_deltas_and_refresh(self):
+        boards = Leaderboards()
+        boards.top('all')
+        boards.top('day')
+        boards.apply({self.users[0]: (60, 1)})
+        self.assertEqual(boards.rank(self.users[0], 'day')['rank'], 1)
+        self.assertEqual(boards.rank(self.users[0], 'all')['score'], 360)
+        # Deltas written after midnight only reach the all-time board; the
+        # day board is rebuilt for the new day on its next read
+        boards.apply({self.users[2]: (500, 1)}, today=timezone.localdate() + timedelta(days=1))
+        self.assertEqual(boards.rank(self.users[2], 'day')['score'], 90)
+        self.assertEqual(boards.rank(self.users[2])['score'], 800)
+
+        # Reads never reload; refresh() picks up writes made elsewhere
+        UserProfile.objects.filter(user_id=self.users[1]).update(total_score=1000)
+        self.assertEqual(boards.rank(self.users[1])['rank'], 2)
+        self.assertEqual(boards.refresh(), 2)
+        self.assertEqual(boards.rank(self.users[1])['rank'], 1)
+
+    def test_build_does_not_block_reads(self):
+        building, release = threading.Event(), threading.Event()
+        users = self.users
+
+        class SlowBoards(Leaderboards):
+            def _rows(self, window, start):
+                if window != 'day':
+                    return super()._rows(window, start)
+                building.set()
+                release.wait(5)
+                return [(users[0], 10, 1)], {}
+
+        boards = SlowBoards()
+        boards.top('all')
+        builders = [threading.Thread(target=boards._board, args=('day',)) for _ in range(2)]
+        for thread in builders:
+            thread.start()
+        self.assertTrue(building.wait(5))
+
+        # The all-time board is read while the day board is being queried
+        self.assertEqual(boards.rank(self.users[1])['rank'], 1)
+        self.assertTrue(all(thread.is_alive() for thread in builders))
+
+        release.set()
+        for thread in builders:
+            thread.join(5)
+        # Both readers got the one board built
+        self.assertEqual((boards.stats()['rebuilds'], boards.stats()['players']['day']), (2, 1))
+        self.assertEqual(boards.rank(self.users[0], 'day')['score'], 10)
+
+
+class AttemptWriterTests(TransactionTestCase):
+    """
+    Write-behind flushes: first correct attempts score once, a bad row (an
+    attempt at a challenge deleted meanwhile) does not block later flushes,
+    a locked database only delays the batch, and a broken one drops it
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('player')
+        UserProfile.objects.create(user=self.user, firebase_uid='uid', display_name='Player')
+        make_challenges(2, [self.user])
+        self.ids = list(Challenge.objects.order_by('id').values_list('id', flat=True))
+        self.writer = AttemptWriter(max_batch=100, flush_interval=60)
+
+    def record(self, challenge_id, is_correct, score=100):
+        self.writer.record(self.user.id, challenge_id, 'shape', is_correct, 0, score if is_correct else 0)
+
+    def test_flush_scores_first_correct_attempt_only(self):
+        self.record(self.ids[0], False)
+        self.record(self.ids[0], True)
+        self.record(self.ids[0], True)
+        self.assertEqual(self.writer.pending(), 3)
+        self.assertEqual(self.writer.flush(), 3)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_score, profile.challenges_completed), (100, 1))
+        self.assertEqual(
+            sorted(ScoreBucket.objects.values_list('period', 'score')), [('day', 100), ('week', 100)]
+        )
+        self.assertEqual(ChallengeAttempt.objects.count(), 3)
+
+    def test_bad_rows_are_dropped(self):
+        self.record(self.ids[0], True)
+        self.record(self.ids[1], True, score=90)
+        Challenge.objects.filter(id=self.ids[0]).delete()
+
+        with self.assertLogs('challenges.services.attempt_writer', 'WARNING'):
+            self.assertEqual(self.writer.flush(), 1)
+        stats = self.writer.stats()
+        self.assertEqual((stats['pending'], stats['dropped'], stats['written']), (0, 1, 1))
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_score, 90)
+
+        # Later flushes are unaffected
+        self.record(self.ids[1], False)
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertEqual(ChallengeAttempt.objects.count(), 2)
+
+    def test_batch_size_triggers_flush_and_transient_errors_requeue(self):
+        class LockedOnce(AttemptWriter):
+            locked = True
+
+            def _write(self, batch):
+                if self.locked:
+                    self.locked = False
+                    raise OperationalError('database is locked')
+                return super()._write(batch)
+
+        self.writer = LockedOnce(max_batch=2, flush_interval=60)
+        self.record(self.ids[0], True)
+        self.assertEqual(ChallengeAttempt.objects.count(), 0)
+        with self.assertLogs('challenges.services.attempt_writer', 'ERROR'):
+            self.record(self.ids[1], True)
+        self.assertEqual(self.writer.pending(), 2)
+
+        # The request thread does not retry the backlog; the next timed flush does
+        self.record(self.ids[1], False)
+        self.assertEqual(self.writer.pending(), 3)
+        self.assertEqual(self.writer.flush(), 3)
+        stats = self.writer.stats()
+        self.assertEqual((stats['written'], stats['failed_flushes'], stats['dropped']), (3, 1, 0))
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_score, 200)
+
+    def test_permanent_errors_and_backlog_limit_drop_attempts(self):
+        class Failing(AttemptWriter):
+            error = OperationalError('no such table: challenges_challengeattempt')
+
+            def _write(self, batch):
+                raise self.error
+
+        self.writer = Failing(max_batch=2, flush_interval=60, max_pending=3)
+        self.record(self.ids[0], True)
+        with self.assertLogs('challenges.services.attempt_writer', 'ERROR'):
+            self.record(self.ids[1], True)
+        self.assertEqual((self.writer.pending(), self.writer.stats()['dropped']), (0, 2))
+
+        self.writer.error = OperationalError('database is locked')
+        with self.assertLogs('challenges.services.attempt_writer', 'ERROR'):
+            for challenge_id in self.ids[:2]:
+                self.record(challenge_id, False)
+        for challenge_id in self.ids[:2]:
+            self.record(challenge_id, False)
+        self.assertEqual(self.writer.pending(), 4)
+        with self.assertLogs('challenges.services.attempt_writer', 'ERROR') as logs:
+            self.writer.flush()
+        self.assertIn('Dropped the 1 oldest', logs.output[-1])
+        self.assertEqual((self.writer.pending(), self.writer.stats()['dropped']), (3, 3))
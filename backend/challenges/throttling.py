@@ -0,0 +1,33 @@
+from rest_framework.throttling import BaseThrottle
+
+from .services.throttling import get_client_buckets
+
+
+class LyricsClientThrottle(BaseThrottle):
+    """
+    Per-client token bucket (LYRICS_THROTTLE_RATE, bursts of
+    LYRICS_THROTTLE_BURST) for lyrics requests that have to go to Genius.
+    Signed-in players are keyed by user id, everyone else by IP address.
+    The lyrics views only apply it on cache misses, so cached songs are
+    never throttled.
+    """
+    scope = 'lyrics'
+
+    def __init__(self):
+        self.buckets = get_client_buckets()
+        self._wait = None
+
+    def get_client_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        if self.buckets is None:
+            return True
+        self._wait = self.buckets.allow(self.get_client_key(request))
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
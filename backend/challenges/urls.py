@@ -6,16 +6,25 @@ router = DefaultRouter()
 router.register(r'challenges', views.ChallengeViewSet, basename='challenge')
 
 urlpatterns = [
-    # Router URLs (includes all CRUD operations)
-    path('', include(router.urls)),
-    
     # Lyrics endpoints
     path('lyrics/search/', views.search_songs, name='search-songs'),
+    path('lyrics/autocomplete/', views.autocomplete_songs, name='autocomplete-songs'),
     path('lyrics/fetch/', views.get_lyrics, name='get-lyrics'),
+    path('lyrics/candidates/', views.challenge_candidates, name='challenge-candidates'),
     
-    # Challenge creation helper
+    # Challenge creation helper (listed before the router so that
+    # 'challenges/<pk>/' does not swallow it)
     path('challenges/create_from_lyrics/', views.create_challenge_from_lyrics, name='create-from-lyrics'),
+    path('challenges/create_batch_from_lyrics/', views.create_challenges_batch, name='create-batch-from-lyrics'),
+    path('challenges/jobs/<uuid:job_id>/', views.challenge_job, name='challenge-job'),
     
     # Leaderboard
     path('leaderboard/', views.leaderboard, name='leaderboard'),
-]
\ No newline at end of file
+    path('leaderboard/rank/', views.leaderboard_rank, name='leaderboard-rank'),
+    
+    # Prometheus scrape target
+    path('metrics', views.metrics, name='metrics'),
+    
+    # Router URLs (includes all CRUD operations)
+    path('', include(router.urls)),
+]
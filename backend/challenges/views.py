@@ -1,69 +1,274 @@
 from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import APIException
+from rest_framework.generics import get_object_or_404
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.settings import api_settings
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from difflib import SequenceMatcher
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.conf import settings
 
-from .models import Challenge, ChallengeAttempt
-from .serializers import ChallengeSerializer, ChallengeDetailSerializer, ChallengeAttemptSerializer
-from .services.lyrics_service import lyrics_service
+from .conditional import cache_headers, make_etag, not_modified
+from .models import Challenge, ChallengeAttempt, ChallengeJob
+from .pagination import ChallengeCursorPagination
+from .serializers import (
+    ChallengeSerializer, ChallengeDetailSerializer, ChallengeAttemptSerializer,
+    CHALLENGE_DETAIL_VALUES, CHALLENGE_VALUES, challenge_rows,
+)
+from .services.async_lyrics_service import get_async_lyrics_service
+from .services.attempt_writer import get_attempt_writer
+from .services.challenge_jobs import challenge_fields, get_challenge_job_queue
+from .services.answer_matching import answers_match, normalize
+from .services.challenge_generator import generate_candidates, get_corpus_stats
+from .services.leaderboard import WINDOWS, get_leaderboards
+from .services.lyrics_text import lyrics_document
+from .services.metrics import SampledLog, get_metrics
+from .services.search import search_challenge_ids
+from .services.song_store import find_song, get_lines, loose_line, store_song
+from .services.throttling import UpstreamThrottled
+from .throttling import LyricsClientThrottle
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+import hmac
 import logging
+import math
+import random
 
 logger = logging.getLogger(__name__)
+answer_log = SampledLog(logger, settings.LOG_SAMPLE_RATE)
 
 # ===== LYRICS ENDPOINTS =====
 
-@api_view(['GET'])
-def search_songs(request):
+def _api_request(request):
+    """
+    Wrap a Django request in a DRF Request so async views keep DRF's parsers
+    and authentication classes (including SessionAuthentication's CSRF check)
+    """
+    return Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+
+
+async def _load_request(request):
+    """
+    Parse the body and authenticate the user off the event loop
+    Returns: (DRF request, None) or (None, error JsonResponse)
+    """
+    api_request = _api_request(request)
+
+    def load():
+        api_request.data
+        api_request.user
+
+    try:
+        await sync_to_async(load)()
+    except APIException as e:
+        return None, JsonResponse({'detail': e.detail}, status=e.status_code)
+    return api_request, None
+
+
+def _retry_later(body, status_code, wait):
+    response = JsonResponse(body, status=status_code)
+    response['Retry-After'] = str(max(math.ceil(wait or 0), 1))
+    return response
+
+
+def _throttled(api_request):
+    """
+    Apply the per-client lyrics throttle to a request about to go to Genius
+    Returns: 429 JsonResponse, or None if the request may go ahead
+    """
+    throttle = LyricsClientThrottle()
+    if throttle.allow_request(api_request, None):
+        return None
+    return _retry_later(
+        {'error': 'Too many lyrics requests, try again shortly'},
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        throttle.wait()
+    )
+
+
+def _upstream_busy(exc):
+    """
+    Returns: 503 JsonResponse for a request refused by the Genius budget
+    """
+    return _retry_later(
+        {'error': 'Lyrics service is busy, try again shortly'},
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        exc.retry_after
+    )
+
+
+async def _fetch_song_data(lyrics_service, api_request, title, artist):
+    """
+    get_lyrics_by_search, throttling only the lookups that miss the cache
+    Returns: (song_data or None, error JsonResponse or None)
+    """
+    song_data = await lyrics_service.cached_lyrics_by_search(title, artist)
+    if song_data is not None:
+        return song_data, None
+    
+    error = _throttled(api_request)
+    if error:
+        return None, error
+    try:
+        return await lyrics_service.get_lyrics_by_search(title, artist), None
+    except UpstreamThrottled as e:
+        return None, _upstream_busy(e)
+
+
+# Shorter autocomplete queries are only answered from the local catalog
+MIN_UPSTREAM_AUTOCOMPLETE_CHARS = 3
+
+MAX_SONG_RESULTS = 50
+
+# Lyrics endpoints are async so that, under config/asgi.py, a worker can keep
+# many Genius round trips in flight instead of blocking on each one. Under
+# WSGI they still share one connection pool and coalesce identical lookups,
+# as the Genius calls run on the lyrics service's own loop.
+
+@csrf_exempt
+@require_GET
+async def search_songs(request):
     """
     Search for songs by title/artist
-    GET /api/lyrics/search/?q=song+name
+    GET /api/lyrics/search/?q=song+name&max_results=10
     """
     query = request.GET.get('q', '')
     
     if not query:
-        return Response(
+        return JsonResponse(
+            {'error': 'Query parameter "q" is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        max_results = min(max(int(request.GET.get('max_results', 10)), 1), MAX_SONG_RESULTS)
+    except ValueError:
+        return JsonResponse(
+            {'error': 'max_results must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    api_request, error = await _load_request(request)
+    if error:
+        return error
+    error = _throttled(api_request)
+    if error:
+        return error
+    
+    try:
+        songs = await get_async_lyrics_service().search_songs(query, max_results)
+    except UpstreamThrottled as e:
+        return _upstream_busy(e)
+    
+    return JsonResponse({'songs': songs})
+
+
+@csrf_exempt
+@require_GET
+async def autocomplete_songs(request):
+    """
+    Suggest songs as the user types, from the local catalog of songs seen in
+    earlier searches. Genius is only asked when the catalog has too few.
+    GET /api/lyrics/autocomplete/?q=shape+of&limit=10
+    """
+    query = request.GET.get('q', '').strip()
+    
+    if not query:
+        return JsonResponse(
             {'error': 'Query parameter "q" is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    max_results = int(request.GET.get('max_results', 10))
-    songs = lyrics_service.search_songs(query, max_results)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    
+    lyrics_service = get_async_lyrics_service()
+    songs = lyrics_service.catalog.search(query, limit)
+    source = 'catalog'
+    
+    enough = min(settings.AUTOCOMPLETE_MIN_LOCAL_RESULTS, limit)
+    if len(songs) < enough and len(query) >= MIN_UPSTREAM_AUTOCOMPLETE_CHARS:
+        api_request, error = await _load_request(request)
+        # Throttled clients (or an exhausted Genius budget) get catalog results only
+        found = None
+        if not error and not _throttled(api_request):
+            try:
+                # search_songs adds what it finds to the catalog for next time
+                found = await lyrics_service.search_songs(query, limit)
+            except UpstreamThrottled:
+                pass
+        if found is not None:
+            seen = {song['id'] for song in songs}
+            for song in found:
+                if song['id'] not in seen and len(songs) < limit:
+                    songs.append(song)
+            source = 'genius'
     
-    return Response({'songs': songs})
+    return JsonResponse({'songs': songs, 'source': source})
 
 
-@api_view(['POST'])
-def get_lyrics(request):
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def get_lyrics(request):
     """
     Get lyrics for a specific song
     POST /api/lyrics/fetch/
     Body: {"title": "Song Name", "artist": "Artist Name"}
+    
+    GET /api/lyrics/fetch/?title=Song+Name&artist=Artist+Name returns the same,
+    with an ETag and Cache-Control so browsers and proxies can keep it
     """
-    title = request.data.get('title')
-    artist = request.data.get('artist')
+    api_request, error = await _load_request(request)
+    if error:
+        return error
+
+    params = api_request.query_params if request.method == 'GET' else api_request.data
+    title = params.get('title')
+    artist = params.get('artist')
     
     if not title:
-        return Response(
+        return JsonResponse(
             {'error': 'Title is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    song_data = lyrics_service.get_lyrics_by_search(title, artist)
+    lyrics_service = get_async_lyrics_service()
+    song_data, error = await _fetch_song_data(lyrics_service, api_request, title, artist)
+    if error:
+        return error
     
-    if song_data:
-        # Split lyrics into lines for frontend selection
-        lines = lyrics_service.split_into_lines(song_data['lyrics'])
-        song_data['lines'] = lines
-        return Response(song_data)
-    else:
-        return Response(
+    if not song_data:
+        return JsonResponse(
             {'error': 'Could not fetch lyrics for this song'},
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    if request.method != 'GET':
+        song_data['lines'] = lyrics_service.split_into_lines(song_data['lyrics'])
+        return JsonResponse(song_data)
+    
+    etag = make_etag(
+        song_data['id'], song_data['title'], song_data['artist'], song_data['url'], song_data['lyrics']
+    )
+    response = not_modified(request, etag)
+    if response is None:
+        # Split lyrics into lines for frontend selection
+        song_data['lines'] = lyrics_service.split_into_lines(song_data['lyrics'])
+        response = JsonResponse(song_data)
+    return cache_headers(response, etag, max_age=settings.LYRICS_HTTP_MAX_AGE)
 
 
 # ===== CHALLENGE ENDPOINTS =====
@@ -74,12 +279,20 @@ class ChallengeViewSet(viewsets.ModelViewSet):
     """
     queryset = Challenge.objects.all()
     serializer_class = ChallengeSerializer
+    pagination_class = ChallengeCursorPagination
+    
+    def get_queryset(self):
+        """
+        Join the creator (for creator_name) and the line and song (for the
+        text) instead of querying them per row
+        """
+        return Challenge.objects.select_related('creator', 'line__song')
     
     def get_permissions(self):
         """
         Allow anyone to view challenges, but require auth to create/edit
         """
-        if self.action in ['list', 'retrieve', 'submit_answer', 'reveal_answer']:
+        if self.action in ['list', 'retrieve', 'search', 'random', 'submit_answer', 'submit_round', 'reveal_answer']:
             return [AllowAny()]
         return [IsAuthenticated()]
     
@@ -91,6 +304,58 @@ class ChallengeViewSet(viewsets.ModelViewSet):
             return ChallengeDetailSerializer
         return ChallengeSerializer
     
+    def list(self, request, *args, **kwargs):
+        """
+        List challenges from values() rows (same JSON as ChallengeSerializer)
+        """
+        return self._list_values(self.filter_queryset(self.get_queryset()))
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Single challenge from one values() row (same JSON as ChallengeDetailSerializer).
+        Answers 304 when the client's ETag / Last-Modified is still current.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.filter_queryset(self.get_queryset()).values(
+                *CHALLENGE_DETAIL_VALUES, 'updated_at', 'line__song__updated_at'
+            ),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        # Title and artist live on the song, so its changes count too
+        modified = max(row['updated_at'], row['line__song__updated_at'])
+        etag = make_etag(
+            request.accepted_renderer.format, row['id'], modified, row['creator__username']
+        )
+        
+        response = not_modified(request, etag, modified)
+        if response is None:
+            response = Response(challenge_rows([row], detail=True)[0])
+        return cache_headers(response, etag, modified, max_age=settings.CHALLENGE_HTTP_MAX_AGE)
+    
+    def _list_values(self, queryset, public=True):
+        """
+        One cursor page of challenges. The ETag covers every row's updated_at
+        (and its song's), creator name plus whether there are pages around
+        it, so an unchanged page is answered with a 304 without serializing it.
+        """
+        page = self.paginate_queryset(
+            queryset.values(*CHALLENGE_VALUES, 'updated_at', 'line__song__updated_at')
+        )
+        etag = make_etag(
+            self.request.accepted_renderer.format,
+            self.paginator.has_next, self.paginator.has_previous,
+            [
+                (row['id'], row['updated_at'], row['line__song__updated_at'], row['creator__username'])
+                for row in page
+            ],
+        )
+        
+        response = not_modified(self.request, etag)
+        if response is None:
+            response = self.get_paginated_response(challenge_rows(page))
+        return cache_headers(response, etag, max_age=settings.CHALLENGE_HTTP_MAX_AGE, public=public)
+    
     def perform_create(self, serializer):
         """
         Automatically set the creator to the logged-in user
@@ -117,9 +382,88 @@ class ChallengeViewSet(viewsets.ModelViewSet):
         Get all challenges created by the logged-in user
         GET /api/challenges/my_challenges/
         """
-        challenges = Challenge.objects.filter(creator=request.user)
-        serializer = self.get_serializer(challenges, many=True)
-        return Response(serializer.data)
+        return self._list_values(self.get_queryset().filter(creator=request.user), public=False)
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def search(self, request):
+        """
+        Full-text search over song title, artist, lyric and genre
+        GET /api/challenges/search/?q=shape+sheeran&limit=20&offset=0
+        """
+        query = request.GET.get('q', '').strip()
+        
+        if not query:
+            return Response(
+                {'error': 'Query parameter "q" is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return Response(
+                {'error': 'limit and offset must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ids = search_challenge_ids(query, limit, offset)
+        rows = self.get_queryset().filter(id__in=ids).values(*CHALLENGE_VALUES)
+        by_id = {row['id']: row for row in rows}
+        
+        # Keep the search ranking; skip ids deleted since they were indexed
+        results = challenge_rows(by_id[challenge_id] for challenge_id in ids if challenge_id in by_id)
+        
+        return Response({'query': query, 'results': results})
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def random(self, request):
+        """
+        A random challenge the player has not attempted yet
+        GET /api/challenges/random/?genre=Pop&exclude=4,8,15
+        
+        Signed-in players never get a challenge they have an attempt for;
+        anyone can also pass ids to skip (e.g. the current round's).
+        """
+        try:
+            exclude = {
+                int(challenge_id)
+                for challenge_id in request.GET.get('exclude', '').split(',')
+                if challenge_id.strip()
+            }
+        except ValueError:
+            return Response(
+                {'error': 'exclude must be a comma-separated list of ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(exclude) > MAX_RANDOM_EXCLUDE:
+            return Response(
+                {'error': f'At most {MAX_RANDOM_EXCLUDE} ids can be excluded'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = Challenge.objects.all()
+        genre = request.GET.get('genre')
+        if genre:
+            queryset = queryset.filter(genre__iexact=genre)
+        if request.user.is_authenticated:
+            # NOT EXISTS probe on the (user, challenge) attempt index
+            queryset = queryset.exclude(
+                Exists(ChallengeAttempt.objects.filter(user=request.user, challenge=OuterRef('pk')))
+            )
+            exclude |= get_attempt_writer().pending_challenge_ids(request.user.id)
+        if exclude:
+            queryset = queryset.exclude(id__in=exclude)
+        
+        row = random_row(queryset.values(*CHALLENGE_VALUES))
+        if row is None:
+            return Response(
+                {'error': 'No unplayed challenges left'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response(challenge_rows([row])[0])
     
     @action(detail=True, methods=['post'], permission_classes=[AllowAny])
     def submit_answer(self, request, pk=None):
@@ -128,14 +472,8 @@ class ChallengeViewSet(viewsets.ModelViewSet):
         POST /api/challenges/:id/submit_answer/
         """
         challenge = self.get_object()
-        submitted_answer = request.data.get('answer', '').strip()
-        hints_used = request.data.get('hints_used', 0)
-        
-        logger.info(f"\n=== SUBMIT ANSWER DEBUG ===")
-        logger.info(f"Challenge: {challenge.song_title}")
-        logger.info(f"Correct answer: '{challenge.correct_answer}'")
-        logger.info(f"User submitted: '{submitted_answer}'")
-        logger.info(f"Hints used: {hints_used}")
+        submitted_answer = str(request.data.get('answer') or '').strip()
+        hints_used = parse_hints_used(request.data.get('hints_used', 0))
         
         if not submitted_answer:
             return Response(
@@ -143,22 +481,126 @@ class ChallengeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if hints_used is None:
+            return Response(
+                {'error': 'hints_used must be a non-negative integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Check if answer is correct (with fuzzy matching)
-        is_correct = check_answer(challenge.correct_answer, submitted_answer)
-        logger.info(f"Is correct: {is_correct}")
+        is_correct = check_challenge_answer(challenge, submitted_answer)
         
         # Calculate score (100 points - 10 per hint used)
-        score = max(0, 100 - (hints_used * 10)) if is_correct else 0
-        logger.info(f"Score: {score}")
-        logger.info(f"=== END DEBUG ===\n")
+        score = calculate_score(is_correct, hints_used)
+        
+        if answer_log.sampled():
+            answer_log.emit(
+                'answer_submitted',
+                challenge=challenge.id,
+                correct_answer=challenge.correct_answer,
+                submitted=submitted_answer,
+                is_correct=is_correct,
+                hints_used=hints_used,
+                score=score,
+            )
+        
+        record_attempt(request.user, challenge.id, submitted_answer, is_correct, hints_used, score)
+        
+        return Response(answer_result(challenge, is_correct, score))
+    
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def submit_round(self, request):
+        """
+        Submit every answer of a timed round at once
+        POST /api/challenges/submit_round/
+        Body: {
+            "answers": [
+                {"challenge_id": 1, "answer": "the shape", "hints_used": 0},
+                {"challenge_id": 7, "answer": "tonight", "hints_used": 1}
+            ]
+        }
+        """
+        answers = request.data.get('answers')
+        
+        if not isinstance(answers, list) or not answers:
+            return Response(
+                {'error': '"answers" must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(answers) > MAX_ROUND_ANSWERS:
+            return Response(
+                {'error': f'At most {MAX_ROUND_ANSWERS} answers per round'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Reject the whole round before recording any of it
+        for position, item in enumerate(answers):
+            if isinstance(item, dict) and parse_hints_used(item.get('hints_used', 0)) is None:
+                return Response(
+                    {'error': f'answers[{position}]: hints_used must be a non-negative integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # One query for every challenge in the round
+        ids = set()
+        for item in answers:
+            try:
+                ids.add(int(item['challenge_id']))
+            except (TypeError, ValueError, KeyError):
+                pass
+        challenges = Challenge.objects.only(
+            'id', 'correct_answer', 'answer_normalized', 'answer_compact'
+        ).in_bulk(ids)
+        
+        results = []
+        total_score = 0
+        correct_count = 0
+        for item in answers:
+            result = self._round_item(item, challenges)
+            if result.get('is_correct'):
+                correct_count += 1
+            total_score += result.get('score', 0)
+            results.append(result)
         
         return Response({
-            'is_correct': is_correct,
-            'correct_answer': challenge.correct_answer if not is_correct else None,
-            'score': score,
-            'message': 'Correct!' if is_correct else 'Incorrect. Try again!'
+            'results': results,
+            'total_score': total_score,
+            'correct_count': correct_count,
+            'answered': len(answers),
         })
     
+    def _round_item(self, item, challenges):
+        """
+        Check one answer of a round
+        Returns: answer_result() plus challenge_id, or an 'error' entry
+        """
+        if not isinstance(item, dict):
+            return {'challenge_id': None, 'error': 'Each answer must be an object'}
+        
+        try:
+            challenge_id = int(item.get('challenge_id'))
+        except (TypeError, ValueError):
+            return {
+                'challenge_id': item.get('challenge_id'),
+                'error': 'challenge_id must be an integer'
+            }
+        # Checked by submit_round before any answer is recorded
+        hints_used = parse_hints_used(item.get('hints_used', 0))
+        
+        challenge = challenges.get(challenge_id)
+        if challenge is None:
+            return {'challenge_id': challenge_id, 'error': 'Challenge not found'}
+        
+        submitted_answer = str(item.get('answer') or '').strip()
+        if not submitted_answer:
+            return {'challenge_id': challenge_id, 'error': 'Answer is required'}
+        
+        is_correct = check_challenge_answer(challenge, submitted_answer)
+        score = calculate_score(is_correct, hints_used)
+        record_attempt(self.request.user, challenge_id, submitted_answer, is_correct, hints_used, score)
+        return {'challenge_id': challenge_id, **answer_result(challenge, is_correct, score)}
+    
     @action(detail=True, methods=['post'], permission_classes=[AllowAny])
     def reveal_answer(self, request, pk=None):
         """
@@ -173,8 +615,114 @@ class ChallengeViewSet(viewsets.ModelViewSet):
         })
 
 
-@api_view(['POST'])
-def create_challenge_from_lyrics(request):
+async def _resolve_song(lyrics_service, api_request, title, artist):
+    """
+    Find a stored Song by name, or fetch the lyrics and store them
+    Returns: (song, song_data, error_response). song is None when the lyrics
+    came back without a Genius id; song_data is None for stored songs.
+    """
+    # Songs we have stored before are served from the Song/LyricLine tables
+    song = await sync_to_async(find_song)(title, artist)
+    if song is not None:
+        return song, None, None
+    
+    # Fetch lyrics
+    song_data, error = await _fetch_song_data(lyrics_service, api_request, title, artist)
+    if error:
+        return None, None, error
+    
+    if not song_data:
+        return None, None, JsonResponse(
+            {'error': 'Could not fetch lyrics for this song'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    song = await sync_to_async(store_song)(song_data)
+    return song, song_data, None
+
+
+MAX_CANDIDATES = 50
+
+
+@csrf_exempt
+@require_GET
+async def challenge_candidates(request):
+    """
+    Suggest the best lines and words to blank for a song
+    GET /api/lyrics/candidates/?title=Song+Name&artist=Artist&top_n=10
+    """
+    title = request.GET.get('title', '')
+    artist = request.GET.get('artist')
+    
+    if not title:
+        return JsonResponse(
+            {'error': 'Query parameter "title" is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        top_n = min(max(int(request.GET.get('top_n', 10)), 1), MAX_CANDIDATES)
+    except ValueError:
+        return JsonResponse(
+            {'error': 'top_n must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    api_request, error = await _load_request(request)
+    if error:
+        return error
+    
+    lyrics_service = get_async_lyrics_service()
+    song, song_data, error = await _resolve_song(lyrics_service, api_request, title, artist)
+    if error:
+        return error
+    
+    def build():
+        if song is not None:
+            lines = list(song.lines.order_by('index').values_list('text', flat=True))
+        else:
+            lines = lyrics_document(song_data['lyrics'])
+        return generate_candidates(lines, corpus=get_corpus_stats(), top_n=top_n)
+    
+    candidates = await sync_to_async(build)()
+    return JsonResponse({'candidates': candidates})
+
+
+def _wants_job(request):
+    """
+    Clients opt into job mode with "Prefer: respond-async" (RFC 7240) or ?async=true
+    """
+    prefer = request.headers.get('Prefer', '')
+    return (
+        'respond-async' in prefer.lower()
+        or request.GET.get('async', '').lower() in ('1', 'true', 'yes')
+    )
+
+
+def _enqueue_challenge_job(user, params):
+    """
+    Returns: The queued ChallengeJob, or None if the user already has
+    CHALLENGE_JOB_MAX_PENDING jobs waiting
+    """
+    pending = ChallengeJob.objects.filter(
+        creator=user, status__in=[ChallengeJob.QUEUED, ChallengeJob.RUNNING]
+    ).count()
+    if pending >= settings.CHALLENGE_JOB_MAX_PENDING:
+        return None
+    
+    job = ChallengeJob.objects.create(creator=user, params=params)
+    # Workers must not look for the row before it is committed
+    transaction.on_commit(get_challenge_job_queue().notify)
+    return job
+
+
+def job_status_url(job):
+    return reverse('challenge-job', args=[job.id])
+
+
+@csrf_exempt
+@require_POST
+async def create_challenge_from_lyrics(request):
     """
     Create a challenge directly from song lyrics
     POST /api/challenges/create_from_lyrics/
@@ -184,122 +732,451 @@ def create_challenge_from_lyrics(request):
         "line_index": 5,
         "words_to_blank": 2
     }
+    
+    With "Prefer: respond-async" (or ?async=true) the challenge is created by
+    a background worker instead: the response is 202 with a job id, and
+    GET /api/challenges/jobs/<job_id>/ returns the challenge once it is done.
     """
-    if not request.user.is_authenticated:
-        return Response(
+    api_request, error = await _load_request(request)
+    if error:
+        return error
+
+    user = api_request.user
+    if not user.is_authenticated:
+        return JsonResponse(
             {'error': 'Authentication required'},
             status=status.HTTP_401_UNAUTHORIZED
         )
     
-    title = request.data.get('title')
-    artist = request.data.get('artist')
-    line_index = request.data.get('line_index', 0)
-    words_to_blank = request.data.get('words_to_blank', 1)
-    genre = request.data.get('genre', '')
+    title = api_request.data.get('title')
+    artist = api_request.data.get('artist')
+    genre = api_request.data.get('genre', '')
     
     if not title:
-        return Response(
+        return JsonResponse(
             {'error': 'Title is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Fetch lyrics
-    song_data = lyrics_service.get_lyrics_by_search(title, artist)
+    line_index, words_to_blank, item_error = _parse_batch_item(api_request.data)
+    if item_error:
+        return JsonResponse({'error': item_error}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not song_data:
-        return Response(
-            {'error': 'Could not fetch lyrics for this song'},
-            status=status.HTTP_404_NOT_FOUND
+    if _wants_job(request):
+        job = await sync_to_async(_enqueue_challenge_job)(user, {
+            'title': title,
+            'artist': artist,
+            'line_index': line_index,
+            'words_to_blank': words_to_blank,
+            'genre': genre,
+        })
+        if job is None:
+            return JsonResponse(
+                {'error': 'Too many challenges waiting to be created, try again shortly'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        url = job_status_url(job)
+        response = JsonResponse(
+            {'job_id': str(job.id), 'status': job.status, 'status_url': url},
+            status=status.HTTP_202_ACCEPTED
         )
+        response['Location'] = url
+        return response
+    
+    lyrics_service = get_async_lyrics_service()
+    song, song_data, error = await _resolve_song(lyrics_service, api_request, title, artist)
+    if error:
+        return error
     
     # Create challenge snippet
-    challenge_data = lyrics_service.create_challenge_snippet(
-        song_data['lyrics'],
-        line_index,
-        words_to_blank
+    fields = await sync_to_async(challenge_fields)(
+        lyrics_service, song, song_data, line_index, words_to_blank
     )
     
-    if not challenge_data:
-        return Response(
+    if not fields:
+        return JsonResponse(
             {'error': 'Could not create challenge from these lyrics'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
     # Save to database
-    challenge = Challenge.objects.create(
-        creator=request.user,
-        song_title=song_data['title'],
-        artist=song_data['artist'],
-        genre=genre,
-        original_lyric=challenge_data['original_line'],
-        blanked_lyric=challenge_data['blanked_line'],
-        correct_answer=challenge_data['answer']
+    challenge = await Challenge.objects.acreate(creator=user, genre=genre, **fields)
+    
+    data = await sync_to_async(lambda: ChallengeDetailSerializer(challenge).data)()
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def challenge_job(request, job_id):
+    """
+    Status of a challenge queued by create_from_lyrics in job mode
+    GET /api/challenges/jobs/<job_id>/
+    "challenge" is set once status is "done"; "error" once it is "failed"
+    """
+    if not request.user.is_authenticated:
+        return Response(
+            {'error': 'Authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    job = (
+        ChallengeJob.objects
+        .select_related('challenge__creator')
+        .filter(id=job_id, creator=request.user)
+        .first()
     )
+    if job is None:
+        return Response({'error': 'No such job'}, status=status.HTTP_404_NOT_FOUND)
     
-    serializer = ChallengeDetailSerializer(challenge)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    response = Response({
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'error': job.error or None,
+        'challenge': ChallengeDetailSerializer(job.challenge).data if job.challenge else None,
+    })
+    if job.status in (ChallengeJob.QUEUED, ChallengeJob.RUNNING):
+        response['Retry-After'] = '1'
+    return response
 
 
-# ===== HELPER FUNCTIONS =====
+MAX_BATCH_ITEMS = 50
 
-def check_answer(correct_answer, user_answer):
+
+def _parse_batch_item(item):
     """
-    Check if user's answer matches the correct answer
-    Uses fuzzy matching to allow minor typos
+    Validate one {line_index, words_to_blank} spec
+    Returns: (line_index, words_to_blank, error message)
+    """
+    if not isinstance(item, dict):
+        return None, None, 'Each item must be an object'
+    
+    try:
+        line_index = int(item.get('line_index', 0))
+        words_to_blank = int(item.get('words_to_blank', 1))
+    except (TypeError, ValueError):
+        return None, None, 'line_index and words_to_blank must be integers'
+    
+    if words_to_blank < 1:
+        return None, None, 'words_to_blank must be at least 1'
+    
+    return line_index, words_to_blank, None
+
+
+@csrf_exempt
+@require_POST
+async def create_challenges_batch(request):
+    """
+    Create several challenges from one song in a single request
+    POST /api/challenges/create_batch_from_lyrics/
+    Body: {
+        "title": "Song Title",
+        "artist": "Artist Name",
+        "genre": "Pop",
+        "items": [
+            {"line_index": 3, "words_to_blank": 1},
+            {"line_index": 7, "words_to_blank": 2}
+        ]
+    }
+    Lyrics are fetched once and all valid items are inserted together; items
+    that can't be turned into a challenge are reported in "errors" by position.
     """
-    # Normalize both answers
-    correct = correct_answer.lower().strip()
-    user = user_answer.lower().strip()
+    api_request, error = await _load_request(request)
+    if error:
+        return error
+    
+    user = api_request.user
+    if not user.is_authenticated:
+        return JsonResponse(
+            {'error': 'Authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    title = api_request.data.get('title')
+    artist = api_request.data.get('artist')
+    genre = api_request.data.get('genre', '')
+    items = api_request.data.get('items')
     
-    # Log for debugging
-    print(f"Comparing: '{correct}' vs '{user}'")
+    if not title:
+        return JsonResponse(
+            {'error': 'Title is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    # Exact match
-    if correct == user:
-        print("Exact match!")
-        return True
+    if not isinstance(items, list) or not items:
+        return JsonResponse(
+            {'error': '"items" must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    # Remove extra spaces
-    correct_no_space = correct.replace(" ", "")
-    user_no_space = user.replace(" ", "")
+    if len(items) > MAX_BATCH_ITEMS:
+        return JsonResponse(
+            {'error': f'At most {MAX_BATCH_ITEMS} items per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    if correct_no_space == user_no_space:
-        print("Match without spaces!")
-        return True
+    errors = []
+    specs = []
+    for position, item in enumerate(items):
+        line_index, words_to_blank, item_error = _parse_batch_item(item)
+        if item_error:
+            errors.append({'index': position, 'error': item_error})
+        else:
+            specs.append((position, line_index, words_to_blank))
     
-    # Fuzzy match (80% similarity threshold - more lenient)
-    similarity = SequenceMatcher(None, correct, user).ratio()
-    print(f"Similarity: {similarity}")
+    lyrics_service = get_async_lyrics_service()
+    song, song_data, error = await _resolve_song(lyrics_service, api_request, title, artist)
+    if error:
+        return error
     
-    if similarity >= 0.80:
-        print("Fuzzy match!")
-        return True
+    if song is not None:
+        lines = await sync_to_async(get_lines)(song, [spec[1] for spec in specs])
+        for line in lines.values():
+            if line is not None:
+                line.song = song
     
-    print("No match")
-    return False
+    challenges = []
+    # Lines of a song without a Genius id, stored under its loose song in save()
+    loose_texts = []
+    for position, line_index, words_to_blank in specs:
+        line = None
+        if song is not None:
+            line = lines.get(line_index)
+            challenge_data = lyrics_service.snippet_from_line(
+                line.text, line.index, words_to_blank, words=line.words()
+            ) if line else None
+        else:
+            challenge_data = lyrics_service.create_challenge_snippet(
+                song_data['lyrics'], line_index, words_to_blank
+            )
+        
+        if not challenge_data:
+            errors.append({
+                'index': position,
+                'error': 'Could not create challenge from these lyrics'
+            })
+            continue
+        
+        challenge = Challenge(
+            creator=user,
+            genre=genre,
+            line=line,
+            blank_start=challenge_data['start'],
+            blank_words=challenge_data['words_to_blank'],
+            correct_answer=challenge_data['answer']
+        )
+        challenge.prepare_answer()
+        challenges.append(challenge)
+        if line is None:
+            loose_texts.append((challenge, challenge_data['original_line']))
+    
+    def save():
+        with transaction.atomic():
+            for challenge, text in loose_texts:
+                challenge.line = loose_line(song_data['title'], song_data['artist'], text)
+            created = Challenge.objects.bulk_create(challenges)
+        return ChallengeDetailSerializer(created, many=True).data
+    
+    created = await sync_to_async(save)() if challenges else []
+    errors.sort(key=lambda e: e['index'])
+    
+    return JsonResponse(
+        {'created': created, 'errors': errors},
+        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+    )
+
+
+# ===== HELPER FUNCTIONS =====
+
+MAX_ROUND_ANSWERS = 50
+MAX_SEARCH_RESULTS = 100
+MAX_RANDOM_EXCLUDE = 200
+
+
+def random_row(queryset):
+    """
+    Pick a random row without ORDER BY RANDOM(): choose a random id between
+    the table's lowest and highest and take the first matching row at or
+    after it (wrapping around to the start). Both steps are primary key index
+    lookups, so the cost does not grow with the table. Rows right after a gap
+    in the ids are somewhat more likely to be picked.
+    Returns: The row, or None if nothing matches
+    """
+    bounds = Challenge.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return None
+    
+    pivot = random.randint(bounds['low'], bounds['high'])
+    row = queryset.filter(id__gte=pivot).order_by('id').first()
+    if row is None:
+        row = queryset.filter(id__lt=pivot).order_by('id').first()
+    return row
+
+
+def parse_hints_used(value):
+    """
+    Accept an int (or a string of digits, from form data) of at least 0
+    Returns: The number of hints, or None when value isn't one
+    """
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        return None
+    return value
+
+
+def calculate_score(is_correct, hints_used):
+    """
+    100 points for a correct answer, minus 10 per hint used
+    """
+    return max(0, 100 - (hints_used * 10)) if is_correct else 0
+
+
+def record_attempt(user, challenge_id, answer, is_correct, hints_used, score):
+    """
+    Queue a signed-in player's attempt (and score) on the write-behind buffer.
+    Anonymous players can still play, they just aren't recorded.
+    """
+    if not user.is_authenticated:
+        return
+    get_attempt_writer().record(
+        user.id, challenge_id, answer, is_correct, hints_used, score
+    )
+
+
+def answer_result(challenge, is_correct, score):
+    """
+    Response body for one checked answer
+    """
+    return {
+        'is_correct': is_correct,
+        'correct_answer': challenge.correct_answer if not is_correct else None,
+        'score': score,
+        'message': 'Correct!' if is_correct else 'Incorrect. Try again!'
+    }
+
+
+def check_answer(correct_answer, user_answer):
+    """
+    Check if user's answer matches the correct answer
+    Uses fuzzy matching to allow minor typos
+    """
+    return answers_match(
+        normalize(correct_answer),
+        user_answer,
+        lenient=getattr(settings, 'ANSWER_MATCH_LENIENT', False)
+    )
+
+
+def check_challenge_answer(challenge, user_answer):
+    """
+    check_answer using the answer forms precomputed on the challenge
+    """
+    if not challenge.answer_normalized and challenge.correct_answer:
+        return check_answer(challenge.correct_answer, user_answer)
+    return answers_match(
+        challenge.answer_normalized,
+        user_answer,
+        correct_compact=challenge.answer_compact,
+        lenient=getattr(settings, 'ANSWER_MATCH_LENIENT', False)
+    )
 
 
 # ===== LEADERBOARD ENDPOINT =====
 
+MAX_LEADERBOARD_SIZE = 100
+
+
+def _leaderboard_window(request):
+    """
+    Returns: (window, None) or (None, error Response)
+    """
+    window = request.GET.get('window', 'all')
+    if window not in WINDOWS:
+        return None, Response(
+            {'error': f'window must be one of: {", ".join(WINDOWS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return window, None
+
+
 @api_view(['GET'])
 def leaderboard(request):
     """
     Get top users by score
-    GET /api/leaderboard/
+    GET /api/leaderboard/?window=all|week|day&limit=10
     """
-    from users.models import UserProfile
+    window, error = _leaderboard_window(request)
+    if error:
+        return error
     
-    top_users = UserProfile.objects.order_by('-total_score')[:10]
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_LEADERBOARD_SIZE)
+    except ValueError:
+        limit = 10
     
-    leaderboard_data = [
-        {
-            'rank': idx + 1,
-            'username': profile.display_name,
-            'score': profile.total_score,
-            'challenges_completed': profile.challenges_completed,
-            'challenges_created': profile.challenges_created
-        }
-        for idx, profile in enumerate(top_users)
-    ]
+    leaderboard_data = get_leaderboards().top(window, limit)
+    
+    return Response({'leaderboard': leaderboard_data, 'window': window})
+
+
+@api_view(['GET'])
+def leaderboard_rank(request):
+    """
+    Get a player's rank (the signed-in user unless ?user_id= is given)
+    GET /api/leaderboard/rank/?window=all|week|day&user_id=1
+    """
+    window, error = _leaderboard_window(request)
+    if error:
+        return error
     
-    return Response({'leaderboard': leaderboard_data})
+    user_id = request.GET.get('user_id')
+    if user_id is None:
+        if not request.user.is_authenticated:
+            return Response(
+                {'error': 'Sign in or pass user_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        user_id = request.user.id
+    
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return Response(
+            {'error': 'user_id must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    entry = get_leaderboards().rank(user_id, window)
+    if entry is None:
+        return Response(
+            {'error': 'No score for this player yet'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return Response({**entry, 'window': window})
+
+
+# ===== METRICS ENDPOINT =====
+
+@require_GET
+def metrics(request):
+    """
+    Request, database, Genius and cache metrics in Prometheus text format
+    GET /api/metrics
+    """
+    token = settings.METRICS_TOKEN
+    has_token = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+    # Open only while developing: in production scrapers send the token,
+    # and staff logged into the admin can read it in the browser
+    if not (has_token or request.user.is_staff or (settings.DEBUG and not token)):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+    return HttpResponse(
+        get_metrics().render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
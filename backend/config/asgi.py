@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Background threads for servers only, never management commands or tests:
+# the opt-in lyrics warm-up (WARMUP_SCHEDULER) and the leaderboard reloads
+from challenges.services.leaderboard import start_leaderboard_refresher  # noqa: E402
+from challenges.services.warmup import start_warmup_scheduler  # noqa: E402
+
+start_warmup_scheduler()
+start_leaderboard_refresher()
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'challenges.middleware.metrics_middleware',  # first, so latency covers the whole stack
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -169,8 +170,127 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Allow public access
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'challenges.renderers.FastJSONRenderer',  # orjson when installed
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }# Disable CSRF for API endpoints
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:5173',
     'http://127.0.0.1:5173',
-]
\ No newline at end of file
+]
+
+# Lyrics cache (in-process LRU in front of the LyricsCacheEntry table)
+LYRICS_CACHE_TTL = config('LYRICS_CACHE_TTL', default=60 * 60 * 24, cast=int)
+LYRICS_CACHE_MAX_ENTRIES = config('LYRICS_CACHE_MAX_ENTRIES', default=512, cast=int)
+LYRICS_CACHE_PERSISTENT = config('LYRICS_CACHE_PERSISTENT', default=True, cast=bool)
+LYRICS_CACHE_PERSISTENT_MAX_ENTRIES = config('LYRICS_CACHE_PERSISTENT_MAX_ENTRIES', default=10000, cast=int)
+# Seconds expired rows are kept as a stale fallback for when Genius is down
+LYRICS_CACHE_STALE_GRACE = config('LYRICS_CACHE_STALE_GRACE', default=60 * 60 * 24 * 7, cast=int)
+
+# Genius HTTP client: timeouts, connection pool, retries and circuit breaker
+GENIUS_TIMEOUT = config('GENIUS_TIMEOUT', default=5.0, cast=float)
+GENIUS_MAX_CONNECTIONS = config('GENIUS_MAX_CONNECTIONS', default=100, cast=int)
+GENIUS_MAX_KEEPALIVE = config('GENIUS_MAX_KEEPALIVE', default=20, cast=int)
+GENIUS_DEADLINE = config('GENIUS_DEADLINE', default=10.0, cast=float)
+GENIUS_RETRIES = config('GENIUS_RETRIES', default=2, cast=int)
+GENIUS_BACKOFF_BASE = config('GENIUS_BACKOFF_BASE', default=0.2, cast=float)
+GENIUS_BACKOFF_MAX = config('GENIUS_BACKOFF_MAX', default=2.0, cast=float)
+GENIUS_BREAKER_FAILURES = config('GENIUS_BREAKER_FAILURES', default=5, cast=int)
+GENIUS_BREAKER_RESET = config('GENIUS_BREAKER_RESET', default=30.0, cast=float)
+
+# Also accept answers that only differ by punctuation, curly quotes or
+# contractions ("dont" / "do not"). Off keeps the original matching rules.
+ANSWER_MATCH_LENIENT = config('ANSWER_MATCH_LENIENT', default=False, cast=bool)
+
+# Answer submissions are buffered and written in batches (ChallengeAttempt
+# bulk inserts plus one merged score update per user). Disable to write each
+# attempt as it is submitted.
+ATTEMPT_WRITE_BEHIND = config('ATTEMPT_WRITE_BEHIND', default=True, cast=bool)
+ATTEMPT_FLUSH_SIZE = config('ATTEMPT_FLUSH_SIZE', default=100, cast=int)
+ATTEMPT_FLUSH_INTERVAL = config('ATTEMPT_FLUSH_INTERVAL', default=2.0, cast=float)
+# Attempts kept while the database stays locked; the oldest beyond this are dropped
+ATTEMPT_MAX_PENDING = config('ATTEMPT_MAX_PENDING', default=10000, cast=int)
+
+# Seconds between rebuilding the in-memory leaderboards from the database in
+# a background thread (picks up scores written by other worker processes);
+# 0 turns the rebuilds off
+LEADERBOARD_REBUILD_INTERVAL = config('LEADERBOARD_REBUILD_INTERVAL', default=60.0, cast=float)
+
+# Autocomplete catalog of every song seen in Genius search results, kept in
+# memory and snapshotted to disk so it survives restarts
+SONG_CATALOG_PATH = config('SONG_CATALOG_PATH', default=str(BASE_DIR / 'song_catalog.json.gz'))
+SONG_CATALOG_SAVE_INTERVAL = config('SONG_CATALOG_SAVE_INTERVAL', default=300.0, cast=float)
+# Ask Genius when the catalog has fewer matches than this
+AUTOCOMPLETE_MIN_LOCAL_RESULTS = config('AUTOCOMPLETE_MIN_LOCAL_RESULTS', default=3, cast=int)
+
+# Cache-Control max-age (seconds) for GET challenge lists/details and lyrics.
+# Responses also carry an ETag, so even at 0 clients revalidate with a cheap
+# 304 instead of downloading the payload again.
+CHALLENGE_HTTP_MAX_AGE = config('CHALLENGE_HTTP_MAX_AGE', default=0, cast=int)
+LYRICS_HTTP_MAX_AGE = config('LYRICS_HTTP_MAX_AGE', default=60 * 60, cast=int)
+
+# Per-view latency, database and Genius call metrics, served in Prometheus
+# text format at /api/metrics. Scrapers send "Authorization: Bearer
+# <METRICS_TOKEN>"; staff users can read it too. Without a token the page is
+# only open when DEBUG is on.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Fraction (0-1) of requests and answer submissions logged as one JSON line
+# each. 0 turns the logging off without any formatting cost.
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=0.0, cast=float)
+
+# Where lyrics come from: 'genius' (live API) or 'local' (the store built by
+# `manage.py import_lyrics`, no network or API key needed)
+LYRICS_PROVIDER = config('LYRICS_PROVIDER', default='genius')
+LYRICS_STORE_PATH = config('LYRICS_STORE_PATH', default=str(BASE_DIR / 'lyrics_store.bin'))
+# Send every Genius request to this host instead, e.g. the stand-in server
+# from `manage.py genius_standin` (http://127.0.0.1:8765)
+GENIUS_BASE_URL = config('GENIUS_BASE_URL', default='')
+
+# Lyrics warm-up (`manage.py warm_lyrics`, or in-process with
+# WARMUP_SCHEDULER): fetch the songs topping recent searches and the songs
+# with the most challenges into the lyrics cache before players ask for
+# them. Entries with less than WARMUP_REFRESH_MARGIN seconds left are fetched
+# again; WARMUP_RATE caps Genius fetches per minute across the worker pool.
+WARMUP_SCHEDULER = config('WARMUP_SCHEDULER', default=False, cast=bool)
+WARMUP_INTERVAL = config('WARMUP_INTERVAL', default=15 * 60.0, cast=float)
+WARMUP_LIMIT = config('WARMUP_LIMIT', default=100, cast=int)
+# Only searches from the last WARMUP_WINDOW seconds count as trending
+WARMUP_WINDOW = config('WARMUP_WINDOW', default=60 * 60 * 24.0, cast=float)
+WARMUP_WORKERS = config('WARMUP_WORKERS', default=4, cast=int)
+WARMUP_RATE = config('WARMUP_RATE', default=60.0, cast=float)
+WARMUP_REFRESH_MARGIN = config('WARMUP_REFRESH_MARGIN', default=60 * 60 * 2.0, cast=float)
+
+# Challenge creation jobs (create_from_lyrics with "Prefer: respond-async"):
+# queued in the ChallengeJob table and run by CHALLENGE_JOB_WORKERS threads per
+# server process, started on the first job. With 0, only processes running
+# `manage.py run_challenge_jobs` create them.
+CHALLENGE_JOB_WORKERS = config('CHALLENGE_JOB_WORKERS', default=2, cast=int)
+# Seconds between idle workers checking for jobs queued by other processes
+CHALLENGE_JOB_POLL_INTERVAL = config('CHALLENGE_JOB_POLL_INTERVAL', default=2.0, cast=float)
+CHALLENGE_JOB_MAX_ATTEMPTS = config('CHALLENGE_JOB_MAX_ATTEMPTS', default=3, cast=int)
+# Queued or running jobs a player may have before getting a 429
+CHALLENGE_JOB_MAX_PENDING = config('CHALLENGE_JOB_MAX_PENDING', default=20, cast=int)
+# Seconds finished jobs are kept for status polling
+CHALLENGE_JOB_RETENTION = config('CHALLENGE_JOB_RETENTION', default=60 * 60 * 24.0, cast=float)
+
+# Genius call budget, shared by player requests, challenge jobs and the
+# warm-up: UPSTREAM_RATE HTTP requests per second (a lyrics lookup by title
+# is three) with bursts of UPSTREAM_BURST (0 turns it off). It is per
+# process, so set it to the API quota divided by the number of server and
+# worker processes. As it runs low the warm-up is
+# skipped first, then challenge jobs wait (up to UPSTREAM_BACKGROUND_MAX_WAIT
+# seconds), and player requests wait up to UPSTREAM_INTERACTIVE_MAX_WAIT
+# seconds before getting a 503.
+UPSTREAM_RATE = config('UPSTREAM_RATE', default=5.0, cast=float)
+UPSTREAM_BURST = config('UPSTREAM_BURST', default=20.0, cast=float)
+UPSTREAM_INTERACTIVE_MAX_WAIT = config('UPSTREAM_INTERACTIVE_MAX_WAIT', default=1.0, cast=float)
+UPSTREAM_BACKGROUND_MAX_WAIT = config('UPSTREAM_BACKGROUND_MAX_WAIT', default=30.0, cast=float)
+
+# Per-client limit ('30/min', '1000/day'; empty turns it off) on lyrics
+# requests that miss the cache and go to Genius, keyed by user or IP address.
+# Cached songs are never throttled.
+LYRICS_THROTTLE_RATE = config('LYRICS_THROTTLE_RATE', default='30/min')
+LYRICS_THROTTLE_BURST = config('LYRICS_THROTTLE_BURST', default=10.0, cast=float)
@@ -10,5 +10,11 @@ class UserProfile(models.Model):
     challenges_completed = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Leaderboard
+            models.Index(fields=['-total_score'], name='profile_total_score_idx'),
+        ]
+    
     def __str__(self):
         return self.display_name
\ No newline at end of file
@@ -36,7 +36,7 @@ import type { User } from "firebase/auth";
 // ========= BACKEND API =========
 import { 
   getLeaderboard, 
-  getAllChallenges,
+  getChallengesPage,
   type LeaderboardPlayer,
   type Challenge 
 } from "./api/backend";
@@ -53,6 +53,7 @@ const LandingPageLyrIQ: FunctionComponent = () => {
   // Backend data state
   const [leaderboardData, setLeaderboardData] = useState<LeaderboardPlayer[]>([]);
   const [challenges, setChallenges] = useState<Challenge[]>([]);
+  const [moreChallenges, setMoreChallenges] = useState(false);
 
   // Level selection state - THIS IS KEY!
   const [selectedLevel, setSelectedLevel] = useState<number | null>(null);
@@ -74,9 +75,11 @@ const LandingPageLyrIQ: FunctionComponent = () => {
 
   const loadChallenges = async () => {
     try {
-      const data = await getAllChallenges();
-      setChallenges(data);
-      console.log('Loaded challenges:', data);
+      // Only the first page: the count below just says "50+" beyond it
+      const page = await getChallengesPage();
+      setChallenges(page.results);
+      setMoreChallenges(page.next !== null);
+      console.log('Loaded challenges:', page.results);
     } catch (error) {
       console.error('Error loading challenges:', error);
     }
@@ -402,7 +405,7 @@ const LandingPageLyrIQ: FunctionComponent = () => {
           <h2>TRY THE GAME LIVE</h2>
           <p>Generate a real lyric challenge powered by your backend.</p>
           <p style={{ fontSize: '12px', marginTop: '10px' }}>
-            Available challenges: {challenges.length}
+            Available challenges: {challenges.length}{moreChallenges ? '+' : ''}
           </p>
         </div>
 
@@ -43,8 +43,16 @@ export const getLeaderboard = async (): Promise<LeaderboardPlayer[]> => {
   return response.data.leaderboard;
 };
 
-export const getAllChallenges = async (): Promise<Challenge[]> => {
-  const response = await api.get('/challenges/');
+export interface ChallengePage {
+  next: string | null;
+  previous: string | null;
+  results: Challenge[];
+}
+
+// The challenge list is cursor-paginated; `next` is the full URL of the next
+// page. Fetch pages as they are needed rather than walking the whole list.
+export const getChallengesPage = async (url: string = '/challenges/'): Promise<ChallengePage> => {
+  const response = await api.get(url);
   return response.data;
 };
 
@@ -1,7 +1,11 @@
-import React, { useState, useEffect } from 'react';
-import { getAllChallenges, submitAnswer, type Challenge } from '../api/backend';
+import React, { useState, useEffect, useRef } from 'react';
+import { getChallengesPage, submitAnswer, type Challenge } from '../api/backend';
 import styles from './ChallengeGame.module.css';
 
+// Fetch the next page of challenges once the player is this close to the
+// end of the ones already loaded
+const PREFETCH_REMAINING = 5;
+
 interface ChallengeGameProps {
   level: number;
   genre?: string;
@@ -10,6 +14,12 @@ interface ChallengeGameProps {
 
 const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) => {
   const [challenges, setChallenges] = useState<Challenge[]>([]);
+  // Cursor URL of the next page, null once every page has been loaded
+  const [nextUrl, setNextUrl] = useState<string | null>(null);
+  const pendingPage = useRef<Promise<boolean> | null>(null);
+  // Read by callbacks that outlive a render (the post-answer timeout)
+  const latest = useRef({ challenges, nextUrl });
+  latest.current = { challenges, nextUrl };
   const [currentIndex, setCurrentIndex] = useState(0);
   const [userAnswer, setUserAnswer] = useState('');
   const [feedback, setFeedback] = useState<{
@@ -26,19 +36,34 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
     loadChallenges();
   }, [genre]);
 
+  // Keep a page ahead of the player instead of loading every challenge up front
+  useEffect(() => {
+    if (nextUrl && currentIndex >= challenges.length - PREFETCH_REMAINING) {
+      loadMore();
+    }
+  }, [currentIndex, challenges.length, nextUrl]);
+
+  // Challenges of one page that match the genre, in random order
+  const fetchPage = async (url: string) => {
+    const page = await getChallengesPage(url);
+    const filtered = genre
+      ? page.results.filter(c => c.genre.toLowerCase() === genre.toLowerCase())
+      : page.results;
+    return { challenges: filtered.sort(() => Math.random() - 0.5), next: page.next };
+  };
+
   const loadChallenges = async () => {
     try {
       setLoading(true);
-      const data = await getAllChallenges();
-      
-      let filtered = genre 
-        ? data.filter(c => c.genre.toLowerCase() === genre.toLowerCase())
-        : data;
-      
-      // RANDOMIZE the challenges
-      filtered = filtered.sort(() => Math.random() - 0.5);
-      
-      setChallenges(filtered);
+      pendingPage.current = null;
+      let page = await fetchPage('/challenges/');
+      // A genre can be missing from a whole page; go on until one has some
+      while (page.challenges.length === 0 && page.next) {
+        page = await fetchPage(page.next);
+      }
+      setChallenges(page.challenges);
+      setNextUrl(page.next);
+      setCurrentIndex(0);
     } catch (error) {
       console.error('Error loading challenges:', error);
     } finally {
@@ -46,6 +71,51 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
     }
   };
 
+  // Append the next page; resolves to false if there was none or it failed
+  const loadMore = (): Promise<boolean> => {
+    const url = latest.current.nextUrl;
+    if (!url) {
+      return Promise.resolve(false);
+    }
+    if (!pendingPage.current) {
+      pendingPage.current = fetchPage(url)
+        .then(page => {
+          // Visible to goToNext before the next render
+          latest.current = {
+            challenges: [...latest.current.challenges, ...page.challenges],
+            nextUrl: page.next,
+          };
+          setChallenges(latest.current.challenges);
+          setNextUrl(page.next);
+          return true;
+        })
+        .catch(error => {
+          console.error('Error loading more challenges:', error);
+          return false;
+        })
+        .finally(() => {
+          pendingPage.current = null;
+        });
+    }
+    return pendingPage.current;
+  };
+
+  const goToNext = async () => {
+    // At the end of what is loaded, wait for more pages while there are any
+    while (currentIndex >= latest.current.challenges.length - 1 && latest.current.nextUrl) {
+      if (!(await loadMore())) {
+        break;
+      }
+    }
+    if (currentIndex < latest.current.challenges.length - 1) {
+      setCurrentIndex(currentIndex + 1);
+      setUserAnswer('');
+      setFeedback(null);
+    } else {
+      setShowComplete(true);
+    }
+  };
+
   const currentChallenge = challenges[currentIndex];
 
   const handleSubmit = async () => {
@@ -82,15 +152,7 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
         setTotalScore(newScore);
       }
   
-      setTimeout(() => {
-        if (currentIndex < challenges.length - 1) {
-          setCurrentIndex(currentIndex + 1);
-          setUserAnswer('');
-          setFeedback(null);
-        } else {
-          setShowComplete(true);
-        }
-      }, 2000);
+      setTimeout(goToNext, 2000);
     } catch (error) {
       console.error('Error submitting answer:', error);
       alert('Error: ' + error);
@@ -98,13 +160,7 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
   };
 
   const handleSkip = () => {
-    if (currentIndex < challenges.length - 1) {
-      setCurrentIndex(currentIndex + 1);
-      setUserAnswer('');
-      setFeedback(null);
-    } else {
-      setShowComplete(true);
-    }
+    goToNext();
   };
 
   if (loading) {
@@ -153,7 +209,7 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
         <button onClick={onBack} className={styles.backBtn}>← Back</button>
         <div className={styles.progress}>
           <span>Level {level}</span>
-          <span>Challenge {currentIndex + 1} of {challenges.length}</span>
+          <span>Challenge {currentIndex + 1} of {challenges.length}{nextUrl ? '+' : ''}</span>
           <span>Score: {totalScore}</span>
         </div>
       </div>
@@ -227,7 +283,7 @@ const ChallengeGame: React.FC<ChallengeGameProps> = ({ level, genre, onBack }) =
               </p>
             )}
             <p className={styles.nextMessage}>
-              {currentIndex < challenges.length - 1 
+              {currentIndex < challenges.length - 1 || nextUrl
                 ? 'Moving to next challenge...' 
                 : 'Finishing up...'}
             </p>